@@ -0,0 +1,50 @@
+# api/dependencies.py
+"""
+Dépendances FastAPI donnant accès aux services partagés du processus
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+from fastapi import Depends, Request
+from services.container import ServiceContainer
+from services.ingestion_jobs import IngestionJobQueue
+from services.intent_classifier import IntentClassifier
+from services.llm_serv import LLMService
+from services.mongo_services import MongoDBService
+from services.teacher_registry import TeacherRegistry
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """Return the service container created in the application lifespan"""
+    return request.app.state.services
+
+
+def get_llm_service(services: ServiceContainer = Depends(get_services)) -> LLMService:
+    """Return the shared LLM service"""
+    return services.llm_service
+
+
+def get_mongo_service(services: ServiceContainer = Depends(get_services)) -> MongoDBService:
+    """Return the shared MongoDB service"""
+    return services.mongo_service
+
+
+def get_intent_classifier(services: ServiceContainer = Depends(get_services)) -> IntentClassifier:
+    """Return the shared local intent classifier"""
+    return services.intent_classifier
+
+
+def get_teacher_registry(services: ServiceContainer = Depends(get_services)) -> TeacherRegistry:
+    """Return the in-memory teacher registry"""
+    return services.teacher_registry
+
+
+def get_ingestion_jobs(services: ServiceContainer = Depends(get_services)) -> IngestionJobQueue:
+    """Return the shared background ingestion job queue"""
+    return services.ingestion_jobs
+
+
+def get_session_filters(teacher_id: Optional[str] = None,
+                        updated_after: Optional[datetime] = None,
+                        updated_before: Optional[datetime] = None) -> Dict[str, Any]:
+    """Query parameters filtering the session listing and export"""
+    return {"teacher_id": teacher_id, "updated_after": updated_after, "updated_before": updated_before}
@@ -3,57 +3,39 @@
 Routes FastAPI pour le chatbot
 """
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Body, UploadFile, File
-from models.conversation import MessageHistoryResponse
+from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Depends, Query
+from core.config import settings
+from models.conversation import MessageHistoryResponse, SessionPage
 from models.chat import ChatRequest, ChatResponse
 from services.llm_serv import LLMService
-from typing import Dict, List, Optional
+from services.mongo_services import MongoDBService
+from services.ingestion_jobs import IngestionJobQueue
+from services.teacher_registry import TeacherRegistry
+from api.dependencies import get_llm_service, get_mongo_service, get_ingestion_jobs, get_session_filters, get_teacher_registry
+from api.streaming import sse_response, token_events, json_export_response
+from typing import Any, Dict, List, Optional
 from pathlib import Path
 router = APIRouter()
 import hashlib
 from asyncio.log import logger
 from bson.json_util import dumps, loads
 
-llm_service = LLMService()
-mongo_service = llm_service.mongo_services
-
 #################### endpoint pour le chatbot de base ####################
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse:
+async def chat(
+    request: ChatRequest,
+    llm_service: LLMService = Depends(get_llm_service)
+) -> ChatResponse:
     """Unified chat endpoint supporting regular, teacher-specific, and RAG responses"""
     try:
-        # First save the user message to conversation history
-        if request.session_id:
-            await mongo_service.save_message(
-                request.session_id, 
-                "user", 
-                request.message,
-                metadata={"teacher_id": request.teacher_id if request.teacher_id else None}
-            )
-        
-        # Generate response
+        # Generate response: the user and assistant messages are saved together by the LLM service
         response = await llm_service.generate_response(
             message=request.message,
             session_id=request.session_id,
             teacher_id=request.teacher_id,
             use_rag=request.use_rag if hasattr(request, 'use_rag') else False
         )
-        
-        # Also log the assistant's response
-        if request.session_id:
-            metadata = {}
-            if request.teacher_id:
-                metadata["teacher_id"] = request.teacher_id
-            if hasattr(request, 'use_rag') and request.use_rag:
-                metadata["use_rag"] = True
-                
-            await mongo_service.save_message(
-                request.session_id,
-                "assistant",
-                response,
-                metadata=metadata if metadata else None
-            )
     # try:
     #     response = await llm_service.generate_response(
     #         message=request.message,
@@ -64,8 +46,25 @@ async def chat(request: ChatRequest) -> ChatResponse:
         logger.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Version streaming (SSE) de /chat : les tokens sont envoyés dès leur génération"""
+    session_id, tokens = await llm_service.stream_response(
+        message=request.message,
+        session_id=request.session_id,
+        teacher_id=request.teacher_id,
+        use_rag=request.use_rag
+    )
+    return sse_response(token_events(session_id, tokens))
+
 @router.post("/summarize", response_model=ChatResponse)
-async def summarize(request: ChatRequest) -> ChatResponse:
+async def summarize(
+    request: ChatRequest,
+    llm_service: LLMService = Depends(get_llm_service)
+) -> ChatResponse:
     """Nouvel endpoint permettant de tester le Sequencing Chain"""
     try:
         response = await llm_service.generate_response_sequencing(
@@ -79,24 +78,48 @@ async def summarize(request: ChatRequest) -> ChatResponse:
 #################### endpoints pour gestion de l'historique des conversations ####################
 
 @router.get("/history/{session_id}", response_model=List[MessageHistoryResponse])
-async def get_history(session_id: str):
+async def get_history(session_id: str, llm_service: LLMService = Depends(get_llm_service)):
     """Récupération de l'historique d'une conversation"""
     try:
         return await llm_service.get_conversation_history(session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@router.get("/sessions", response_model=List[str])
-async def get_sessions() -> List[str]:
-    """Retrieve all session IDs."""
+@router.get("/sessions", response_model=SessionPage, response_model_exclude_none=True)
+async def get_sessions(
+    limit: Optional[int] = Query(None, ge=1, le=settings.sessions_page_max),
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    filters: Dict[str, Any] = Depends(get_session_filters),
+    llm_service: LLMService = Depends(get_llm_service)
+) -> Dict[str, Any]:
+    """
+    Sessions from newest to oldest, one page at a time.
+    Pass the returned next_cursor as `cursor` to get the next page; `summary` adds
+    the message count, the teacher and a preview of the last message.
+    """
     try:
-        return await llm_service.get_all_sessions()
+        return await llm_service.list_sessions(
+            limit=limit or settings.sessions_page_size, cursor=cursor, summary=summary, **filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/sessions/export")
+async def export_sessions(
+    summary: bool = True,
+    filters: Dict[str, Any] = Depends(get_session_filters),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Export every matching session as a JSON array streamed from a single MongoDB cursor"""
+    return json_export_response(llm_service.iter_sessions(summary=summary, **filters), "sessions.json")
+
+
 @router.delete("/history/{session_id}", response_model=bool)
-async def delete_history(session_id: str) -> bool:
+async def delete_history(session_id: str, llm_service: LLMService = Depends(get_llm_service)) -> bool:
     """Delete a specific conversation."""
     try:
         return await llm_service.delete_conversation(session_id)
@@ -107,49 +130,58 @@ async def delete_history(session_id: str) -> bool:
 #################### endpoints pour gestion du rag, discussiona avec rag ####################
        
 @router.post("/uploadv2")
-async def upload_filesv2(files: List[UploadFile] = File(...)):
+async def upload_filesv2(
+    files: List[UploadFile] = File(...),
+    replace_existing: bool = True,
+    subject: Optional[str] = None,
+    ingestion_jobs: IngestionJobQueue = Depends(get_ingestion_jobs)
+):
     """
-    Upload and process files endpoint
+    Upload files endpoint.
+    Files are saved and queued for background ingestion; progress is read from /ingest/{job_id}.
+    With replace_existing, a file re-uploaded under the same name replaces its previous version:
+    only changed chunks are embedded and chunks no longer present are deleted.
+    The optional subject is stored with the chunks and can be used as a /query filter.
     """
-    processed_files = []
-    
-    for file in files:
-        try:
-            # Process file content
-            chunks = await llm_service.mongo_services.process_file(file)
-            
-            # Create metadata
-            metadata = {
-                "filename": file.filename,
-                "file_id": hashlib.md5(file.filename.encode()).hexdigest(),
-                "upload_timestamp": datetime.now().isoformat()
-            }
-            
-            # Add to vector store
-            await llm_service.mongo_services.add_texts_to_vectorstore(chunks, metadata)
-            
-            processed_files.append({
-                "filename": file.filename,
-                "status": "success",
-                "chunks": len(chunks)
-            })
-            
-        except Exception as e:
-            processed_files.append({
-                "filename": file.filename,
-                "status": "error",
-                "error": str(e)
-            })
+    upload_timestamp = datetime.now().isoformat()
+    metadata = [
+        {
+            "filename": file.filename,
+            "file_id": hashlib.md5(file.filename.encode()).hexdigest(),
+            "upload_timestamp": upload_timestamp,
+            **({"subject": subject} if subject else {})
+        }
+        for file in files
+    ]
+    job = await ingestion_jobs.submit(files, metadata, replace=replace_existing)
     
-    return {"processed_files": processed_files}   
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "files": [
+            {"filename": entry["filename"], "status": entry["status"], "error": entry["error"]}
+            for entry in job["files"]
+        ]
+    }
+
+@router.get("/ingest/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    ingestion_jobs: IngestionJobQueue = Depends(get_ingestion_jobs)
+):
+    """Progress of an ingestion job: per-file status, chunk counts, throughput and errors"""
+    job = await ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
 
 @router.get("/debug")
-async def debug_collection():
-    sample_doc = await llm_service.mongo_services.collection.find_one(
+async def debug_collection(mongo_service: MongoDBService = Depends(get_mongo_service)):
+    sample_doc = await mongo_service.rag_collection.find_one(
         {}, 
         {'_id': 0}  # Exclude _id field from the result
     )
-    doc_count = await llm_service.mongo_services.get_document_count()
+    doc_count = await mongo_service.get_document_count()
     
     return {
         "sample_document": sample_doc,
@@ -159,7 +191,8 @@ async def debug_collection():
 @router.post("/index/documents")
 async def index_documents(
     texts: List[str] = Body(...),
-    clear_existing: bool = Body(False)
+    clear_existing: bool = Body(False),
+    llm_service: LLMService = Depends(get_llm_service)
 ) -> dict:
     """
     Endpoint pour indexer des documents
@@ -175,11 +208,11 @@ async def index_documents(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/delete/all/documents")
-async def clear_documents() -> dict:
+async def clear_documents(mongo_service: MongoDBService = Depends(get_mongo_service)) -> dict:
     """Endpoint pour supprimer tous les documents indexés"""
     try:
-        llm_service.mongo_services.close()
-        llm_service.mongo_services.clear()
+        # Le client Mongo est partagé par le processus : on ne le ferme plus ici
+        await mongo_service.clear()
         return {"message": "Vector store cleared successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -203,12 +236,42 @@ async def clear_documents() -> dict:
 async def query_documents(
     query: str,
     session_id: Optional[str] = None,
-    include_chunks: bool = False
+    include_chunks: bool = False,
+    k: Optional[int] = Query(None, ge=1, le=settings.retrieval_k_max),
+    num_candidates: Optional[int] = Query(None, ge=1),
+    mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filename: Optional[str] = None,
+    subject: Optional[str] = None,
+    teacher_id: Optional[str] = None,
+    llm_service: LLMService = Depends(get_llm_service),
+    mongo_service: MongoDBService = Depends(get_mongo_service),
+    teacher_registry: TeacherRegistry = Depends(get_teacher_registry)
 ):
-    """Query documents and get contextual answers"""
+    """
+    Query documents and get contextual answers.
+    Retrieval can be tuned per request (k, candidates, vector/hybrid mode, re-ranking) and
+    restricted to a file or a subject (the teacher's subject when teacher_id is given).
+    With include_chunks, each chunk has a `score`: cosine similarity in vector mode (default),
+    reciprocal rank fusion value (sum of 1 / (RETRIEVAL_RRF_K + rank)) in hybrid mode, with `vector_score`
+    and `lexical_score` for each index, and `rerank_score` when re-ranked.
+    """
+    if mode is not None and mode not in ("vector", "hybrid"):
+        raise HTTPException(status_code=400, detail="mode must be 'vector' or 'hybrid'")
     try:
+        filters = {}
+        if filename:
+            filters["filename"] = filename
+        if teacher_id and not subject:
+            teacher = await teacher_registry.get(teacher_id)
+            subject = teacher.subject if teacher else None
+        if subject:
+            filters["subject"] = subject
+        
         # Get similar chunks
-        chunks = await llm_service.mongo_services.similarity_search(query)
+        chunks = await mongo_service.similarity_search(
+            query, k=k, num_candidates=num_candidates, filters=filters or None, mode=mode, rerank=rerank
+        )
         
         if not chunks:
             return {
@@ -216,11 +279,12 @@ async def query_documents(
                 "chunks": []
             }
         
-        # Generate answer using the unified response generator
+        # Generate answer from the chunks above: the search is not run a second time
         answer = await llm_service.generate_response(
             message=query,
             session_id=session_id,
-            use_rag=True
+            use_rag=True,
+            context_chunks=chunks
         )
         
         response = {
@@ -244,7 +308,8 @@ async def query_documents(
 @router.post("/teacher-chat", response_model=ChatResponse)
 async def teacher_chat(
     request: ChatRequest, 
-    teacher_id: str
+    teacher_id: str,
+    llm_service: LLMService = Depends(get_llm_service)
 ) -> ChatResponse:
     """Chat with a specific teacher personality"""
     try:
@@ -1,19 +1,20 @@
 
 from asyncio.log import logger
-from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi import APIRouter, HTTPException, Body, Query, Depends
 from models.chat import ChatRequest, ChatResponse
 from models.exercise import ExerciseRequest, ExerciseResponse, ExerciseType
 from services.llm_serv import LLMService
+from api.dependencies import get_llm_service
 from typing import Dict, List, Optional
 
 router = APIRouter()
-llm_service = LLMService()
 
 @router.post("/generate-exercise", response_model=ExerciseResponse)
 async def generate_exercise(
     request: ExerciseRequest,
     difficulty: str = Query("medium", enum=["easy", "medium", "hard", "expert"]),
-    number_of_questions: int = Query(3, ge=1, le=10)
+    number_of_questions: int = Query(3, ge=1, le=10),
+    llm_service: LLMService = Depends(get_llm_service)
 ) -> ExerciseResponse:
     """Generate exercises based on subject, topic and difficulty level"""
     try:
@@ -40,7 +41,8 @@ async def generate_exercise(
 async def evaluate_answer(
     exercise_id: str,
     student_answer: str = Body(...),
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    llm_service: LLMService = Depends(get_llm_service)
 ):
     """Evaluate a student's answer to an exercise"""
     try:
@@ -1,29 +1,60 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends, Query
+from core.config import settings
 from models.chat import ChatRequest, ChatResponse
+from models.conversation import SessionPage
 from services.llm_serv import LLMService
-from typing import Dict, List
+from api.dependencies import get_llm_service, get_session_filters
+from api.streaming import sse_response, token_events, json_export_response
+from typing import Any, Dict, List, Optional
 
 router = APIRouter()
-llm_service = LLMService()
 
 @router.get("/history/{session_id}")
-async def get_history(session_id: str) -> List[Dict[str, str]]:
+async def get_history(session_id: str, llm_service: LLMService = Depends(get_llm_service)) -> List[Dict[str, str]]:
     """Récupération de l'historique d'une conversation"""
     try:
         return await llm_service.get_conversation_history(session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@router.get("/sessions", response_model=List[str])
-async def get_sessions() -> List[str]:
-    """Retrieve all session IDs."""
+@router.get("/sessions", response_model=SessionPage, response_model_exclude_none=True)
+async def get_sessions(
+    limit: Optional[int] = Query(None, ge=1, le=settings.sessions_page_max),
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    filters: Dict[str, Any] = Depends(get_session_filters),
+    llm_service: LLMService = Depends(get_llm_service)
+) -> Dict[str, Any]:
+    """
+    Sessions from newest to oldest, one page at a time.
+    Pass the returned next_cursor as `cursor` to get the next page; `summary` adds
+    the message count, the teacher and a preview of the last message.
+    """
     try:
-        return await llm_service.get_all_sessions()
+        return await llm_service.list_sessions(
+            limit=limit or settings.sessions_page_size, cursor=cursor, summary=summary, **filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/sessions/export")
+async def export_sessions(
+    summary: bool = True,
+    filters: Dict[str, Any] = Depends(get_session_filters),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Export every matching session as a JSON array streamed from a single MongoDB cursor"""
+    return json_export_response(llm_service.iter_sessions(summary=summary, **filters), "sessions.json")
+
 @router.post("/{teacher_id}/chat", response_model=ChatResponse)
-async def chat_with_teacher(teacher_id: str, request: ChatRequest):
+async def chat_with_teacher(
+    teacher_id: str,
+    request: ChatRequest,
+    llm_service: LLMService = Depends(get_llm_service)
+):
         try :
             response = await llm_service.generate_response(
             teacher_id = teacher_id,
@@ -34,4 +65,17 @@ async def chat_with_teacher(teacher_id: str, request: ChatRequest):
         except Exception as e:
                 print(e)
                 raise HTTPException(status_code=500, detail=str(e))
-        
\ No newline at end of file
+
+@router.post("/{teacher_id}/chat/stream")
+async def chat_with_teacher_stream(
+    teacher_id: str,
+    request: ChatRequest,
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Version streaming (SSE) du chat avec un professeur"""
+    session_id, tokens = await llm_service.stream_response(
+        teacher_id=teacher_id,
+        message=request.message,
+        session_id=request.session_id
+    )
+    return sse_response(token_events(session_id, tokens, {"teacher_id": teacher_id}))
@@ -0,0 +1,72 @@
+# api/streaming.py
+"""
+Réponses en streaming (Server-Sent Events) pour les endpoints de chat
+"""
+import json
+from asyncio.log import logger
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Event"""
+    payload = f"event: {event}\n" if event else ""
+    return payload + f"data: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def token_events(session_id: str,
+                       tokens: AsyncIterator[str],
+                       metadata: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    Turn a token iterator into SSE events:
+    `session` first, one `token` per chunk, then `done` with the full response
+    (or `error` if the generation fails mid-stream).
+    """
+    yield sse_event({"session_id": session_id, **(metadata or {})}, event="session")
+    chunks = []
+    try:
+        async for token in tokens:
+            chunks.append(token)
+            yield sse_event({"token": token}, event="token")
+    except Exception as e:
+        logger.error(f"Streaming error: {str(e)}")
+        yield sse_event({"detail": str(e)}, event="error")
+        return
+    yield sse_event({"response": "".join(chunks)}, event="done")
+
+
+async def single_event(session_id: str, payload: Any) -> AsyncIterator[str]:
+    """Stream a response that is not generated token by token (exercises, evaluations, ...)"""
+    yield sse_event({"session_id": session_id}, event="session")
+    yield sse_event(payload, event="done")
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wrap SSE events in a non-buffered streaming HTTP response"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+async def json_array(items: AsyncIterator[Any]) -> AsyncIterator[str]:
+    """Serialize items one by one as a JSON array, without holding the whole list in memory"""
+    yield "["
+    first = True
+    async for item in items:
+        yield ("" if first else ",") + json.dumps(item, ensure_ascii=False, default=str)
+        first = False
+    yield "]"
+
+
+def json_export_response(items: AsyncIterator[Any], filename: str) -> StreamingResponse:
+    """Stream a JSON array as a downloadable file"""
+    return StreamingResponse(
+        json_array(items),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
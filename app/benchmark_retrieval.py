@@ -0,0 +1,77 @@
+"""
+Comparaison de la recherche vectorielle seule et de la recherche hybride (BM25 + vecteurs, RRF)
+sur les chunks de la collection des cours.
+
+Les requêtes sont tirées des chunks eux-mêmes (quelques mots consécutifs) : on mesure la latence
+de la recherche (embedding de la requête exclu, calculé une fois avant la mesure) et la part
+des requêtes dont le chunk d'origine est retrouvé dans les k résultats.
+
+Usage :
+    cd app
+    python benchmark_retrieval.py --queries 200 --k 4
+    python benchmark_retrieval.py --rerank
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from dotenv import load_dotenv
+from services.mongo_services import MongoDBService
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def benchmark(queries: int = 200, k: int = 4, words: int = 8, rerank: bool = False, seed: int = 0):
+    mongo_service = MongoDBService()
+    try:
+        count = await mongo_service.load_vector_index()
+        print(f"{count} chunks indexés ({mongo_service.vector_index.name})")
+
+        rng = random.Random(seed)
+        chunks = [doc async for doc in mongo_service.rag_collection.find({}, {"text": 1})]
+        samples = []
+        for doc in rng.sample(chunks, min(queries, len(chunks))):
+            tokens = doc.get("text", "").split()
+            if len(tokens) >= words:
+                start = rng.randrange(len(tokens) - words + 1)
+                samples.append((str(doc["_id"]), " ".join(tokens[start:start + words])))
+        if not samples:
+            print("Pas assez de chunks pour le benchmark")
+            return
+
+        vectors = await mongo_service.embeddings.aembed_documents([query for _, query in samples])
+        configurations = [("vector", False), ("hybrid", False)]
+        if rerank:
+            configurations.append(("hybrid", True))
+
+        print(f"{len(samples)} requêtes, k={k}")
+        print(f"{'mode':<16}{'moy. ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'rappel@k':>10}")
+        for mode, use_reranker in configurations:
+            latencies, found = [], 0
+            for (source_id, query), vector in zip(samples, vectors):
+                start = time.perf_counter()
+                results = await mongo_service.retriever.search(
+                    query, k=k, mode=mode, rerank=use_reranker, vector=vector
+                )
+                latencies.append(1000 * (time.perf_counter() - start))
+                found += any(chunk["id"] == source_id for chunk in results)
+            label = mode + (" + rerank" if use_reranker else "")
+            print(f"{label:<16}{statistics.mean(latencies):>10.2f}{_percentile(latencies, 0.5):>10.2f}"
+                  f"{_percentile(latencies, 0.95):>10.2f}{found / len(samples):>10.1%}")
+    finally:
+        await mongo_service.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare la recherche vectorielle et la recherche hybride")
+    parser.add_argument("--queries", type=int, default=200, help="Nombre de requêtes")
+    parser.add_argument("--k", type=int, default=4, help="Nombre de résultats par requête")
+    parser.add_argument("--words", type=int, default=8, help="Nombre de mots par requête")
+    parser.add_argument("--rerank", action="store_true", help="Mesure aussi le re-ranking (RERANKER_MODEL)")
+    args = parser.parse_args()
+    asyncio.run(benchmark(queries=args.queries, k=args.k, words=args.words, rerank=args.rerank))
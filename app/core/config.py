@@ -7,6 +7,144 @@ class Settings(BaseSettings):
     rag_database_name: str = "courses"
     teachers_database: str = "teachers"
     exercises_database: str = "exercises"
+    message_buckets_collection: str = "conversation_buckets"
+    
+    # Stockage des messages : "embedded" (tableau dans la conversation) ou "bucketed"
+    message_storage: str = "embedded"
+    message_bucket_size: int = 100
+    # Écriture des tours de conversation : différée hors du chemin de réponse si activé
+    defer_turn_writes: bool = False
+    # Identifiants des derniers tours gardés dans l'en-tête d'une conversation "bucketed" (déduplication)
+    message_recent_turns: int = 50
+    # Tampon d'écriture des messages, écritures regroupées en bulk_write (services/message_buffer.py)
+    message_write_buffer: bool = False
+    # "sync" : la requête attend le flush de son écriture ; "async" : acquittée dès la mise en tampon
+    message_write_durability: str = "sync"
+    message_flush_interval_ms: float = 5
+    message_flush_batch_size: int = 200
+    # Au-delà de ce nombre de messages en attente, les nouvelles écritures attendent un flush
+    message_buffer_max_pending: int = 10_000
+    
+    # Liste paginée des sessions (/chat/sessions, /teacher/sessions)
+    sessions_page_size: int = 50
+    sessions_page_max: int = 500
+    # Longueur de l'aperçu du dernier message gardé dans l'en-tête de la conversation
+    sessions_preview_chars: int = 120
+    
+    # Cache des sessions en mémoire (services/session_cache.py)
+    session_cache_max_entries: int = 2000
+    session_cache_max_messages: int = 100_000
+    session_cache_ttl_seconds: float = 3600
+    session_cache_sweep_interval: float = 60
+    # Nombre de messages récents gardés en cache et relus depuis MongoDB par session
+    history_window: int = 20
+    
+    # Fenêtre de contexte envoyée au modèle (services/context_window.py)
+    context_max_tokens: int = 3000
+    context_summary_enabled: bool = False
+    # Nombre maximum de messages repliés dans le résumé par mise à jour (rattrapage progressif)
+    context_summary_max_messages: int = 200
+    
+    # Registre des professeurs en mémoire (services/teacher_registry.py) : change stream si disponible,
+    # sinon relecture périodique (0 = jamais)
+    teacher_registry_watch: bool = True
+    teacher_registry_refresh_seconds: float = 30
+    # Durée pendant laquelle un identifiant de professeur inconnu n'est plus cherché dans MongoDB
+    teacher_registry_negative_ttl_seconds: float = 60
+    
+    # Taille minimale d'un préfixe de prompt mis en cache par le fournisseur (services/prompts.py)
+    prompt_cache_min_tokens: int = 1024
+    
+    # Classification locale des intentions /smart (services/intent_classifier.py)
+    intent_classifier_enabled: bool = True
+    intent_confidence_threshold: float = 0.8
+    intent_model_path: str = "intent_model.pkl"
+    intent_logs_collection: str = "intent_logs"
+    intent_logging_enabled: bool = True
+    
+    # Réserve d'exercices réutilisés pour les demandes identiques (services/exercise_pool.py)
+    exercise_pool_enabled: bool = True
+    # Collection dédiée : la collection des exercices ne garde que les exercices servis aux sessions
+    exercise_pool_collection: str = "exercise_pool"
+    exercise_pool_min_variants: int = 3
+    exercise_pool_max_variants: int = 20
+    exercise_pool_max_age_days: float = 30
+    exercise_pool_refresh_rate: float = 0.1
+    exercise_pool_shuffle: bool = True
+    exercise_pool_cache_entries: int = 256
+    exercise_pool_cache_ttl_seconds: float = 300
+    
+    # Cache sémantique des réponses, désactivé par défaut (services/semantic_cache.py)
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_ttl_seconds: float = 86400
+    semantic_cache_max_entries: int = 5000
+    # Nombre maximum de messages déjà échangés dans la session pour utiliser le cache
+    semantic_cache_max_history: int = 0
+    
+    # Cache des embeddings indexé par le hash du texte (services/embedding_cache.py)
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 10_000
+    embedding_cache_persistent: bool = True
+    embedding_cache_collection: str = "embedding_cache"
+    
+    # Regroupement et limitation des appels d'embeddings (services/embedding_dispatcher.py)
+    embedding_batch_size: int = 128
+    embedding_batch_max_tokens: int = 100_000
+    # Attente maximale avant l'envoi d'un lot incomplet
+    embedding_batch_wait_ms: float = 10
+    # Débit autorisé par l'API (0 = pas de limite)
+    embedding_tokens_per_minute: int = 1_000_000
+    embedding_max_concurrency: int = 4
+    embedding_max_retries: int = 5
+    
+    # Index vectoriel de la RAG : "atlas" ($vectorSearch) ou "local" (NumPy, services/vector_index.py).
+    # "local" charge tous les embeddings dans chaque processus et ne voit les chunks écrits par un autre
+    # processus qu'au redémarrage : réservé à un seul processus (développement, hors ligne, CI)
+    vector_backend: str = "atlas"
+    vector_index_name: str = "default"
+    # Fichier de base pour garder la matrice hors du tas Python (np.memmap), vide = en mémoire
+    vector_index_mmap_path: str = ""
+    # Index IVF approximatif (0 = recherche exacte uniquement)
+    vector_index_ivf_lists: int = 0
+    vector_index_ivf_nprobe: int = 8
+    vector_index_ivf_min_size: int = 20_000
+    
+    # Recherche de la RAG (services/retrieval.py) : "vector" ou "hybrid" (BM25 + vecteurs, fusion RRF).
+    # L'index BM25 est en mémoire du processus (comme le backend vectoriel "local") : "hybrid" ne voit les
+    # chunks écrits par un autre processus qu'au redémarrage, et le score devient une valeur RRF
+    retrieval_mode: str = "vector"
+    retrieval_k: int = 4
+    # Borne du k demandé par requête sur /chat/query
+    retrieval_k_max: int = 50
+    # Candidats pris dans chaque index avant la fusion
+    retrieval_num_candidates: int = 40
+    retrieval_rrf_k: int = 60
+    # Cross-encoder local de re-ranking (sentence-transformers), vide = désactivé
+    reranker_model: str = ""
+    reranker_candidates: int = 20
+    
+    # Index MongoDB créés au démarrage (services/indexes.py) : en mode strict, un index manquant bloque le démarrage
+    # (un index requis, comme conversations.session_id unique, le bloque toujours)
+    mongo_indexes_strict: bool = False
+    
+    # Ingestion des documents (services/ingestion.py) : extraction dans un pool de processus
+    ingestion_workers: int = 2
+    ingestion_pages_per_batch: int = 20
+    # Nombre de chunks embeddés et insérés par appel
+    ingestion_embed_batch_size: int = 64
+    # Nombre maximum d'appels d'embedding simultanés
+    ingestion_embed_concurrency: int = 4
+    # File des jobs d'ingestion (services/ingestion_jobs.py) : fichiers traités en parallèle
+    ingestion_job_workers: int = 2
+    ingestion_jobs_collection: str = "ingestion_jobs"
+    # Battement de cœur du worker qui ingère un fichier ; au-delà de `stale`, un autre processus le reprend
+    ingestion_job_heartbeat_seconds: float = 15
+    ingestion_job_stale_seconds: float = 120
+    # Répertoire des fichiers temporaires d'upload, vide = répertoire temporaire du système
+    ingestion_spool_dir: str = ""
+    # Relecture d'un échantillon de chunks après chaque lot (0 = acquittement du write concern seulement)
+    ingestion_verify_sample_size: int = 0
     
     model_config = SettingsConfigDict(
         env_file='.env', 
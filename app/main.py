@@ -1,18 +1,34 @@
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api.router import router as api_router
-from services.llm_serv import LLMService
 import uvicorn
-from services.mongo_services import MongoDBService
+from services.container import ServiceContainer
 from models.teacher import initial_teachers
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un seul conteneur de services (client Mongo, LLM, embeddings) par processus
+    services = ServiceContainer()
+    app.state.services = services
+    # Index MongoDB des requêtes fréquentes (le démarrage échoue en mode strict s'il en manque)
+    await services.index_manager.ensure()
+    # Seed the teachers collection with initial data
+    await services.mongo_service.seed_teachers(initial_teachers)
+    await services.start()
+    try:
+        yield
+    finally:
+        await services.close()
+
 app = FastAPI(
     title="Agent conversationnel",
     description="API pour un agent conversationnel donné lors du TP1",
     version="1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -23,20 +39,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Instance du service LLM
-llm_service = LLMService()
-
 # Inclure les routes
 app.include_router(api_router)
 # app.include_router(chat.router, prefix="/api")
 # app.include_router(chat_claude.router, prefix="/api/v2")
 # app.include_router(exercises.router, prefix="/api/exercises")
 
-mongo_service = MongoDBService()
-@app.on_event("startup")
-async def startup_event():
-    # Seed the teachers collection with initial data
-    await mongo_service.seed_teachers(initial_teachers)
+@app.get("/metrics")
+async def metrics():
+    """Métriques d'exécution des services partagés (caches, etc.)"""
+    return app.state.services.stats()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
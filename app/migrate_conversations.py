@@ -0,0 +1,61 @@
+"""
+Migration des conversations existantes vers le stockage par buckets.
+
+Usage :
+    cd app
+    python migrate_conversations.py --dry-run
+    python migrate_conversations.py --limit 1000
+
+Passer ensuite MESSAGE_STORAGE=bucketed dans le .env.
+"""
+import argparse
+import asyncio
+from dotenv import load_dotenv
+from services.mongo_services import MongoDBService
+
+
+async def migrate(limit: int = 0, dry_run: bool = False):
+    mongo_service = MongoDBService()
+    try:
+        await mongo_service.ensure_message_indexes()
+
+        # Compteurs dénormalisés pour les conversations créées avant leur introduction
+        # (également fait au démarrage de l'application)
+        if not dry_run:
+            await mongo_service.backfill_message_counts()
+
+        cursor = mongo_service.conversations.find(
+            {"storage": {"$ne": "bucketed"}}, {"session_id": 1}
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+
+        conversations = 0
+        messages = 0
+        async for conversation in cursor:
+            session_id = conversation["session_id"]
+            if dry_run:
+                print(f"→ {session_id} serait migrée")
+            else:
+                try:
+                    migrated = await mongo_service.migrate_conversation_to_buckets(session_id)
+                except RuntimeError as e:
+                    # Conversation trop active : elle sera reprise au prochain lancement
+                    print(f"✗ {session_id} : {e}")
+                    continue
+                messages += migrated
+                print(f"✓ {session_id} : {migrated} messages")
+            conversations += 1
+
+        print(f"{conversations} conversations, {messages} messages migrés")
+    finally:
+        await mongo_service.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Migre les conversations vers le stockage par buckets")
+    parser.add_argument("--limit", type=int, default=0, help="Nombre maximum de conversations à migrer")
+    parser.add_argument("--dry-run", action="store_true", help="Liste les conversations sans les modifier")
+    args = parser.parse_args()
+    asyncio.run(migrate(limit=args.limit, dry_run=args.dry_run))
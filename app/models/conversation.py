@@ -19,4 +19,20 @@ class MessageHistoryResponse(BaseModel):
     role: str
     content: str
     timestamp: Optional[str] = None
-    metadata: Optional[Union[Dict[str, Any], None]] = None
\ No newline at end of file
+    metadata: Optional[Union[Dict[str, Any], None]] = None
+
+
+class SessionSummary(BaseModel):
+    """One session of the listing; the summary fields are only filled when requested"""
+    session_id: str
+    updated_at: Optional[str] = None
+    created_at: Optional[str] = None
+    message_count: Optional[int] = None
+    teacher_id: Optional[str] = None
+    last_message: Optional[Dict[str, Any]] = None
+
+
+class SessionPage(BaseModel):
+    sessions: List[SessionSummary]
+    # À renvoyer dans `cursor` pour obtenir la page suivante, None pour la dernière page
+    next_cursor: Optional[str] = None
@@ -0,0 +1,109 @@
+# services/container.py
+"""
+Conteneur de services partagé par tout le processus.
+Construit une seule fois dans le lifespan de FastAPI puis injecté dans les routes.
+"""
+import os
+import logging
+from typing import Any, Dict
+from motor.motor_asyncio import AsyncIOMotorClient
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from core.config import settings
+from services.mongo_services import MongoDBService
+from services.llm_serv import LLMService
+from services.session_cache import SessionCache
+from services.intent_classifier import IntentClassifier
+from services.semantic_cache import SemanticCache
+from services.embedding_cache import CachedEmbeddings
+from services.embedding_dispatcher import EmbeddingDispatcher
+from services.ingestion import IngestionPipeline
+from services.ingestion_jobs import IngestionJobQueue
+from services.indexes import IndexManager
+
+
+class ServiceContainer:
+    """
+    Owns the process-wide clients (one Motor client, one chat model, one embeddings client)
+    and the services built on top of them.
+    """
+    def __init__(self):
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY n'est pas définie")
+
+        # Clients partagés
+        self.mongo_client = AsyncIOMotorClient(settings.mongodb_uri)
+        # Tous les appels asynchrones à l'API d'embeddings passent par le répartiteur (lots, débit, reprises)
+        self.embedding_dispatcher = EmbeddingDispatcher.from_settings(OpenAIEmbeddings(api_key=api_key))
+        self.embeddings = self.embedding_dispatcher
+        if settings.embedding_cache_enabled:
+            # Requêtes et documents passent par le même cache indexé par le hash du texte
+            self.embeddings = CachedEmbeddings.from_settings(
+                self.embeddings,
+                collection=self.mongo_client[settings.database_name][settings.embedding_cache_collection]
+            )
+        self.llm = ChatOpenAI(
+            temperature=0.7,
+            model_name="gpt-3.5-turbo",
+            api_key=api_key
+        )
+        self.session_cache = SessionCache.from_settings()
+        self.intent_classifier = IntentClassifier.from_settings()
+        self.semantic_cache = SemanticCache.from_settings(embeddings=self.embeddings)
+
+        # Services métier construits sur les clients partagés
+        self.mongo_service = MongoDBService(client=self.mongo_client, embeddings=self.embeddings,
+                                            semantic_cache=self.semantic_cache)
+        self.index_manager = IndexManager.from_settings(self.mongo_service)
+        self.ingestion = IngestionPipeline.from_settings(self.mongo_service)
+        self.ingestion_jobs = IngestionJobQueue.from_settings(self.ingestion, collection=self.mongo_service.ingestion_jobs)
+        self.llm_service = LLMService(
+            mongo_services=self.mongo_service,
+            llm=self.llm,
+            conversation_store=self.session_cache,
+            semantic_cache=self.semantic_cache
+        )
+        self.teacher_registry = self.llm_service.teacher_registry
+
+    async def start(self):
+        """Start the background tasks owned by the container"""
+        await self.mongo_service.load_vector_index()
+        # Avant le premier $inc sur une conversation antérieure au compteur de messages
+        await self.mongo_service.backfill_message_counts()
+        await self.teacher_registry.start()
+        self.session_cache.start()
+        await self.ingestion_jobs.start()
+
+    async def close(self):
+        """Stop background tasks and release the shared clients"""
+        await self.llm_service.flush_background_tasks()
+        await self.session_cache.stop()
+        await self.teacher_registry.stop()
+        await self.ingestion_jobs.stop()
+        self.ingestion.close()
+        self.embedding_dispatcher.close()
+        # Vide aussi le tampon d'écriture des messages
+        await self.mongo_service.close()
+        logging.debug("Service container closed.")
+
+    def stats(self) -> Dict[str, Any]:
+        """Collect the runtime metrics of the shared services"""
+        return {
+            "indexes": self.index_manager.stats(),
+            "message_buffer": self.mongo_service.write_buffer.stats() if self.mongo_service.write_buffer else None,
+            "session_cache": self.session_cache.stats(),
+            "teacher_registry": self.teacher_registry.stats(),
+            "context_window": self.llm_service.context_builder.stats(),
+            "prompts": self.llm_service.prompts.stats(),
+            "intent_classifier": self.intent_classifier.stats(),
+            "grading": self.llm_service.grader.stats(),
+            "exercise_pool": self.llm_service.exercise_pool.stats(),
+            "semantic_cache": self.semantic_cache.stats(),
+            "embedding_cache": self.embeddings.stats() if isinstance(self.embeddings, CachedEmbeddings) else None,
+            "embedding_dispatcher": self.embedding_dispatcher.stats(),
+            "vector_index": self.mongo_service.vector_index.stats(),
+            "lexical_index": self.mongo_service.lexical_index.stats(),
+            "retrieval": self.mongo_service.retriever.stats(),
+            "ingestion": self.ingestion.stats(),
+            "ingestion_jobs": self.ingestion_jobs.stats(),
+        }
@@ -0,0 +1,150 @@
+# services/context_window.py
+"""
+Construction de la fenêtre de contexte envoyée au modèle, bornée en nombre de tokens
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from core.config import settings
+
+# Surcoût approximatif d'un message dans le format chat d'OpenAI (rôle, séparateurs)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """
+    Local token counting with tiktoken, falling back to a ~4 characters per token
+    estimate when the encoding is not available (offline environment).
+    """
+    def __init__(self, model_name: str = "gpt-3.5-turbo"):
+        try:
+            import tiktoken
+            self._encoding = tiktoken.encoding_for_model(model_name)
+        except Exception as e:
+            logging.warning(f"tiktoken indisponible, estimation approximative des tokens : {str(e)}")
+            self._encoding = None
+
+    def count_text(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    def count_message(self, message: BaseMessage) -> int:
+        return MESSAGE_OVERHEAD_TOKENS + self.count_text(str(message.content))
+
+    def count_messages(self, messages: List[BaseMessage]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+
+@dataclass
+class ContextWindow:
+    """Messages retained for a request and token accounting"""
+    messages: List[BaseMessage]
+    prompt_tokens: int
+    full_tokens: int
+    dropped_messages: int = 0
+    summary_used: bool = False
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.full_tokens - self.prompt_tokens)
+
+
+@dataclass
+class ContextWindowStats:
+    requests: int = 0
+    prompt_tokens: int = 0
+    tokens_saved: int = 0
+    truncated_requests: int = 0
+    summaries_generated: int = 0
+    last: Dict[str, int] = field(default_factory=dict)
+
+
+class ContextWindowBuilder:
+    """
+    Keeps the system prompt(s), an optional rolling summary and the most recent
+    history messages that fit in `max_tokens`, plus the current user message.
+    """
+    def __init__(self, counter: Optional[TokenCounter] = None, max_tokens: int = 3000):
+        self.counter = counter or TokenCounter()
+        self.max_tokens = max_tokens
+        self._stats = ContextWindowStats()
+
+    @classmethod
+    def from_settings(cls) -> "ContextWindowBuilder":
+        return cls(max_tokens=settings.context_max_tokens)
+
+    def build(self,
+              system_messages: List[BaseMessage],
+              history: List[BaseMessage],
+              message: BaseMessage,
+              summary: Optional[str] = None,
+              system_tokens: Optional[int] = None) -> ContextWindow:
+        """
+        Select the most recent history messages fitting in the token budget.
+        `system_tokens` is the already known token count of the system messages (teacher prompts).
+        """
+        head = list(system_messages)
+        if system_tokens is None:
+            system_tokens = self.counter.count_messages(system_messages)
+        summary_tokens = 0
+        if summary:
+            head.append(SystemMessage(content=f"Résumé de la conversation précédente :\n{summary}"))
+            summary_tokens = self.counter.count_message(head[-1])
+
+        used = system_tokens + summary_tokens + self.counter.count_message(message)
+        history_tokens = [self.counter.count_message(msg) for msg in history]
+
+        # On remonte l'historique du plus récent au plus ancien tant que le budget le permet
+        kept = 0
+        for tokens in reversed(history_tokens):
+            if used + tokens > self.max_tokens:
+                break
+            used += tokens
+            kept += 1
+
+        first = len(history) - kept
+        # Ne pas commencer la fenêtre par une réponse orpheline de l'assistant
+        while first < len(history) and isinstance(history[first], AIMessage):
+            used -= history_tokens[first]
+            first += 1
+
+        window = ContextWindow(
+            messages=head + history[first:] + [message],
+            prompt_tokens=used,
+            full_tokens=system_tokens + sum(history_tokens)
+                        + self.counter.count_message(message),
+            dropped_messages=first,
+            summary_used=bool(summary),
+        )
+        self._record(window)
+        return window
+
+    def _record(self, window: ContextWindow) -> None:
+        self._stats.requests += 1
+        self._stats.prompt_tokens += window.prompt_tokens
+        self._stats.tokens_saved += window.tokens_saved
+        if window.dropped_messages:
+            self._stats.truncated_requests += 1
+        self._stats.last = {
+            "prompt_tokens": window.prompt_tokens,
+            "tokens_saved": window.tokens_saved,
+            "dropped_messages": window.dropped_messages,
+        }
+
+    def record_summary(self) -> None:
+        self._stats.summaries_generated += 1
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self._stats.requests
+        return {
+            "max_tokens": self.max_tokens,
+            "requests": requests,
+            "truncated_requests": self._stats.truncated_requests,
+            "avg_prompt_tokens": self._stats.prompt_tokens / requests if requests else 0.0,
+            "tokens_saved": self._stats.tokens_saved,
+            "avg_tokens_saved": self._stats.tokens_saved / requests if requests else 0.0,
+            "summaries_generated": self._stats.summaries_generated,
+            "last_request": self._stats.last,
+        }
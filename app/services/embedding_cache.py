@@ -0,0 +1,167 @@
+# services/embedding_cache.py
+"""
+Cache des embeddings indexé par le hash du texte : les requêtes répétées et les documents
+déjà ingérés ne repassent pas par l'API d'embeddings.
+
+Niveau 1 : LRU en mémoire (vecteurs float32)
+Niveau 2 : collection MongoDB partagée entre les processus (vecteurs float32 en binaire)
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+from bson.binary import Binary
+from langchain_core.embeddings import Embeddings
+from pymongo.errors import BulkWriteError
+from core.config import settings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with a content-hash cache. The async methods use both levels;
+    the sync ones (called by LangChain helpers from worker threads) use the memory level only.
+    """
+    def __init__(self,
+                 embeddings: Embeddings,
+                 collection=None,
+                 max_entries: int = 10_000,
+                 namespace: Optional[str] = None):
+        self.embeddings = embeddings
+        self.collection = collection
+        self.max_entries = max_entries
+        # Le modèle fait partie de la clé : changer de modèle invalide le cache
+        self.namespace = namespace or getattr(embeddings, "model", type(embeddings).__name__)
+
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "api_calls": 0, "store_errors": 0}
+
+    @classmethod
+    def from_settings(cls, embeddings: Embeddings, collection=None) -> "CachedEmbeddings":
+        return cls(
+            embeddings=embeddings,
+            collection=collection if settings.embedding_cache_persistent else None,
+            max_entries=settings.embedding_cache_max_entries,
+        )
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    ####################### Interface Embeddings #######################
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        vectors = self._from_memory(keys)
+        missing = self._missing(texts, keys, vectors)
+        if missing:
+            self._stats["api_calls"] += 1
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            self._fill(vectors, keys, missing, computed)
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        vectors = self._from_memory(keys)
+        missing = self._missing(texts, keys, vectors)
+        if missing:
+            stored = await self._from_store(list(missing))
+            for key, vector in stored.items():
+                vectors[key] = vector
+                missing.pop(key)
+            self._remember(stored)
+            self._stats["store_hits"] += len(stored)
+        if missing:
+            self._stats["api_calls"] += 1
+            computed = await self.embeddings.aembed_documents(list(missing.values()))
+            new_vectors = self._fill(vectors, keys, missing, computed)
+            await self._save(new_vectors)
+        return [vectors[key].tolist() for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    ####################### Niveau mémoire #######################
+
+    def _from_memory(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    vectors[key] = vector
+        self._stats["memory_hits"] += len(vectors)
+        return vectors
+
+    def _missing(self, texts: List[str], keys: List[str], vectors: Dict[str, np.ndarray]) -> "OrderedDict[str, str]":
+        # Les textes dupliqués dans un même lot ne sont calculés qu'une fois
+        return OrderedDict((key, text) for key, text in zip(keys, texts) if key not in vectors)
+
+    def _fill(self,
+              vectors: Dict[str, np.ndarray],
+              keys: List[str],
+              missing: "OrderedDict[str, str]",
+              computed: List[List[float]]) -> Dict[str, np.ndarray]:
+        new_vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, computed)}
+        vectors.update(new_vectors)
+        self._remember(new_vectors)
+        self._stats["misses"] += len(new_vectors)
+        return new_vectors
+
+    def _remember(self, vectors: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for key, vector in vectors.items():
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    ####################### Niveau persistant #######################
+
+    async def _from_store(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if self.collection is None or not keys:
+            return {}
+        try:
+            cursor = self.collection.find({"_id": {"$in": keys}}, {"vector": 1})
+            return {doc["_id"]: np.frombuffer(doc["vector"], dtype=np.float32)
+                    async for doc in cursor}
+        except Exception as e:
+            self._stats["store_errors"] += 1
+            logging.error(f"Embedding cache read failed: {str(e)}")
+            return {}
+
+    async def _save(self, vectors: Dict[str, np.ndarray]) -> None:
+        if self.collection is None or not vectors:
+            return
+        now = datetime.utcnow()
+        documents = [
+            {"_id": key, "vector": Binary(vector.tobytes()), "dim": int(vector.shape[0]),
+             "model": self.namespace, "created_at": now}
+            for key, vector in vectors.items()
+        ]
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Un autre processus a pu enregistrer le même texte entre-temps
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                self._stats["store_errors"] += 1
+                logging.error(f"Embedding cache write failed: {str(e)}")
+        except Exception as e:
+            self._stats["store_errors"] += 1
+            logging.error(f"Embedding cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["memory_hits"] + self._stats["store_hits"] + self._stats["misses"]
+        hits = self._stats["memory_hits"] + self._stats["store_hits"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "persistent": self.collection is not None,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
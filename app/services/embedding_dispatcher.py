@@ -0,0 +1,207 @@
+# services/embedding_dispatcher.py
+"""
+Répartiteur des appels à l'API d'embeddings : les textes des uploads et des requêtes
+simultanés sont regroupés en lots, le débit en tokens par minute est limité par un
+seau à jetons, les erreurs transitoires sont rejouées avec un backoff aléatoire et
+les appels tournent dans un pool de threads dédié.
+"""
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from langchain_core.embeddings import Embeddings
+from core.config import settings
+
+RETRYABLE_ERRORS = ("RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+def estimate_tokens(text: str) -> int:
+    # Approximation (≈ 4 caractères par token) suffisante pour la limite de débit
+    return len(text) // 4 + 1
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, connection and server errors are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `tokens_per_minute`"""
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait until `tokens` are available; returns the time spent waiting"""
+        if self.capacity <= 0:
+            return 0.0
+        # Un lot plus gros que le seau attend simplement que le seau soit plein
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class EmbeddingDispatcher(Embeddings):
+    """
+    Embeddings wrapper coalescing concurrent async requests into batches of at most
+    `batch_size` texts / `batch_max_tokens` tokens, flushed when full or after `batch_wait_ms`.
+    At most `max_concurrency` batches are in flight, each on the dedicated executor.
+    """
+    def __init__(self,
+                 embeddings: Embeddings,
+                 batch_size: int = 128,
+                 batch_max_tokens: int = 100_000,
+                 batch_wait_ms: float = 10,
+                 tokens_per_minute: int = 1_000_000,
+                 max_concurrency: int = 4,
+                 max_retries: int = 5,
+                 retry_base_delay: float = 0.5,
+                 retry_max_delay: float = 30):
+        self.embeddings = embeddings
+        # Même espace de noms que le client sous-jacent pour le cache des embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.batch_size = batch_size
+        self.batch_max_tokens = batch_max_tokens
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self.bucket = TokenBucket(tokens_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embeddings")
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+        self._stats = {"requests": 0, "texts": 0, "batches": 0, "api_calls": 0, "retries": 0,
+                       "failures": 0, "max_queue_depth": 0, "throttled_seconds": 0.0}
+
+    @classmethod
+    def from_settings(cls, embeddings: Embeddings) -> "EmbeddingDispatcher":
+        return cls(
+            embeddings=embeddings,
+            batch_size=settings.embedding_batch_size,
+            batch_max_tokens=settings.embedding_batch_max_tokens,
+            batch_wait_ms=settings.embedding_batch_wait_ms,
+            tokens_per_minute=settings.embedding_tokens_per_minute,
+            max_concurrency=settings.embedding_max_concurrency,
+            max_retries=settings.embedding_max_retries,
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    ####################### Interface Embeddings #######################
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Appels synchrones (helpers LangChain dans des threads) : pas de regroupement
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+        self._stats["requests"] += 1
+        self._stats["texts"] += len(texts)
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._pending))
+        self._schedule()
+        return list(await asyncio.gather(*futures))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    ####################### Regroupement #######################
+
+    def _schedule(self) -> None:
+        while len(self._pending) >= self.batch_size:
+            self._dispatch()
+        if self._pending and (self._timer is None or self._timer.done()):
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.batch_wait)
+        while self._pending:
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Take the next batch off the queue and send it in the background"""
+        batch, tokens = [], 0
+        while self._pending and len(batch) < self.batch_size:
+            cost = estimate_tokens(self._pending[0][0])
+            if batch and tokens + cost > self.batch_max_tokens:
+                break
+            batch.append(self._pending.pop(0))
+            tokens += cost
+        task = asyncio.create_task(self._run(batch, tokens))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]], tokens: int) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            async with self._slots:
+                self._stats["throttled_seconds"] += await self.bucket.acquire(tokens)
+                vectors = await self._call(texts)
+        except Exception as e:
+            self._stats["failures"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._stats["batches"] += 1
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    async def _call(self, texts: List[str]) -> List[List[float]]:
+        """One API call on the dedicated executor, retried with full-jitter exponential backoff"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._stats["api_calls"] += 1
+                return await loop.run_in_executor(self._executor, self.embeddings.embed_documents, texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+                logging.warning(f"Embedding call failed ({type(e).__name__}), retry in {delay:.2f}s")
+                self._stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self._stats["batches"]
+        return {
+            **self._stats,
+            "queue_depth": len(self._pending),
+            "batches_in_flight": len(self._batches),
+            "avg_batch_size": self._stats["texts"] / batches if batches else 0.0,
+            "batch_size": self.batch_size,
+            "max_concurrency": self.max_concurrency,
+        }
@@ -0,0 +1,222 @@
+# services/exercise_pool.py
+"""
+Réserve d'exercices déjà générés, réutilisés pour les demandes identiques
+(matière, sujet, type, difficulté, nombre de questions, professeur).
+
+Les variantes sont stockées dans leur propre collection avec une clé normalisée indexée
+(les routes enregistrent à part l'exercice servi à chaque session) ; les plus récentes
+sont gardées dans un cache LRU en mémoire.
+"""
+import copy
+import hashlib
+import logging
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import DESCENDING
+from core.config import settings
+from models.exercise import ExerciseContent, ExerciseResponse, Solution
+from services.grading import correct_option_index, normalize_answer
+
+
+def exercise_cache_key(subject: str,
+                       topic: str,
+                       exercise_type: str,
+                       difficulty: str,
+                       number_of_questions: int,
+                       teacher_id: Optional[str] = None) -> str:
+    """Normalized key: case, accents and spacing of the request do not matter"""
+    parts = [normalize_answer(subject), normalize_answer(topic), exercise_type,
+             normalize_answer(difficulty), str(int(number_of_questions)), teacher_id or ""]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ExercisePool:
+    """
+    Serves a random stored variant once enough distinct variants exist for a key;
+    below `min_variants` (or with probability `refresh_rate`) a new one is generated.
+    """
+    def __init__(self,
+                 collection=None,
+                 min_variants: int = 3,
+                 max_variants: int = 20,
+                 max_age_days: float = 30,
+                 refresh_rate: float = 0.1,
+                 shuffle: bool = True,
+                 max_entries: int = 256,
+                 ttl_seconds: float = 300):
+        self.collection = collection
+        self.min_variants = min_variants
+        self.max_variants = max_variants
+        self.max_age_days = max_age_days
+        self.refresh_rate = refresh_rate
+        self.shuffle = shuffle
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # clé -> (date de chargement, variantes)
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._stats = {"requests": 0, "memory_hits": 0, "mongo_hits": 0, "misses": 0,
+                       "refreshes": 0, "stored": 0, "rejected": 0}
+
+    @classmethod
+    def from_settings(cls, collection=None) -> "ExercisePool":
+        return cls(
+            collection=collection,
+            min_variants=settings.exercise_pool_min_variants,
+            max_variants=settings.exercise_pool_max_variants,
+            max_age_days=settings.exercise_pool_max_age_days,
+            refresh_rate=settings.exercise_pool_refresh_rate,
+            shuffle=settings.exercise_pool_shuffle,
+            max_entries=settings.exercise_pool_cache_entries,
+            ttl_seconds=settings.exercise_pool_cache_ttl_seconds,
+        )
+
+    ####################### Lecture #######################
+
+    async def get(self, key: str) -> Optional[ExerciseResponse]:
+        """Return a (shuffled) stored variant for this key, or None if a new one should be generated"""
+        self._stats["requests"] += 1
+        variants = self._cached(key)
+        if variants is None:
+            variants = await self._load(key)
+            source = "mongo_hits"
+        else:
+            source = "memory_hits"
+
+        if len(variants) < self.min_variants:
+            self._stats["misses"] += 1
+            return None
+        if self.refresh_rate and random.random() < self.refresh_rate:
+            # Renouvelle régulièrement la réserve, même quand elle est pleine
+            self._stats["refreshes"] += 1
+            return None
+
+        self._stats[source] += 1
+        return self._to_response(random.choice(variants))
+
+    def _cached(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        loaded_at, variants = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds:
+            # Les variantes ajoutées par d'autres processus seront relues
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return variants
+
+    async def _load(self, key: str) -> List[Dict[str, Any]]:
+        query = {"cache_key": key}
+        if self.max_age_days:
+            query["created_at"] = {"$gte": datetime.utcnow() - timedelta(days=self.max_age_days)}
+        cursor = self.collection.find(query, {"exercise": 1, "solutions": 1}) \
+            .sort("created_at", DESCENDING).limit(self.max_variants)
+        variants = [{"exercise": doc["exercise"], "solutions": doc.get("solutions")}
+                    async for doc in cursor]
+        self._remember(key, variants)
+        return variants
+
+    def _remember(self, key: str, variants: List[Dict[str, Any]]) -> None:
+        self._entries[key] = (time.monotonic(), variants)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    ####################### Écriture #######################
+
+    async def add(self, key: str, parameters: Dict[str, Any], response: ExerciseResponse) -> Optional[str]:
+        """Store a freshly generated exercise as a variant for its key, if it is valid"""
+        variant = {
+            "exercise": response.exercise.model_dump(),
+            "solutions": response.solutions.model_dump() if response.solutions else None,
+        }
+        if not self.is_valid(variant, parameters.get("number_of_questions")):
+            self._stats["rejected"] += 1
+            return None
+
+        try:
+            result = await self.collection.insert_one({
+                **copy.deepcopy(variant),
+                **parameters,
+                "cache_key": key,
+                "created_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            # La réserve est une optimisation : l'exercice généré reste servi
+            logging.error(f"Failed to store pooled exercise: {str(e)}")
+            return None
+        self._stats["stored"] += 1
+
+        cached = self._cached(key)
+        if cached is not None:
+            cached.insert(0, variant)
+            del cached[self.max_variants:]
+        return str(result.inserted_id)
+
+    @staticmethod
+    def is_valid(variant: Dict[str, Any], number_of_questions: Optional[int] = None) -> bool:
+        """Only complete exercises with one solution per question are reused"""
+        questions = variant["exercise"].get("questions") or []
+        answers = (variant.get("solutions") or {}).get("answers") or []
+        if not questions or len(answers) != len(questions):
+            return False
+        if number_of_questions and len(questions) != number_of_questions:
+            return False
+        return all(isinstance(question, dict) and question.get("question") for question in questions)
+
+    ####################### Variantes servies #######################
+
+    def _to_response(self, variant: Dict[str, Any]) -> ExerciseResponse:
+        # Copie : les routes modifient l'exercice renvoyé (identifiant, consignes)
+        variant = copy.deepcopy(variant)
+        if self.shuffle:
+            self._shuffle(variant)
+        solutions = variant.get("solutions")
+        return ExerciseResponse(
+            exercise=ExerciseContent(**variant["exercise"]),
+            solutions=Solution(**solutions) if solutions else None
+        )
+
+    @staticmethod
+    def _shuffle(variant: Dict[str, Any]) -> None:
+        """Shuffle questions (keeping solutions aligned) and multiple choice options"""
+        questions = variant["exercise"]["questions"]
+        solutions = variant.get("solutions") or {}
+        answers = solutions.get("answers") or []
+        explanations = solutions.get("explanations") or []
+
+        order = list(range(len(questions)))
+        if len(answers) == len(questions) and len(explanations) in (0, len(questions)):
+            random.shuffle(order)
+            variant["exercise"]["questions"] = [questions[i] for i in order]
+            solutions["answers"] = [answers[i] for i in order]
+            if explanations:
+                solutions["explanations"] = [explanations[i] for i in order]
+
+        for question, answer in zip(variant["exercise"]["questions"], solutions.get("answers") or []):
+            options = question.get("options")
+            if question.get("type", "multiple_choice") != "multiple_choice" or not options \
+                    or not isinstance(answer, dict):
+                continue
+            correct = correct_option_index(options, answer)
+            if correct is None:
+                # Sans bonne réponse identifiable, mélanger les options fausserait la correction
+                continue
+            correct_text = options[correct]
+            random.shuffle(options)
+            # Le texte de l'option reste valable quel que soit l'ordre
+            answer["correct_answer"] = correct_text
+            answer["correct_option"] = correct_text
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self._stats["requests"]
+        hits = self._stats["memory_hits"] + self._stats["mongo_hits"]
+        return {
+            **self._stats,
+            "cached_keys": len(self._entries),
+            "hit_rate": hits / requests if requests else 0.0,
+        }
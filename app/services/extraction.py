@@ -0,0 +1,34 @@
+# services/extraction.py
+"""
+Extraction du texte des documents, exécutée dans les processus du pool d'ingestion.
+Module volontairement léger : il est importé par chaque processus du pool.
+"""
+import hashlib
+from typing import List
+from bs4 import BeautifulSoup
+from PyPDF2 import PdfReader
+
+
+def file_digest(path: str) -> str:
+    """sha256 of the file content, read by blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pdf_page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end) of a PDF file on disk"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, min(end, len(reader.pages)))]
+
+
+def extract_html(path: str) -> str:
+    with open(path, "rb") as f:
+        soup = BeautifulSoup(f, "html.parser")
+    return soup.get_text(separator=" ", strip=True)
@@ -0,0 +1,248 @@
+# services/grading.py
+"""
+Correction déterministe des exercices à réponse fermée (QCM, vrai/faux, texte à trous).
+Seules les réponses fausses ou ouvertes sont envoyées au LLM, en un seul appel par copie.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+OBJECTIVE_TYPES = ("multiple_choice", "true_false", "fill_in_blank")
+
+TRUE_WORDS = ("vrai", "true", "v", "t", "oui", "yes", "juste", "correct")
+FALSE_WORDS = ("faux", "false", "f", "non", "no", "incorrect")
+# Préfixe d'une option ("A)", "b.", "3 -") retiré avant comparaison
+OPTION_LABEL_RE = re.compile(r"^\s*(?:[a-h]|\d{1,2})\s*[.):-]\s+", re.IGNORECASE)
+ANSWER_KEYS = ("answer", "user_answer", "selected_option", "option", "response", "value", "reponse")
+QUESTION_KEYS = ("question_number", "question", "number", "index")
+
+
+def normalize_answer(value: Any) -> str:
+    """Case, accent, whitespace and trailing punctuation insensitive form of an answer"""
+    text = unicodedata.normalize("NFKD", str(value).lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" .;,!?'\"«»")
+
+
+def _to_bool(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    text = normalize_answer(value)
+    if text in TRUE_WORDS:
+        return True
+    if text in FALSE_WORDS:
+        return False
+    return None
+
+
+def option_labels(options: List[Any]) -> List[str]:
+    """Normalized option texts without their "A)" / "1." prefix"""
+    return [normalize_answer(OPTION_LABEL_RE.sub("", str(option))) for option in options]
+
+
+def correct_option_index(options: List[Any], solution: Dict[str, Any]) -> Optional[int]:
+    """Index of the correct option of a multiple choice question, or None if ambiguous"""
+    return AnswerGrader._expected_option(option_labels(options), solution)
+
+
+@dataclass
+class QuestionGrade:
+    """Result for one question; is_correct is None when only the LLM can decide"""
+    question_number: int
+    question_type: str
+    student_answer: Any
+    expected: Any = None
+    is_correct: Optional[bool] = None
+    feedback: str = ""
+
+    @property
+    def graded_locally(self) -> bool:
+        return self.is_correct is not None
+
+    @property
+    def needs_llm(self) -> bool:
+        return self.is_correct is not True
+
+
+class AnswerGrader:
+    """
+    Grades objective questions locally. Open questions (short answer, code, ...)
+    and answers that cannot be matched unambiguously are left to the LLM.
+    """
+    def __init__(self):
+        self._stats = {"submissions": 0, "questions": 0, "graded_locally": 0,
+                       "sent_to_llm": 0, "llm_calls": 0}
+
+    def grade(self, exercise: Dict[str, Any], user_answers: List[Any]) -> List[QuestionGrade]:
+        """Grade every question of a stored exercise against the student's answers"""
+        questions = (exercise.get("exercise") or {}).get("questions", [])
+        solutions = (exercise.get("solutions") or {}).get("answers", [])
+        default_type = exercise.get("exercise_type", "multiple_choice")
+        answers = self._answers_by_question(user_answers)
+
+        grades = []
+        for index, question in enumerate(questions):
+            number = index + 1
+            question_type = question.get("type") or default_type
+            solution = solutions[index] if index < len(solutions) else {}
+            grade = QuestionGrade(question_number=number, question_type=question_type,
+                                  student_answer=answers.get(number))
+            if grade.student_answer is None or grade.student_answer == "":
+                grade.is_correct = False
+                grade.feedback = "Pas de réponse."
+            else:
+                self.grade_question(grade, question, solution)
+            grades.append(grade)
+
+        self._stats["submissions"] += 1
+        self._stats["questions"] += len(grades)
+        self._stats["graded_locally"] += sum(1 for grade in grades if grade.graded_locally)
+        return grades
+
+    def grade_question(self, grade: QuestionGrade, question: Dict[str, Any], solution: Any) -> QuestionGrade:
+        """Fill `expected` and `is_correct` when the question type allows a local decision"""
+        solution = solution if isinstance(solution, dict) else {"correct_answer": solution}
+        if grade.question_type == "multiple_choice":
+            self._grade_multiple_choice(grade, question.get("options") or [], solution)
+        elif grade.question_type == "true_false":
+            self._grade_true_false(grade, question.get("options") or [], solution)
+        elif grade.question_type == "fill_in_blank":
+            self._grade_fill_in_blank(grade, solution)
+
+        if grade.is_correct is True:
+            grade.feedback = "Bonne réponse."
+        elif grade.is_correct is False and grade.expected is not None:
+            grade.feedback = f"Réponse attendue : {grade.expected}"
+        return grade
+
+    ####################### Types de questions #######################
+
+    def _grade_multiple_choice(self, grade: QuestionGrade, options: List[Any], solution: Dict[str, Any]) -> None:
+        labels = option_labels(options)
+        expected = self._expected_option(labels, solution)
+        chosen = self._chosen_option(labels, grade.student_answer)
+        if expected is None or chosen is None:
+            return
+        grade.expected = options[expected]
+        grade.is_correct = chosen == expected
+
+    @staticmethod
+    def _expected_option(labels: List[str], solution: Dict[str, Any]) -> Optional[int]:
+        # Le texte de la bonne réponse est la référence la plus sûre
+        for key in ("correct_answer", "answer", "correct_option"):
+            value = solution.get(key)
+            if value in (None, "") or isinstance(value, (list, dict)):
+                continue
+            text = normalize_answer(OPTION_LABEL_RE.sub("", str(value)))
+            if text in labels:
+                return labels.index(text)
+            if len(text) == 1 and "a" <= text <= "h" and ord(text) - ord("a") < len(labels):
+                return ord(text) - ord("a")
+
+        # Un index seul est ambigu (0 ou 1 en premier) : on ne tranche que s'il n'y a qu'une lecture possible
+        option = normalize_answer(solution.get("correct_option", ""))
+        if option.isdigit():
+            index = int(option)
+            if index == len(labels):
+                return index - 1
+            if index == 0:
+                return 0
+        return None
+
+    @staticmethod
+    def _chosen_option(labels: List[str], answer: Any) -> Optional[int]:
+        text = normalize_answer(OPTION_LABEL_RE.sub("", str(answer)))
+        if text in labels:
+            return labels.index(text)
+        if len(text) == 1 and "a" <= text <= "h" and ord(text) - ord("a") < len(labels):
+            return ord(text) - ord("a")
+        # Un élève numérote les options à partir de 1
+        if text.isdigit() and 1 <= int(text) <= len(labels):
+            return int(text) - 1
+        return None
+
+    def _grade_true_false(self, grade: QuestionGrade, options: List[Any], solution: Dict[str, Any]) -> None:
+        expected = None
+        for key in ("correct_answer", "answer", "correct_option"):
+            value = solution.get(key)
+            expected = _to_bool(value) if value is not None else None
+            if expected is None and value is not None and normalize_answer(value).isdigit() and options:
+                # Même ambiguïté d'index que pour les QCM : seules 0 et len(options) sont sans équivoque
+                index = int(normalize_answer(value))
+                if index in (0, len(options)):
+                    expected = _to_bool(OPTION_LABEL_RE.sub("", str(options[max(0, index - 1)])))
+            if expected is not None:
+                break
+        student = _to_bool(grade.student_answer)
+        if expected is None or student is None:
+            return
+        grade.expected = "Vrai" if expected else "Faux"
+        grade.is_correct = student == expected
+
+    def _grade_fill_in_blank(self, grade: QuestionGrade, solution: Dict[str, Any]) -> None:
+        expected = solution.get("correct_answer") or solution.get("answer") or solution.get("correct_option")
+        if expected in (None, ""):
+            return
+        accepted = expected if isinstance(expected, list) else [expected]
+        student = grade.student_answer
+        grade.expected = ", ".join(str(value) for value in accepted)
+
+        if isinstance(student, list) and len(accepted) > 1:
+            matches = len(student) == len(accepted) and all(
+                normalize_answer(a) == normalize_answer(b) for a, b in zip(student, accepted))
+        else:
+            matches = normalize_answer(student) in {normalize_answer(value) for value in accepted}
+        # Une réponse différente peut être un synonyme ou une faute mineure : le LLM tranche
+        if matches:
+            grade.is_correct = True
+
+    ####################### Réponses de l'élève #######################
+
+    @staticmethod
+    def _answers_by_question(user_answers: List[Any]) -> Dict[int, Any]:
+        """Accept numbered answers ({"question_number": 2, "answer": "B"}) or a plain ordered list"""
+        answers = {}
+        for position, item in enumerate(user_answers or [], start=1):
+            number, answer = position, item
+            if isinstance(item, dict):
+                for key in QUESTION_KEYS:
+                    value = item.get(key)
+                    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+                        number = int(value)
+                        break
+                answer = next((item[key] for key in ANSWER_KEYS if key in item), None)
+            answers[number] = answer
+        return answers
+
+    ####################### Synthèse #######################
+
+    def record_llm_call(self, questions: int) -> None:
+        self._stats["llm_calls"] += 1
+        self._stats["sent_to_llm"] += questions
+
+    @staticmethod
+    def summarize(grades: List[QuestionGrade]) -> Dict[str, Any]:
+        """Build the evaluation payload returned by /smart/evaluate from local grades"""
+        total = len(grades)
+        correct = sum(1 for grade in grades if grade.is_correct)
+        return {
+            "is_correct": total > 0 and correct == total,
+            "score": correct / total if total else 0.0,
+            "feedback": f"{correct}/{total} bonnes réponses.",
+            "explanation": "",
+            "question_feedback": [
+                {"question_number": grade.question_number,
+                 "is_correct": bool(grade.is_correct),
+                 "feedback": grade.feedback}
+                for grade in grades
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        questions = self._stats["questions"]
+        return {
+            **self._stats,
+            "local_rate": self._stats["graded_locally"] / questions if questions else 0.0,
+        }
@@ -0,0 +1,130 @@
+# services/indexes.py
+"""
+Index MongoDB requis par les requêtes fréquentes, déclarés en un seul endroit.
+Au démarrage, les index manquants sont créés puis vérifiés ; les index non déclarés
+ou jamais utilisés ($indexStats) sont signalés. En mode strict, un index manquant
+fait échouer le démarrage ; les index requis (dont dépend l'idempotence des écritures)
+le font échouer dans tous les cas.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import ASCENDING, DESCENDING
+from core.config import settings
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """One index of a MongoDBService collection attribute, with the query it serves"""
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+    query: str = ""
+    # Index dont dépend la correction (et pas seulement les performances) : manquant, le démarrage échoue
+    required: bool = False
+
+    @property
+    def name(self) -> str:
+        # Même nom que celui généré par MongoDB
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("conversations", (("session_id", ASCENDING),), unique=True, required=True,
+              query="conversation lookup by session_id, rejects the upsert of a replayed turn"),
+    IndexSpec("conversations", (("updated_at", DESCENDING), ("_id", DESCENDING)),
+              query="session listing paginated on (updated_at, _id)"),
+    IndexSpec("conversations", (("teacher_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)),
+              query="session listing of one teacher"),
+    IndexSpec("message_buckets", (("session_id", ASCENDING), ("bucket", ASCENDING)), unique=True,
+              query="bucketed message storage"),
+    IndexSpec("teachers", (("teacher_id", ASCENDING),), unique=True,
+              query="get_teacher"),
+    IndexSpec("exercises", (("session_id", ASCENDING), ("created_at", DESCENDING)),
+              query="most recent exercise of a session (/smart)"),
+    IndexSpec("exercises", (("subject", ASCENDING), ("created_at", DESCENDING)),
+              query="get_exercises_by_subject"),
+    IndexSpec("pooled_exercises", (("cache_key", ASCENDING), ("created_at", DESCENDING)),
+              query="exercise pool variants"),
+    IndexSpec("rag_collection", (("metadata.file_id", ASCENDING),),
+              query="chunks of a document (re-ingestion)"),
+    IndexSpec("ingestion_jobs", (("status", ASCENDING),),
+              query="unfinished jobs resumed at startup"),
+    IndexSpec("intent_logs", (("created_at", DESCENDING),),
+              query="train_intent_model.py"),
+]
+
+
+class IndexManager:
+    """Ensures the declared indexes exist and keeps a report for /metrics"""
+    def __init__(self, mongo_service, indexes: Optional[List[IndexSpec]] = None, strict: bool = False):
+        self.mongo_service = mongo_service
+        self.indexes = indexes if indexes is not None else INDEXES
+        self.strict = strict
+        self.report: Dict[str, Any] = {}
+
+    @classmethod
+    def from_settings(cls, mongo_service) -> "IndexManager":
+        return cls(mongo_service, strict=settings.mongo_indexes_strict)
+
+    def _collections(self, only: Optional[Iterable[str]] = None) -> Dict[str, List[IndexSpec]]:
+        collections: Dict[str, List[IndexSpec]] = {}
+        for spec in self.indexes:
+            if only is None or spec.collection in only:
+                collections.setdefault(spec.collection, []).append(spec)
+        return collections
+
+    async def ensure(self, only: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Create the missing indexes (of the `only` collections when given) and report
+        created, missing, undeclared and unused ones. Raises in strict mode if any is missing.
+        """
+        report = {"created": [], "missing": [], "undeclared": [], "unused": [], "errors": {}}
+        required = []
+        for attribute, specs in self._collections(only).items():
+            collection = getattr(self.mongo_service, attribute)
+            existing = await collection.index_information()
+            created = set()
+            for spec in specs:
+                label = f"{collection.name}.{spec.name}"
+                if spec.name in existing:
+                    continue
+                try:
+                    await collection.create_index(list(spec.keys), unique=spec.unique, name=spec.name)
+                    report["created"].append(label)
+                    created.add(spec.name)
+                except Exception as e:
+                    # Par exemple des doublons empêchant un index unique
+                    report["missing"].append(label)
+                    report["errors"][label] = str(e)
+                    if spec.required:
+                        required.append(label)
+                    logging.error(f"Index {label} ({spec.query}) could not be created: {str(e)}")
+
+            declared = {spec.name for spec in specs} | {"_id_"}
+            report["undeclared"] += [f"{collection.name}.{name}" for name in existing if name not in declared]
+            report["unused"] += [f"{collection.name}.{name}" for name in await self._unused(collection)
+                                 if name not in created]
+
+        for key in ("created", "undeclared", "unused"):
+            if report[key]:
+                logging.info(f"MongoDB indexes {key}: {', '.join(report[key])}")
+        self.report = report
+        if required:
+            raise RuntimeError(f"Missing required MongoDB indexes: {', '.join(required)}")
+        if self.strict and report["missing"]:
+            raise RuntimeError(f"Missing MongoDB indexes: {', '.join(report['missing'])}")
+        return report
+
+    @staticmethod
+    async def _unused(collection) -> List[str]:
+        """Indexes never used since the server started ($indexStats, not available everywhere)"""
+        try:
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+        except Exception:
+            return []
+        return [stat["name"] for stat in stats
+                if stat["name"] != "_id_" and not stat.get("accesses", {}).get("ops")]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"declared": len(self.indexes), "strict": self.strict, **self.report}
@@ -0,0 +1,200 @@
+# services/ingestion.py
+"""
+Ingestion des documents de cours pour la RAG, sans bloquer la boucle d'évènements :
+
+1. l'upload est recopié sur disque par blocs (jamais entièrement en mémoire)
+2. les pages sont extraites par lots dans un pool de processus (générateur asynchrone)
+3. le texte est découpé au fil de l'eau, puis embeddé et inséré par lots bornés
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException, UploadFile
+from core.config import settings
+from services import extraction
+
+SUPPORTED_EXTENSIONS = (".pdf", ".html")
+
+
+class IngestionPipeline:
+    """
+    Streams a document from disk to the vector store: page batches are extracted in
+    worker processes, split incrementally and inserted `embed_batch_size` chunks at a time.
+    """
+    def __init__(self,
+                 mongo_service,
+                 workers: int = 2,
+                 pages_per_batch: int = 20,
+                 embed_batch_size: int = 64,
+                 embed_concurrency: int = 4,
+                 spool_dir: Optional[str] = None):
+        self.mongo_service = mongo_service
+        self.workers = workers
+        self.pages_per_batch = pages_per_batch
+        self.embed_batch_size = embed_batch_size
+        self.spool_dir = spool_dir or None
+        # Borne les appels d'embedding simultanés quand plusieurs fichiers sont ingérés en parallèle
+        self._embed_limit = asyncio.Semaphore(embed_concurrency)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stats = {"files": 0, "failed_files": 0, "pages": 0, "chunks": 0, "batches": 0,
+                       "stale_chunks": 0, "seconds": 0.0}
+
+    @classmethod
+    def from_settings(cls, mongo_service) -> "IngestionPipeline":
+        return cls(
+            mongo_service=mongo_service,
+            workers=settings.ingestion_workers,
+            pages_per_batch=settings.ingestion_pages_per_batch,
+            embed_batch_size=settings.ingestion_embed_batch_size,
+            embed_concurrency=settings.ingestion_embed_concurrency,
+            spool_dir=settings.ingestion_spool_dir,
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # "spawn" : pas de fork d'un processus qui a déjà des threads (Motor, exécuteurs)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    ####################### Upload #######################
+
+    @staticmethod
+    def check_filename(filename: str) -> None:
+        if not filename or not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail="Unsupported file format")
+
+    async def spool(self, file: UploadFile) -> str:
+        """Copy an upload to a temporary file by blocks, off the event loop"""
+        self.check_filename(file.filename)
+        suffix = os.path.splitext(file.filename)[1].lower()
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.spool_dir)
+
+        def copy() -> None:
+            with os.fdopen(fd, "wb") as out:
+                file.file.seek(0)
+                shutil.copyfileobj(file.file, out, length=1024 * 1024)
+
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, copy)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    async def ingest_upload(self, file: UploadFile, metadata: Dict[str, Any], replace: bool = True) -> int:
+        """Spool, extract, split, embed and insert an uploaded file; returns the number of chunks"""
+        path = await self.spool(file)
+        try:
+            return await self.ingest_path(path, file.filename, metadata, replace=replace)
+        finally:
+            os.remove(path)
+
+    ####################### Pipeline #######################
+
+    async def ingest_path(self, path: str, filename: str, metadata: Dict[str, Any],
+                          on_batch: Optional[Callable[[int], Awaitable[None]]] = None,
+                          replace: bool = True) -> int:
+        """
+        Ingest a file already on disk; returns the number of chunks.
+        `on_batch` is awaited with the running chunk count after each inserted batch.
+        With `replace`, the file is a new version of the document `metadata["file_id"]`:
+        unchanged chunks are kept as is and chunks missing from the new version are deleted.
+        """
+        start = time.perf_counter()
+        chunk_count = 0
+        chunk_ids: List[str] = []
+        loop = asyncio.get_event_loop()
+        try:
+            content_hash = await loop.run_in_executor(None, extraction.file_digest, path)
+            metadata = {**metadata, "content_hash": content_hash}
+            async for batch in self.iter_chunk_batches(path, filename):
+                async with self._embed_limit:
+                    chunk_ids += await self.mongo_service.add_texts_to_vectorstore(
+                        batch, metadata, chunk_offset=chunk_count
+                    )
+                chunk_count += len(batch)
+                self._stats["batches"] += 1
+                if on_batch is not None:
+                    await on_batch(chunk_count)
+            if replace and metadata.get("file_id"):
+                self._stats["stale_chunks"] += await self.mongo_service.delete_stale_chunks(
+                    metadata["file_id"], chunk_ids
+                )
+        except Exception:
+            self._stats["failed_files"] += 1
+            raise
+        finally:
+            self._stats["chunks"] += chunk_count
+            self._stats["seconds"] += time.perf_counter() - start
+        self._stats["files"] += 1
+        logging.debug(f"Ingested {filename}: {chunk_count} chunks")
+        return chunk_count
+
+    async def iter_chunk_batches(self, path: str, filename: str) -> AsyncIterator[List[str]]:
+        """Chunks of the document, `embed_batch_size` at a time"""
+        batch: List[str] = []
+        async for chunk in self.iter_chunks(path, filename):
+            batch.append(chunk)
+            if len(batch) >= self.embed_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def iter_chunks(self, path: str, filename: str) -> AsyncIterator[str]:
+        """
+        Split the text as page batches arrive. The last chunk of a batch may be cut by the
+        batch boundary, so it is carried over and split again with the following pages.
+        """
+        loop = asyncio.get_event_loop()
+        splitter = self.mongo_service.text_splitter
+        carry = ""
+        async for text in self.iter_texts(path, filename):
+            chunks = await loop.run_in_executor(None, splitter.split_text, carry + text)
+            if not chunks:
+                continue
+            for chunk in chunks[:-1]:
+                yield chunk
+            carry = chunks[-1] + "\n"
+        if carry.strip():
+            for chunk in await loop.run_in_executor(None, splitter.split_text, carry):
+                yield chunk
+
+    async def iter_texts(self, path: str, filename: str) -> AsyncIterator[str]:
+        """Extracted text, one batch of pages at a time, computed in the process pool"""
+        self.check_filename(filename)
+        loop = asyncio.get_event_loop()
+        if filename.lower().endswith(".html"):
+            yield await loop.run_in_executor(self.executor, extraction.extract_html, path)
+            return
+
+        page_count = await loop.run_in_executor(self.executor, extraction.pdf_page_count, path)
+        for start in range(0, page_count, self.pages_per_batch):
+            pages = await loop.run_in_executor(
+                self.executor, extraction.extract_pdf_pages, path, start, start + self.pages_per_batch
+            )
+            self._stats["pages"] += len(pages)
+            yield "".join(pages)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "pages_per_batch": self.pages_per_batch,
+            "embed_batch_size": self.embed_batch_size,
+            **self._stats,
+        }
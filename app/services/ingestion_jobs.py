@@ -0,0 +1,266 @@
+# services/ingestion_jobs.py
+"""
+File des jobs d'ingestion : l'upload enregistre les fichiers sur disque et un job dans MongoDB,
+puis des workers en arrière-plan ingèrent les fichiers. L'état des jobs est persisté,
+les fichiers non terminés sont repris au redémarrage.
+
+Plusieurs processus (workers uvicorn) partagent la collection : chaque fichier est réservé
+atomiquement (QUEUED -> RUNNING, avec propriétaire et battement de cœur) avant d'être ingéré,
+et seuls les fichiers RUNNING dont le battement de cœur est ancien sont repris.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import UploadFile
+from pymongo import ReturnDocument
+from core.config import settings
+from services.ingestion import IngestionPipeline
+
+QUEUED, RUNNING, COMPLETED, FAILED, PARTIAL = "queued", "running", "completed", "failed", "partial"
+
+
+class IngestionJobQueue:
+    """
+    Bounded pool of asyncio workers consuming (job_id, file index) items.
+    Each file is ingested through the shared IngestionPipeline, whose semaphore
+    limits the concurrent embedding calls across workers.
+    """
+    def __init__(self, pipeline: IngestionPipeline, collection, workers: int = 2,
+                 heartbeat_seconds: float = 15, stale_seconds: float = 120):
+        self.pipeline = pipeline
+        self.collection = collection
+        self.workers = workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        # Identifiant de ce processus dans les fichiers qu'il ingère
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: "asyncio.Queue[Tuple[str, int]]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {"jobs": 0, "files_completed": 0, "files_failed": 0, "files_resumed": 0,
+                       "files_skipped": 0}
+
+    @classmethod
+    def from_settings(cls, pipeline: IngestionPipeline, collection) -> "IngestionJobQueue":
+        return cls(
+            pipeline=pipeline,
+            collection=collection,
+            workers=settings.ingestion_job_workers,
+            heartbeat_seconds=settings.ingestion_job_heartbeat_seconds,
+            stale_seconds=settings.ingestion_job_stale_seconds,
+        )
+
+    ####################### Cycle de vie #######################
+
+    async def start(self) -> None:
+        """Re-enqueue the unfinished files of persisted jobs, then start the workers"""
+        await self._resume()
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _resume(self) -> None:
+        """
+        Enqueue the queued files and the running ones whose worker stopped beating. Files being
+        ingested by another live process are left alone; the claim in _process settles races.
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        async for job in self.collection.find({"status": {"$in": [QUEUED, RUNNING]}}):
+            for index, entry in enumerate(job["files"]):
+                if entry["status"] == RUNNING:
+                    heartbeat = entry.get("heartbeat")
+                    if heartbeat is not None and heartbeat >= stale_before:
+                        continue
+                    # Les chunks d'une ingestion interrompue sont idempotents : le fichier est simplement rejoué.
+                    # Remise en file conditionnée au battement lu, pour qu'un seul processus la fasse
+                    result = await self.collection.update_one(
+                        {"_id": job["_id"], f"files.{index}.status": RUNNING, f"files.{index}.heartbeat": heartbeat},
+                        {"$set": {f"files.{index}.status": QUEUED, f"files.{index}.chunks": 0,
+                                  f"files.{index}.owner": None}}
+                    )
+                    if not result.modified_count:
+                        continue
+                    self._stats["files_resumed"] += 1
+                elif entry["status"] != QUEUED:
+                    continue
+                self._queue.put_nowait((job["_id"], index))
+
+    ####################### Soumission #######################
+
+    async def submit(self, files: List[UploadFile], metadata: List[Dict[str, Any]],
+                     replace: bool = True) -> Dict[str, Any]:
+        """
+        Spool the uploads, persist a job and enqueue its files; returns the job document.
+        With `replace`, each file replaces the previous version of its document.
+        """
+        job_id = uuid.uuid4().hex
+        entries = []
+        for file, file_metadata in zip(files, metadata):
+            entry = {"filename": file.filename, "metadata": {**file_metadata, "job_id": job_id},
+                     "replace": replace, "status": QUEUED, "chunks": 0, "error": None,
+                     "path": None, "started_at": None, "finished_at": None}
+            try:
+                entry["path"] = await self.pipeline.spool(file)
+            except Exception as e:
+                entry.update(status=FAILED, error=getattr(e, "detail", None) or str(e))
+            entries.append(entry)
+
+        job = {"_id": job_id, "status": QUEUED, "created_at": datetime.utcnow(),
+               "finished_at": None, "files": entries}
+        job["status"] = self._job_status(entries)
+        if job["status"] != QUEUED:
+            job["finished_at"] = job["created_at"]
+        await self.collection.insert_one(job)
+        for index, entry in enumerate(entries):
+            if entry["status"] == QUEUED:
+                self._queue.put_nowait((job_id, index))
+        self._stats["jobs"] += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job progress: per-file status, chunk counts, errors and throughput"""
+        job = await self.collection.find_one({"_id": job_id})
+        if job is None:
+            return None
+        now = datetime.utcnow()
+        files = []
+        for entry in job["files"]:
+            elapsed = None
+            if entry["started_at"] is not None:
+                elapsed = ((entry["finished_at"] or now) - entry["started_at"]).total_seconds()
+            files.append({
+                "filename": entry["filename"],
+                "status": entry["status"],
+                "chunks": entry["chunks"],
+                "error": entry["error"],
+                "seconds": elapsed,
+                "chunks_per_second": entry["chunks"] / elapsed if elapsed else None,
+            })
+        elapsed = ((job["finished_at"] or now) - job["created_at"]).total_seconds()
+        chunks = sum(entry["chunks"] for entry in job["files"])
+        return {
+            "job_id": job["_id"],
+            "status": job["status"],
+            "created_at": job["created_at"].isoformat(),
+            "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "chunks_per_second": chunks / elapsed if elapsed else None,
+            "files": files,
+        }
+
+    ####################### Workers #######################
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, index = await self._queue.get()
+            try:
+                await self._process(job_id, index)
+            except Exception as e:
+                logging.error(f"Ingestion job {job_id} file {index} failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job_id: str, index: int) -> None:
+        job = await self._claim(job_id, index)
+        if job is None:
+            # Déjà pris par un autre processus, terminé ou supprimé
+            self._stats["files_skipped"] += 1
+            return
+        entry = job["files"][index]
+        if not entry["path"] or not os.path.exists(entry["path"]):
+            self._stats["files_failed"] += 1
+            await self._finish_file(job_id, index, FAILED, error="Uploaded file lost before ingestion")
+            return
+
+        async def progress(chunks: int) -> None:
+            await self._set_file(job_id, index, {"chunks": chunks, "heartbeat": datetime.utcnow()})
+
+        heartbeat = asyncio.create_task(self._beat(job_id, index))
+        try:
+            chunks = await self.pipeline.ingest_path(entry["path"], entry["filename"], entry["metadata"],
+                                                     on_batch=progress, replace=entry.get("replace", True))
+        except Exception as e:
+            self._stats["files_failed"] += 1
+            await self._finish_file(job_id, index, FAILED, error=getattr(e, "detail", None) or str(e))
+        else:
+            self._stats["files_completed"] += 1
+            await self._finish_file(job_id, index, COMPLETED, chunks=chunks)
+        finally:
+            heartbeat.cancel()
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+    async def _claim(self, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+        """Atomically move a queued file to RUNNING for this process; None if it is not queued anymore"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"_id": job_id, f"files.{index}.status": QUEUED},
+            {"$set": {
+                "status": RUNNING,
+                f"files.{index}.status": RUNNING,
+                f"files.{index}.owner": self.owner,
+                f"files.{index}.heartbeat": now,
+                f"files.{index}.started_at": now,
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _beat(self, job_id: str, index: int) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self._set_file(job_id, index, {"heartbeat": datetime.utcnow()})
+            except Exception as e:
+                logging.warning(f"Ingestion heartbeat of job {job_id} failed: {str(e)}")
+
+    ####################### Persistance #######################
+
+    async def _set_file(self, job_id: str, index: int, fields: Dict[str, Any]) -> None:
+        # Seul le propriétaire du fichier le met à jour (un fichier repris ailleurs n'est plus le sien)
+        await self.collection.update_one(
+            {"_id": job_id, f"files.{index}.owner": self.owner},
+            {"$set": {f"files.{index}.{name}": value for name, value in fields.items()}}
+        )
+
+    async def _finish_file(self, job_id: str, index: int, status: str,
+                           chunks: Optional[int] = None, error: Optional[str] = None) -> None:
+        fields = {"status": status, "error": error, "finished_at": datetime.utcnow()}
+        if chunks is not None:
+            fields["chunks"] = chunks
+        await self._set_file(job_id, index, fields)
+
+        job = await self.collection.find_one({"_id": job_id}, {"files.status": 1, "files.started_at": 1})
+        job_status = self._job_status(job["files"])
+        update = {"status": job_status}
+        if job_status not in (QUEUED, RUNNING):
+            update["finished_at"] = datetime.utcnow()
+        await self.collection.update_one({"_id": job_id}, {"$set": update})
+
+    @staticmethod
+    def _job_status(files: List[Dict[str, Any]]) -> str:
+        statuses = [entry["status"] for entry in files]
+        if RUNNING in statuses or QUEUED in statuses:
+            # Un fichier refusé à l'upload ne compte pas comme un démarrage du job
+            started = any(entry.get("started_at") for entry in files)
+            return RUNNING if RUNNING in statuses or started else QUEUED
+        if statuses and all(status == FAILED for status in statuses):
+            return FAILED
+        return PARTIAL if FAILED in statuses else COMPLETED
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "queued_files": self._queue.qsize(), **self._stats}
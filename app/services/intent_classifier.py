@@ -0,0 +1,280 @@
+# services/intent_classifier.py
+"""
+Classification locale des intentions /smart avant de recourir au LLM.
+
+Étage 1 : règles (identifiant d'exercice, mots-clés, listes de réponses numérotées)
+Étage 2 : modèle TF-IDF + régression logistique entraîné sur les intentions journalisées (optionnel)
+Étage 3 : le LLM (api/endpoints/smart.py::analyze_intent), seulement si les étages locaux hésitent
+"""
+import logging
+import os
+import pickle
+import re
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from core.config import settings
+
+EXERCISE_ID_RE = re.compile(r"\b[0-9a-f]{24}\b", re.IGNORECASE)
+QUESTION_NUMBER_RE = re.compile(r"\b(?:question|q)\s*(?:n°|no|numero|#)?\s*(\d{1,2})\b")
+ORDINAL_QUESTION_RE = re.compile(r"\b(\d{1,2})\s*(?:e|eme|er|ere)\s+question\b")
+NUMBERED_ANSWER_RE = re.compile(r"(?:^|\s|,|;)(?:q(?:uestion)?\s*)?(\d{1,2})\s*[.):=-]\s*([^\n,;]+?)(?=(?:\s*[,;]?\s*(?:q(?:uestion)?\s*)?\d{1,2}\s*[.):=-])|[\n,;]|$)")
+QUESTION_COUNT_RE = re.compile(r"\b(\d{1,2})\s+(?:questions?|exercices?|problemes?|qcm)\b")
+TOPIC_RE = re.compile(r"\b(?:sur|about|concernant|a propos de)\s+(?:les?\s+|la\s+|l')?(.+?)"
+                      r"(?:[?.!,]|\s+(?:avec|niveau|de niveau|de difficulte|en \d)\b|$)")
+
+HINT_WORDS = ("indice", "hint", "coup de pouce", "aide-moi", "aide moi", "bloque", "piste")
+SOLUTION_WORDS = ("solution", "corrige", "correction", "reponse a la question", "reponse de la question",
+                  "montre-moi la reponse", "montre moi la reponse", "donne-moi la reponse", "donne moi la reponse")
+ANSWER_WORDS = ("mes reponses", "ma reponse", "voici mes", "j'ai repondu", "my answers", "corrige-moi",
+                "evalue", "verifie")
+EXERCISE_WORDS = ("exercice", "exercise", "quiz", "qcm", "questionnaire", "probleme", "entrainer",
+                  "vrai ou faux", "interro")
+# Débuts de message propres à la conversation (question de cours, salutation)
+CHAT_OPENERS = ("quelle est", "quel est", "quels sont", "quelles sont", "qu'est-ce", "qu'est ce", "c'est quoi",
+                "qui est", "qui etait", "explique", "pourquoi", "comment", "raconte", "parle-moi", "parle moi",
+                "bonjour", "salut", "merci", "what is", "who is", "why", "how", "explain", "hello")
+REQUEST_WORDS = ("donne", "genere", "cree", "propose", "fais", "prepare", "veux", "voudrais", "peux-tu",
+                 "give", "generate", "create")
+
+EXERCISE_TYPES = (
+    ("vrai ou faux", "true_false"), ("true/false", "true_false"), ("true or false", "true_false"),
+    ("qcm", "multiple_choice"), ("choix multiple", "multiple_choice"),
+    ("texte a trous", "fill_in_blank"), ("trous", "fill_in_blank"),
+    ("code", "code_challenge"), ("programmation", "code_challenge"),
+    ("reponse courte", "short_answer"),
+)
+DIFFICULTIES = (
+    ("tres difficile", "expert"), ("expert", "expert"), ("difficile", "hard"),
+    ("facile", "easy"), ("simple", "easy"), ("moyen", "medium"),
+)
+SUBJECTS = (
+    ("math", "Mathématiques"), ("fraction", "Mathématiques"), ("equation", "Mathématiques"),
+    ("geometrie", "Mathématiques"), ("algebre", "Mathématiques"), ("trigonometrie", "Mathématiques"),
+    ("histoire", "Histoire"), ("revolution", "Histoire"), ("guerre", "Histoire"),
+    ("francais", "Français"), ("grammaire", "Français"), ("conjugaison", "Français"),
+    ("orthographe", "Français"), ("litterature", "Français"),
+)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents so that rules match 'Indice', 'indicé', etc."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+class IntentClassifier:
+    """
+    Tiered intent classifier. `classify` returns an analyze_intent-compatible result,
+    or None when the local tiers are not confident enough and the LLM must decide.
+    """
+    def __init__(self,
+                 confidence_threshold: float = 0.8,
+                 model_path: Optional[str] = None):
+        self.confidence_threshold = confidence_threshold
+        self.model_path = model_path
+        self.model = None
+        self.hits = {"rules": 0, "model": 0, "llm": 0}
+        if model_path:
+            self.load_model(model_path)
+
+    @classmethod
+    def from_settings(cls) -> "IntentClassifier":
+        return cls(
+            confidence_threshold=settings.intent_confidence_threshold,
+            model_path=settings.intent_model_path,
+        )
+
+    def classify(self, message: str) -> Optional[Dict[str, Any]]:
+        """Try the local tiers in order; None means 'ask the LLM'"""
+        text = normalize(message)
+
+        result = self._classify_rules(message, text)
+        if result and result.pop("confidence") >= self.confidence_threshold:
+            self.hits["rules"] += 1
+            result["tier"] = "rules"
+            return result
+
+        result = self._classify_model(message, text)
+        if result and result.pop("confidence") >= self.confidence_threshold:
+            self.hits["model"] += 1
+            result["tier"] = "model"
+            return result
+
+        return None
+
+    def record_llm_fallback(self) -> None:
+        self.hits["llm"] += 1
+
+    ####################### Étage 1 : règles #######################
+
+    def _classify_rules(self, message: str, text: str) -> Optional[Dict[str, Any]]:
+        exercise_id = self._exercise_id(message)
+        question_number = self._question_number(text)
+
+        submits = any(word in text for word in ANSWER_WORDS)
+
+        if any(word in text for word in HINT_WORDS):
+            return self._exercise_intent("get_hint", exercise_id, question_number)
+
+        answers = self._numbered_answers(message)
+        if answers and (len(answers) >= 2 or submits):
+            parameters = {"user_answers": answers}
+            if exercise_id:
+                parameters["exercise_id"] = exercise_id
+            # Une simple énumération (« 1) les fractions 2) les décimales ») n'est pas une copie à corriger
+            confidence = 0.9 if exercise_id or submits else 0.5
+            return {"intent": "evaluate_answers", "parameters": parameters, "confidence": confidence}
+
+        if any(word in text for word in SOLUTION_WORDS):
+            return self._exercise_intent("get_solution", exercise_id, question_number)
+
+        if any(word in text for word in EXERCISE_WORDS):
+            parameters = self._exercise_parameters(message, text)
+            asks = any(word in text for word in REQUEST_WORDS)
+            # Sans sujet identifié, le LLM extraira mieux les paramètres
+            confidence = 0.9 if asks and parameters.get("topic") else 0.5
+            return {"intent": "generate_exercise", "parameters": parameters,
+                    "is_exercise_request": True, "confidence": confidence}
+
+        if exercise_id or question_number or submits or "reponse" in text:
+            # Référence à un exercice sans intention claire : on laisse décider le LLM
+            return None
+
+        if text.startswith(CHAT_OPENERS):
+            # Question de cours ou salutation : conversation classique
+            return {"intent": "chat", "confidence": 0.85}
+        # Aucun signal ne prouve la conversation : une formulation absente des listes ne doit pas
+        # être routée localement, le modèle ou le LLM décide
+        return {"intent": "chat", "confidence": 0.5}
+
+    def _exercise_intent(self, intent: str, exercise_id: Optional[str],
+                         question_number: Optional[int]) -> Dict[str, Any]:
+        return {
+            "intent": intent,
+            "parameters": {"exercise_id": exercise_id, "question_number": question_number},
+            # Sans identifiant, le LLM peut le retrouver dans l'historique
+            "confidence": 0.95 if exercise_id else 0.4,
+        }
+
+    @staticmethod
+    def _exercise_id(message: str) -> Optional[str]:
+        match = EXERCISE_ID_RE.search(message)
+        return match.group(0).lower() if match else None
+
+    @staticmethod
+    def _question_number(text: str) -> Optional[int]:
+        match = QUESTION_NUMBER_RE.search(text) or ORDINAL_QUESTION_RE.search(text)
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def _numbered_answers(message: str) -> List[Dict[str, Any]]:
+        text = EXERCISE_ID_RE.sub(" ", message)
+        answers = []
+        for number, answer in NUMBERED_ANSWER_RE.findall(text):
+            answer = answer.strip()
+            if answer:
+                answers.append({"question_number": int(number), "answer": answer})
+        return answers
+
+    @staticmethod
+    def _exercise_parameters(message: str, text: str) -> Dict[str, Any]:
+        parameters = {
+            "subject": next((subject for key, subject in SUBJECTS if key in text), "general"),
+            "exercise_type": next((value for key, value in EXERCISE_TYPES if key in text), "multiple_choice"),
+            "difficulty": next((value for key, value in DIFFICULTIES if key in text), "medium"),
+            "number_of_questions": 3,
+        }
+        count = QUESTION_COUNT_RE.search(text)
+        if count:
+            parameters["number_of_questions"] = max(1, min(10, int(count.group(1))))
+        topic = TOPIC_RE.search(text)
+        if topic:
+            # Le sujet est repris du message original pour garder les accents
+            original = message.strip()
+            start, end = topic.span(1)
+            parameters["topic"] = (original[start:end] if len(original) == len(text) else topic.group(1)).strip()
+        return parameters
+
+    @staticmethod
+    def _has_required_parameters(result: Dict[str, Any]) -> bool:
+        parameters = result.get("parameters", {})
+        intent = result.get("intent")
+        if intent in ("get_hint", "get_solution"):
+            return bool(parameters.get("exercise_id"))
+        if intent == "evaluate_answers":
+            return bool(parameters.get("user_answers"))
+        if intent == "generate_exercise":
+            return bool(parameters.get("topic"))
+        return True
+
+    ####################### Étage 2 : modèle local #######################
+
+    def _classify_model(self, message: str, text: str) -> Optional[Dict[str, Any]]:
+        if self.model is None:
+            return None
+        probabilities = self.model.predict_proba([text])[0]
+        best = probabilities.argmax()
+        intent = self.model.classes_[best]
+        confidence = float(probabilities[best])
+
+        if intent == "chat":
+            return {"intent": "chat", "confidence": confidence}
+        # Les autres intentions ont besoin de paramètres : repris des règles si elles les trouvent
+        rules = self._classify_rules(message, text) or {}
+        if rules.get("intent") != intent or not self._has_required_parameters(rules):
+            return None
+        return {**rules, "confidence": confidence}
+
+    def load_model(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as f:
+                self.model = pickle.load(f)
+            logging.debug(f"Intent model loaded from {path}")
+            return True
+        except Exception as e:
+            logging.error(f"Failed to load intent model: {str(e)}")
+            return False
+
+    def train(self, messages: List[str], intents: List[str], path: Optional[str] = None) -> None:
+        """Fit the TF-IDF + logistic regression tier (requires scikit-learn)"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), min_df=1, sublinear_tf=True),
+            LogisticRegression(max_iter=1000, class_weight="balanced"),
+        )
+        model.fit([normalize(message) for message in messages], intents)
+        self.model = model
+        path = path or self.model_path
+        if path:
+            with open(path, "wb") as f:
+                pickle.dump(model, f)
+
+    ####################### Métriques #######################
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.hits.values())
+        return {
+            "requests": total,
+            "model_loaded": self.model is not None,
+            "hits": dict(self.hits),
+            "hit_rates": {tier: count / total if total else 0.0 for tier, count in self.hits.items()},
+        }
+
+
+async def log_intent(collection, message: str, intent: str, source: str) -> None:
+    """Store a classified message, used as training data for the local model (failures are only logged)"""
+    try:
+        await collection.insert_one({
+            "message": message,
+            "intent": intent,
+            "source": source,
+            "created_at": datetime.utcnow(),
+        })
+    except Exception as e:
+        logging.error(f"Failed to log intent: {str(e)}")
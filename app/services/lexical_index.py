@@ -0,0 +1,141 @@
+# services/lexical_index.py
+"""
+Index lexical BM25 des chunks de cours, en mémoire : retrouve les correspondances exactes
+(noms de formules, dates, termes de grammaire) que la recherche vectorielle peut manquer.
+"""
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Mots outils français ignorés par l'index (les nombres et termes courts sont gardés : dates, "pi", "cos")
+STOPWORDS = {
+    "le", "la", "les", "un", "une", "des", "du", "de", "d", "l", "et", "ou", "a", "au", "aux",
+    "en", "dans", "par", "pour", "sur", "avec", "sans", "ce", "cet", "cette", "ces", "est",
+    "sont", "que", "qui", "quoi", "dont", "ne", "pas", "se", "sa", "son", "ses", "il", "elle",
+    "ils", "elles", "on", "nous", "vous", "je", "tu", "me", "te", "y", "the", "of", "and",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens without stopwords"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [token for token in TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+def matches(metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """True when every filtered metadata field has the requested value"""
+    return not filters or all(metadata.get(field) == value for field, value in filters.items())
+
+
+class BM25Index:
+    """
+    Inverted index (term -> {chunk id: term frequency}) scored with Okapi BM25.
+    Only the postings of the query terms are visited.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[Any, int]] = {}
+        self._lengths: Dict[Any, int] = {}
+        self._payloads: Dict[Any, Dict[str, Any]] = {}
+        self._total_length = 0
+        self._stats = {"searches": 0}
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    ####################### Mise à jour #######################
+
+    def add(self, ids: Sequence[Any], texts: Sequence[str], payloads: Sequence[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.remove([doc_id for doc_id in ids if doc_id in self._lengths])
+            for doc_id, text, payload in zip(ids, texts, payloads):
+                tokens = tokenize(text)
+                for term, count in Counter(tokens).items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+                self._lengths[doc_id] = len(tokens)
+                self._payloads[doc_id] = payload
+                self._total_length += len(tokens)
+
+    def update_payloads(self, payloads: Dict[Any, Dict[str, Any]]) -> None:
+        """Replace the metadata of indexed chunks; the text, hence the postings, is unchanged"""
+        with self._lock:
+            for doc_id, payload in payloads.items():
+                if doc_id in self._payloads:
+                    self._payloads[doc_id] = payload
+
+    def remove(self, ids: Sequence[Any]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                if doc_id not in self._lengths:
+                    continue
+                for term in set(tokenize(self._payloads[doc_id]["text"])):
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.pop(doc_id, None)
+                        if not postings:
+                            del self._postings[term]
+                self._total_length -= self._lengths.pop(doc_id)
+                del self._payloads[doc_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings, self._lengths, self._payloads = {}, {}, {}
+            self._total_length = 0
+
+    async def load(self, collection, batch_size: int = 1000) -> int:
+        """Index the text of every stored chunk"""
+        self.clear()
+        cursor = collection.find({}, {"text": 1, "metadata": 1}).batch_size(batch_size)
+        ids, texts, payloads = [], [], []
+        async for doc in cursor:
+            text = doc.get("text", "")
+            ids.append(doc["_id"])
+            texts.append(text)
+            payloads.append({"text": text, "metadata": doc.get("metadata", {})})
+            if len(ids) >= batch_size:
+                self.add(ids, texts, payloads)
+                ids, texts, payloads = [], [], []
+        self.add(ids, texts, payloads)
+        logging.debug(f"Lexical index loaded with {len(self)} chunks")
+        return len(self)
+
+    ####################### Recherche #######################
+
+    def search(self, query: str, k: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[Any, float]]:
+        """Return up to k (chunk id, BM25 score) pairs, best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            self._stats["searches"] += 1
+            count = len(self._lengths)
+            if not count or not terms:
+                return []
+            avg_length = self._total_length / count
+            scores: Dict[Any, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            if filters:
+                scores = {doc_id: score for doc_id, score in scores.items()
+                          if matches(self._payloads[doc_id].get("metadata", {}), filters)}
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def payload(self, doc_id: Any) -> Optional[Dict[str, Any]]:
+        return self._payloads.get(doc_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"chunks": len(self), "terms": len(self._postings), **self._stats}
@@ -8,16 +8,26 @@ import uuid
 from fastapi import HTTPException
 from langchain_openai import ChatOpenAI
 from langchain_core.language_models.llms import LLM
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.chat_history import BaseChatMessageHistory
 from services.memory import InMemoryHistory
+from services.session_cache import SessionCache
+from services.context_window import ContextWindow, ContextWindowBuilder
+from services.grading import AnswerGrader, QuestionGrade
+from services.exercise_pool import ExercisePool, exercise_cache_key
+from services.semantic_cache import SemanticCache
+from services.teacher_registry import TeacherRegistry
+from services.prompts import PromptRegistry
+import asyncio
 import os
+import time
 from typing import Any, List, Dict, Optional
 from services.mongo_services import MongoDBService
+from core.config import settings
 from datetime import datetime
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any, Union
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple, Union
 from models.exercise import ExerciseResponse, ExerciseType, ExerciseContent, Solution, EvaluationResult
 
 @dataclass
@@ -26,28 +36,56 @@ class SessionContext:
     session_id: str
     history: List[Dict[str, str]]
     metadata: Dict[str, Any] = None
+    # Position absolue du premier message de `history` et résumé glissant des messages plus anciens
+    first_seq: int = 0
+    summary: Optional[str] = None
+    summary_covered: int = 0
 
 class LLMService:
     """
     Service LLM unifié supportant à la fois les fonctionnalités du TP1 et du TP2
     """
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        # self.mongo_service = MongoService()
-        # self.rag_mongo_service = RAGServiceMongo()
-        self.mongo_services = MongoDBService() 
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY n'est pas définie")
+    def __init__(self,
+                 mongo_services: Optional[MongoDBService] = None,
+                 llm: Optional[ChatOpenAI] = None,
+                 conversation_store: Optional[SessionCache] = None,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 teacher_registry: Optional[TeacherRegistry] = None):
+        # Les clients sont normalement fournis par le ServiceContainer (services/container.py)
+        self.mongo_services = mongo_services or MongoDBService()
         
         # Configuration commune
-        self.llm = ChatOpenAI(
-            temperature=0.7,
-            model_name="gpt-3.5-turbo",
-            api_key=api_key
-        )
+        if llm is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY n'est pas définie")
+            llm = ChatOpenAI(
+                temperature=0.7,
+                model_name="gpt-3.5-turbo",
+                api_key=api_key
+            )
+        self.llm = llm
         
         print("Initialisation du service LLM")
-        self.conversation_store = {}
+        # Cache borné des historiques (LRU + TTL), partagé par toutes les routes
+        self.conversation_store = conversation_store if conversation_store is not None else SessionCache.from_settings()
+        # Fenêtre de contexte bornée en tokens et tâches de résumé en arrière-plan
+        self.context_builder = ContextWindowBuilder.from_settings()
+        self._background_tasks = set()
+        # Sessions dont le résumé est en cours de mise à jour (une seule à la fois par session)
+        self._summarizing = set()
+        # Correction locale des questions fermées (QCM, vrai/faux, texte à trous)
+        self.grader = AnswerGrader()
+        # Exercices déjà générés, réutilisés pour les demandes identiques
+        self.exercise_pool = ExercisePool.from_settings(collection=self.mongo_services.pooled_exercises)
+        # Cache sémantique optionnel des réponses aux questions sans contexte
+        self.semantic_cache = semantic_cache
+        # Prompts versionnés à préfixe statique, avec le compte des tokens mis en cache par le fournisseur
+        self.prompts = PromptRegistry.from_settings(counter=self.context_builder.counter)
+        # Professeurs en mémoire (prompt système et nombre de tokens précalculés)
+        self.teacher_registry = teacher_registry if teacher_registry is not None else TeacherRegistry.from_settings(
+            self.mongo_services.teachers, counter=self.context_builder.counter, semantic_cache=semantic_cache
+        )
         
         # Keep only the chains needed for sequencing demo
         self.main_prompt = ChatPromptTemplate.from_messages([
@@ -70,17 +108,15 @@ class LLMService:
     
     def _get_session_history(self, session_id: str) -> BaseChatMessageHistory:
         """Récupère ou crée l'historique pour une session donnée"""
-        if session_id not in self.conversation_store:
+        history = self.conversation_store.get(session_id)
+        if history is None:
             print(f"Création de l'historique pour la session {session_id}")
-            self.conversation_store[session_id] = InMemoryHistory()
-        return self.conversation_store[session_id]
+            history = self.conversation_store.set(session_id, InMemoryHistory())
+        return history
     
-    def cleanup_inactive_sessions(self):
+    def cleanup_inactive_sessions(self) -> int:
         """Nettoie les sessions inactives"""
-        current_time = datetime.now()
-        for session_id, history in list(self.conversation_store.items()):
-            if not history.is_active():
-                del self.conversation_store[session_id]
+        return self.conversation_store.sweep()
         
     async def create_new_conversation(self) -> str:
         """Crée une nouvelle conversation et génère un ID unique."""
@@ -91,22 +127,69 @@ class LLMService:
         
     
     async def get_conversation_history(self, session_id: str) -> List[Dict]:
-        """Récupère l'historique depuis MongoDB et initialise la mémoire"""
-        # Attendre les données de MongoDB
+        """Récupère l'historique complet depuis MongoDB (endpoints /history)"""
         history = await self.mongo_services.get_conversation_history(session_id)
-        # Initialiser EnhancedMemoryHistory avec les données récupérées
-        self.conversation_store[session_id] = InMemoryHistory()
-        self.conversation_store[session_id].add_messages(history)
+        # Initialiser la mémoire comme pour un tour de conversation (fenêtre, first_seq et résumé)
+        await self._load_session(session_id)
         
         return history
     
+    async def _load_session(self, session_id: str) -> InMemoryHistory:
+        """
+        Retourne l'historique en cache de la session.
+        En cas d'absence, seule la fenêtre récente est lue depuis MongoDB ($slice).
+        """
+        cached = self.conversation_store.get(session_id)
+        if cached is not None:
+            return cached
+        window = await self.mongo_services.get_conversation_window(
+            session_id, limit=settings.history_window
+        )
+        history = InMemoryHistory(*window["messages"])
+        history.first_seq = max(0, window["message_count"] - len(window["messages"]))
+        if window.get("summary"):
+            history.summary = window["summary"].get("text")
+            history.summary_covered = window["summary"].get("covered", 0)
+        return self.conversation_store.set(session_id, history)
+    
+    async def get_recent_messages(self, session_id: str, count: int) -> List[Dict]:
+        """Retourne les `count` derniers messages d'une session depuis le cache"""
+        history = await self._load_session(session_id)
+        return list(history.messages[-count:])
+    
+    async def record_message(self,
+                             session_id: str,
+                             role: str,
+                             content: str,
+                             metadata: Optional[Dict[str, Any]] = None) -> bool:
+        """Persiste un message et l'ajoute à l'historique en cache s'il y est déjà"""
+        saved = await self.mongo_services.save_message(session_id, role, content, metadata=metadata)
+        if session_id in self.conversation_store:
+            self.conversation_store.add_messages(
+                session_id, [self._history_entry(role, content, metadata)]
+            )
+        return saved
+    
+    @staticmethod
+    def _history_entry(role: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Format des messages gardés en cache (identique à celui renvoyé par MongoDB)"""
+        entry = {"role": role, "content": content}
+        if metadata is not None:
+            entry["metadata"] = metadata
+        return entry
+    
     async def delete_conversation(self, session_id: str) -> bool:
         """Delete a conversation by session ID."""
+        self.conversation_store.pop(session_id)
         return await self.mongo_services.delete_conversation(session_id)
 
-    async def get_all_sessions(self) -> List[str]:
-        """Retrieve all session IDs."""
-        return await self.mongo_services.get_all_sessions()
+    async def list_sessions(self, **kwargs) -> Dict[str, Any]:
+        """One page of sessions (see MongoDBService.list_sessions)"""
+        return await self.mongo_services.list_sessions(**kwargs)
+
+    def iter_sessions(self, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Every matching session, for exports (see MongoDBService.iter_sessions)"""
+        return self.mongo_services.iter_sessions(**kwargs)
     
     
     #################### Méthodes pour  générer des réponses en fonction du type de endpoint utilisé ####################
@@ -116,93 +199,263 @@ class LLMService:
         if not session_id:
             session_id = f"session_{uuid.uuid4()}"
             await self.mongo_services.create_conversation(session_id)  # No more user_id
-            self.conversation_store[session_id] = InMemoryHistory()
+            self.conversation_store.set(session_id, InMemoryHistory())
             return SessionContext(session_id=session_id, history=[])
             
-        if session_id not in self.conversation_store:
-            history = await self.mongo_services.get_conversation_history(session_id)
-            self.conversation_store[session_id] = InMemoryHistory()
-            self.conversation_store[session_id].add_messages(history)
-            return SessionContext(session_id=session_id, history=history)
-            
+        history = await self._load_session(session_id)
         return SessionContext(
             session_id=session_id,
-            history=self.conversation_store[session_id].messages
+            history=list(history.messages),
+            first_seq=history.first_seq,
+            summary=history.summary,
+            summary_covered=history.summary_covered
         )
 
+    @staticmethod
+    def _turn_metadata(teacher_id: Optional[str], use_rag: bool) -> Optional[Dict[str, Any]]:
+        metadata = {}
+        if teacher_id:
+            metadata["teacher_id"] = teacher_id
+        if use_rag:
+            metadata["use_rag"] = True
+        return metadata or None
+
     async def _save_interaction(self, 
                               session: SessionContext, 
                               user_message: str, 
-                              assistant_response: str):
-        """Save interaction to database and memory"""
-        await self.mongo_services.save_message(session.session_id, "user", user_message)
-        await self.mongo_services.save_message(session.session_id, "assistant", assistant_response)
+                              assistant_response: str,
+                              metadata: Optional[Dict[str, Any]] = None):
+        """Save interaction to database (one write per turn) and memory"""
+        messages = [
+            {"role": "user", "content": user_message, "metadata": metadata},
+            {"role": "assistant", "content": assistant_response, "metadata": metadata}
+        ]
+        turn_id = uuid.uuid4().hex
+        if settings.defer_turn_writes:
+            # Écriture hors du chemin de réponse ; le cache ci-dessous sert les prochains tours
+            self.run_in_background(self._persist_turn(session.session_id, messages, turn_id))
+        else:
+            await self.mongo_services.save_turn(session.session_id, messages, turn_id)
         
-        if session.session_id not in self.conversation_store:
-            self.conversation_store[session.session_id] = InMemoryHistory()
-        
-        # Ajouter les messages à l'historique langchain
+        # Ajouter les messages à l'historique en cache (s'il a été évincé, il sera relu depuis MongoDB)
         try:
-            self.conversation_store[session.session_id].add_user_message(user_message)
-            self.conversation_store[session.session_id].add_ai_message(assistant_response)
+            if session.session_id not in self.conversation_store:
+                return
+            self.conversation_store.add_messages(session.session_id, [
+                self._history_entry("user", user_message, metadata),
+                self._history_entry("assistant", assistant_response, metadata)
+            ])
         except Exception as e:
             logger.error(f"Error updating conversation store: {str(e)}")
 
+    async def _persist_turn(self, session_id: str, messages: List[Dict[str, Any]], turn_id: str,
+                            attempts: int = 3) -> None:
+        """Deferred turn write, retried safely since save_turn is idempotent on turn_id"""
+        for attempt in range(attempts):
+            try:
+                await self.mongo_services.save_turn(session_id, messages, turn_id)
+                return
+            except Exception as e:
+                logger.error(f"Deferred turn write failed for {session_id} (attempt {attempt + 1}): {str(e)}")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def run_in_background(self, coroutine) -> asyncio.Task:
+        """Run a write off the response path; flush_background_tasks waits for it at shutdown"""
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def flush_background_tasks(self) -> None:
+        """Wait for the deferred writes and summaries still running (called at shutdown)"""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    def _history_to_messages(self, session: SessionContext) -> List[Tuple[int, BaseMessage]]:
+        """
+        Convert the cached history to LangChain messages, paired with their absolute position.
+        Messages already folded into the rolling summary are skipped.
+        """
+        messages = []
+        for offset, msg in enumerate(session.history):
+            seq = session.first_seq + offset
+            if seq < session.summary_covered:
+                continue
+            message = self._to_message(msg)
+            if message is not None:
+                messages.append((seq, message))
+        return messages
+
+    @staticmethod
+    def _to_message(msg) -> Optional[BaseMessage]:
+        if isinstance(msg, dict):
+            # C'est un dictionnaire, accéder par clés
+            role, content = msg.get("role"), msg.get("content", "")
+        else:
+            # C'est probablement un objet Message, accéder par attributs
+            role, content = getattr(msg, "role", None), getattr(msg, "content", "")
+        if role == "user":
+            return HumanMessage(content=content)
+        if role == "assistant":
+            return AIMessage(content=content)
+        # Log et ignorer les messages mal formatés
+        logger.warning(f"Message mal formaté ignoré: {msg}")
+        return None
+
+    def _schedule_summary(self,
+                          session: SessionContext,
+                          history: List[Tuple[int, BaseMessage]],
+                          dropped: int):
+        """
+        Fold into the rolling summary every message that is no longer sent to the model, off the
+        response path: the ones the context window dropped and the ones already trimmed from the cache.
+        """
+        if not settings.context_summary_enabled:
+            return
+        # Début de la fenêtre envoyée au modèle ; tout ce qui précède doit être résumé
+        kept_start = history[dropped][0] if dropped < len(history) else session.first_seq + len(session.history)
+        if kept_start <= session.summary_covered or session.session_id in self._summarizing:
+            return
+        self._summarizing.add(session.session_id)
+        task = self.run_in_background(self._update_summary(
+            session.session_id, session.summary, session.summary_covered, kept_start, history[:dropped]
+        ))
+        task.add_done_callback(lambda _: self._summarizing.discard(session.session_id))
+
+    async def _update_summary(self,
+                              session_id: str,
+                              previous_summary: Optional[str],
+                              start: int,
+                              end: int,
+                              cached: List[Tuple[int, BaseMessage]]):
+        """
+        Generate the new rolling summary of the messages [start, end) and store it alongside the
+        conversation. Messages no longer in the cache are read from MongoDB.
+        """
+        try:
+            end = min(end, start + settings.context_summary_max_messages)
+            cached_start = cached[0][0] if cached else end
+            messages = []
+            if start < cached_start:
+                stored = await self.mongo_services.get_message_range(session_id, start, min(cached_start, end))
+                messages.extend(message for message in map(self._to_message, stored) if message is not None)
+            messages.extend(msg for seq, msg in cached if start <= seq < end)
+            if not messages:
+                return
+
+            transcript = "\n".join(
+                f"{'Élève' if isinstance(msg, HumanMessage) else 'Assistant'} : {msg.content}"
+                for msg in messages
+            )
+            response = await self.llm.agenerate([[
+                SystemMessage(content=self.summary_system_prompt),
+                HumanMessage(content=f"Résumé actuel :\n{previous_summary or '(aucun)'}\n\n"
+                                     f"Nouveaux échanges :\n{transcript}")
+            ]])
+            summary = response.generations[0][0].text
+            await self.mongo_services.save_conversation_summary(session_id, summary, end)
+            self.context_builder.record_summary()
+
+            cached_history = self.conversation_store.get(session_id)
+            if cached_history is not None and end > cached_history.summary_covered:
+                cached_history.summary = summary
+                cached_history.summary_covered = end
+        except Exception as e:
+            logger.error(f"Summary update failed: {str(e)}")
+
+    def _is_stateless(self, session: SessionContext) -> bool:
+        """A turn can use the semantic cache when the answer does not depend on the conversation"""
+        return session.first_seq + len(session.history) <= settings.semantic_cache_max_history
+
+    async def _cached_answer(self,
+                             message: str,
+                             session: SessionContext,
+                             teacher_id: Optional[str],
+                             use_rag: bool,
+                             context_chunks: Optional[List[Dict[str, Any]]] = None):
+        """Look the question up in the semantic cache; returns (answer, vector) or (None, None) if not applicable"""
+        if self.semantic_cache is None or not settings.semantic_cache_enabled or not self._is_stateless(session):
+            return None, None
+        if context_chunks is not None:
+            # Passages choisis par l'appelant (filtres de /query) : la réponse dépend d'eux
+            # et pas seulement de la question
+            return None, None
+        return await self.semantic_cache.lookup(self.semantic_cache.namespace(teacher_id, use_rag), message)
+
+    async def _prepare_response(self,
+                                message: str,
+                                session: SessionContext,
+                                teacher_id: Optional[str] = None,
+                                use_rag: bool = False,
+                                context_chunks: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[Tuple[int, BaseMessage]], ContextWindow]:
+        """
+        Build the prompt shared by generate_response and stream_response.
+        With use_rag, `context_chunks` already retrieved by the caller are used as is;
+        the vector search only runs when they are not provided.
+        """
+        # Prepare the base messages
+        system_messages = []
+        system_tokens = None
+        
+        # Add appropriate system message
+        if teacher_id:
+            teacher = await self.teacher_registry.get(teacher_id)
+            if teacher is None:
+                raise ValueError(f"Teacher {teacher_id} not found")
+            system_messages.append(teacher.system_message)
+            system_tokens = teacher.prompt_tokens
+        elif use_rag:
+            # Get relevant documents for RAG
+            relevant_docs = context_chunks
+            if relevant_docs is None:
+                relevant_docs = await self.mongo_services.similarity_search(message)
+            if relevant_docs:
+                rag_context = "\n\n".join(doc["text"] for doc in relevant_docs)
+                system_messages.append(SystemMessage(content=self.rag_system_prompt + rag_context))
+        else:
+            system_messages.append(SystemMessage(content=self.default_system_prompt))
+
+        # Keep the system prompt, the rolling summary and the most recent turns within the token budget
+        history = self._history_to_messages(session)
+        window = self.context_builder.build(
+            system_messages,
+            [msg for _, msg in history],
+            HumanMessage(content=message),
+            summary=session.summary,
+            system_tokens=system_tokens
+        )
+        return history, window
+
     async def generate_response(self,
                               message: str,
                               session_id: Optional[str] = None,
                               teacher_id: Optional[str] = None,
-                              use_rag: bool = False) -> str:
+                              use_rag: bool = False,
+                              context_chunks: Optional[List[Dict[str, Any]]] = None) -> str:
         """Unified response generation method"""
         try:
             session = await self._ensure_session(session_id)
-            
-            # Prepare the base messages
-            messages = []
-            
-            # Add appropriate system message
-            if teacher_id:
-                teacher_data = await self.mongo_services.get_teacher(teacher_id)
-                if not teacher_data:
-                    raise ValueError(f"Teacher {teacher_id} not found")
-                messages.append(SystemMessage(content=teacher_data["prompt_instructions"]))
-            elif use_rag:
-                # Get relevant documents for RAG
-                relevant_docs = await self.mongo_services.similarity_search(message)
-                if relevant_docs:
-                    rag_context = "\n\n".join(doc["text"] for doc in relevant_docs)
-                    messages.append(SystemMessage(content=self.rag_system_prompt + rag_context))
-            else:
-                messages.append(SystemMessage(content=self.default_system_prompt))
-
-            # Add conversation history if exists
-            for msg in session.history:
-                if isinstance(msg, dict):
-                    # C'est un dictionnaire, accéder par clés
-                    if msg.get("role") == "user":
-                        messages.append(HumanMessage(content=msg.get("content", "")))
-                    elif msg.get("role") == "assistant":
-                        messages.append(AIMessage(content=msg.get("content", "")))
-                else:
-                    # C'est probablement un objet Message, accéder par attributs
-                    try:
-                        if hasattr(msg, "role") and msg.role == "user":
-                            messages.append(HumanMessage(content=msg.content))
-                        elif hasattr(msg, "role") and msg.role == "assistant":
-                            messages.append(AIMessage(content=msg.content))
-                    except AttributeError:
-                        # Log et ignorer les messages mal formatés
-                        logger.warning(f"Message mal formaté ignoré: {msg}")
-
-            # Add the current message
-            messages.append(HumanMessage(content=message))
+
+            cached, vector = await self._cached_answer(message, session, teacher_id, use_rag, context_chunks)
+            if cached is not None:
+                await self._save_interaction(session, message, cached, self._turn_metadata(teacher_id, use_rag))
+                return cached
+
+            history, window = await self._prepare_response(message, session, teacher_id, use_rag, context_chunks)
 
             # Generate response
-            response = await self.llm.agenerate([messages])
+            started = time.perf_counter()
+            response = await self.llm.agenerate([window.messages])
             response_text = response.generations[0][0].text
 
+            if vector is not None:
+                self.semantic_cache.record_llm_call(time.perf_counter() - started)
+                self.semantic_cache.store(self.semantic_cache.namespace(teacher_id, use_rag),
+                                          message, vector, response_text)
+
             # Save interaction
-            await self._save_interaction(session, message, response_text)
+            await self._save_interaction(session, message, response_text, self._turn_metadata(teacher_id, use_rag))
+            self._schedule_summary(session, history, window.dropped_messages)
 
             return response_text
 
@@ -210,12 +463,83 @@ class LLMService:
             logger.error(f"Response generation failed: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def stream_response(self,
+                              message: str,
+                              session_id: Optional[str] = None,
+                              teacher_id: Optional[str] = None,
+                              use_rag: bool = False,
+                              context_chunks: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, AsyncIterator[str]]:
+        """
+        Streaming variant of generate_response.
+        The prompt is prepared before returning (so errors surface as HTTP errors),
+        then the returned iterator yields the tokens as the model produces them and
+        persists the full answer once the stream completes.
+        """
+        try:
+            session = await self._ensure_session(session_id)
+            cached, vector = await self._cached_answer(message, session, teacher_id, use_rag, context_chunks)
+            if cached is None:
+                history, window = await self._prepare_response(message, session, teacher_id, use_rag, context_chunks)
+        except Exception as e:
+            logger.error(f"Response generation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        async def tokens() -> AsyncIterator[str]:
+            if cached is not None:
+                # Réponse déjà connue : un seul morceau
+                yield cached
+                await self._save_interaction(session, message, cached, self._turn_metadata(teacher_id, use_rag))
+                return
+
+            chunks = []
+            started = time.perf_counter()
+            async for chunk in self.llm.astream(window.messages):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+            response_text = "".join(chunks)
+
+            if vector is not None:
+                self.semantic_cache.record_llm_call(time.perf_counter() - started)
+                self.semantic_cache.store(self.semantic_cache.namespace(teacher_id, use_rag),
+                                          message, vector, response_text)
+
+            # Persisté uniquement si le flux est allé jusqu'au bout
+            await self._save_interaction(session, message, response_text, self._turn_metadata(teacher_id, use_rag))
+            self._schedule_summary(session, history, window.dropped_messages)
+
+        return session.session_id, tokens()
+
 
     @property
     def default_system_prompt(self) -> str:
         return """Vous êtes un assistant utile et concis qui retourne ses réponses en format Markdown. 
         Répondez toujours avec un formatage clair, en utilisant des titres, des listes."""
 
+    @property
+    def summary_system_prompt(self) -> str:
+        return """Tu résumes une conversation entre un élève et un assistant pédagogique.
+        Mets à jour le résumé actuel avec les nouveaux échanges en quelques phrases :
+        garde les notions abordées, les questions de l'élève et ses difficultés.
+        Réponds uniquement avec le résumé."""
+
+    @property
+    def evaluation_system_prompt(self) -> str:
+        return """Vous êtes un assistant d'évaluation pédagogique.
+        Pour chaque question fournie, comparez la réponse de l'élève à la solution.
+        Si "is_correct" est déjà donné, la correction est faite : rédigez seulement un retour utile.
+        S'il vaut null, décidez si la réponse est correcte (soyez indulgent avec les fautes
+        d'orthographe mineures et les variations de formatage).
+        
+        Retournez UNIQUEMENT un JSON valide :
+        {
+        "feedback": "Retour global sur la performance",
+        "explanation": "Explication des réponses incorrectes",
+        "question_feedback": [
+            {"question_number": 1, "is_correct": true/false, "feedback": "Retour pour cette question"}
+        ]
+        }"""
+
     @property
     def rag_system_prompt(self) -> str:
         return """Tu es un assistant pédagogue expert qui génère des réponses précises et utiles basées sur le contexte fourni.
@@ -283,73 +607,35 @@ class LLMService:
                                difficulty: str,
                                number_of_questions: int,
                                session_id: Optional[str] = None,
-                               teacher_id: Optional[str] = None) -> ExerciseResponse:
-        """Generate exercises based on subject and parameters"""
+                               teacher_id: Optional[str] = None,
+                               use_pool: bool = True) -> ExerciseResponse:
+        """Generate exercises based on subject and parameters, reusing pooled variants when possible"""
         try:
-            session = await self._ensure_session(session_id)
-            
-            # Craft a specialized system prompt for exercise generation
-            exercise_system_prompt = f"""You are an expert educational exercise creator specialized in {subject}.
-            Create {number_of_questions} {difficulty}-level {exercise_type.value} questions about {topic}.
-            
-            Follow these guidelines:
-            1. Questions should be clear, precise, and appropriate for the {difficulty} difficulty level
-            2. For multiple-choice questions, include 4 options with exactly one correct answer
-            3. For math questions, use proper LaTeX formatting
-            4. Include detailed explanations for the solution
-            5. Return your response as structured data suitable for parsing
-            6. If a {teacher_id} is given make sure that the subject of the teacher matches the {subject} of the exercise.
+            use_pool = use_pool and settings.exercise_pool_enabled
+            pool_key = exercise_cache_key(subject, topic, exercise_type.value, difficulty,
+                                          number_of_questions, teacher_id)
+            if use_pool:
+                pooled = await self.exercise_pool.get(pool_key)
+                if pooled is not None:
+                    return pooled
             
-            Format your response in the following structure:
-            {{
-              "exercise": {{
-                "instructions": "Brief instructions for the exercise",
-                "questions": [
-                  {{ 
-                    "question": "Question text",
-                    "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
-                    "type": "{exercise_type.value}"
-                  }}
-                  // Additional questions...
-                ]
-              }},
-              "solutions": {{
-                "answers": [
-                  {{ 
-                    "correct_answer": "The correct answer or index", 
-                    "correct_option": 2  // For multiple-choice questions
-                  }}
-                  // Additional answers...
-                ],
-                "explanations": [
-                  "Detailed explanation for question 1",
-                  // Additional explanations...
-                ]
-              }}
-            }}
-            """
-            
-            messages = []
-            
-            # Use the teacher's style if available
-            if teacher_id:
-                teacher_data = await self.mongo_services.get_teacher(teacher_id)
-                if teacher_data:
-                    # Combine teacher prompt with exercise creation instructions
-                    combined_prompt = f"{teacher_data['prompt_instructions']}\n\n{exercise_system_prompt}"
-                    messages.append(SystemMessage(content=combined_prompt))
-                else:
-                    messages.append(SystemMessage(content=exercise_system_prompt))
-            else:
-                messages.append(SystemMessage(content=exercise_system_prompt))
+            session = await self._ensure_session(session_id)
             
-            # Add the exercise request as a message
-            messages.append(HumanMessage(
-                content=f"Please create {number_of_questions} {difficulty} level exercises about {topic} in {subject} using {exercise_type.value} format."
-            ))
+            # Persona du professeur et instructions forment un préfixe stable, les paramètres viennent en dernier
+            teacher = await self.teacher_registry.get(teacher_id) if teacher_id else None
+            prompt = self.prompts.render(
+                "exercise.generate",
+                teacher=teacher,
+                subject=subject,
+                topic=topic,
+                exercise_type=exercise_type.value,
+                difficulty=difficulty,
+                number_of_questions=number_of_questions
+            )
             
             # Generate response
-            response = await self.llm.agenerate([messages])
+            response = await self.llm.agenerate([prompt.messages])
+            self.prompts.record(prompt, response)
             response_text = response.generations[0][0].text
             
             # Parse the JSON response
@@ -388,10 +674,20 @@ class LLMService:
                             explanations=exercise_data["solutions"]["explanations"]
                         )
 
-                    return ExerciseResponse(
+                    exercise_response = ExerciseResponse(
                         exercise=exercise_content,
                         solutions=solutions
                     )
+                    if use_pool:
+                        await self.exercise_pool.add(pool_key, {
+                            "subject": subject,
+                            "topic": topic,
+                            "exercise_type": exercise_type.value,
+                            "difficulty": difficulty,
+                            "number_of_questions": number_of_questions,
+                            "teacher_id": teacher_id,
+                        }, exercise_response)
+                    return exercise_response
                 except json.JSONDecodeError:
                     raise ValueError("Failed to parse exercise data from LLM response")
             else:
@@ -401,6 +697,83 @@ class LLMService:
             logger.error(f"Exercise generation failed: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
     
+    async def grade_submission(self, exercise: Dict[str, Any], user_answers: List[Any]) -> Dict[str, Any]:
+        """
+        Grade a submission for a stored exercise. Objective questions are scored locally;
+        wrong and open answers are sent to the LLM in a single call for feedback.
+        """
+        grades = self.grader.grade(exercise, user_answers)
+        graded_locally = sum(1 for grade in grades if grade.graded_locally)
+        pending = [grade for grade in grades
+                   if grade.needs_llm and grade.student_answer not in (None, "")]
+
+        llm_result = {}
+        if pending:
+            try:
+                llm_result = await self._grade_with_llm(exercise, pending)
+            except Exception as e:
+                # Sans le LLM, seules les questions déjà corrigées localement ont un verdict
+                if any(grade.is_correct is None for grade in pending):
+                    raise
+                logger.error(f"Evaluation feedback failed, keeping local grades: {str(e)}")
+
+        feedback_by_number = {
+            item.get("question_number"): item
+            for item in llm_result.get("question_feedback", [])
+            if isinstance(item, dict)
+        }
+        for grade in pending:
+            item = feedback_by_number.get(grade.question_number, {})
+            if grade.is_correct is None:
+                grade.is_correct = bool(item.get("is_correct", False))
+            if item.get("feedback"):
+                grade.feedback = item["feedback"]
+
+        result = self.grader.summarize(grades)
+        if llm_result.get("feedback"):
+            result["feedback"] = f"{result['feedback']} {llm_result['feedback']}"
+        result["explanation"] = llm_result.get("explanation", "")
+        result["graded_locally"] = graded_locally
+        return result
+
+    async def _grade_with_llm(self, exercise: Dict[str, Any], grades: List[QuestionGrade]) -> Dict[str, Any]:
+        """One LLM call for all the questions needing a verdict or feedback"""
+        import json
+        import re
+
+        questions = (exercise.get("exercise") or {}).get("questions", [])
+        solutions = exercise.get("solutions") or {}
+        answers = solutions.get("answers", [])
+        explanations = solutions.get("explanations", [])
+
+        items = []
+        for grade in grades:
+            index = grade.question_number - 1
+            items.append({
+                "question_number": grade.question_number,
+                "question": questions[index] if index < len(questions) else None,
+                "solution": answers[index] if index < len(answers) else None,
+                "solution_explanation": explanations[index] if index < len(explanations) else None,
+                "student_answer": grade.student_answer,
+                "is_correct": grade.is_correct,
+            })
+
+        messages = [
+            SystemMessage(content=self.evaluation_system_prompt),
+            HumanMessage(content=json.dumps(items, ensure_ascii=False, default=str))
+        ]
+        self.grader.record_llm_call(len(grades))
+        response = await self.llm.agenerate([messages])
+        response_text = response.generations[0][0].text
+
+        json_match = re.search(r'({[\s\S]*})', response_text)
+        if not json_match:
+            raise ValueError("No valid evaluation data found in response")
+        try:
+            return json.loads(json_match.group(1))
+        except json.JSONDecodeError:
+            raise ValueError("Failed to parse evaluation data")
+
     async def evaluate_answer(self,
                             exercise_id: str,
                             student_answer: str,
@@ -412,39 +785,34 @@ class LLMService:
             if not exercise_data:
                 raise ValueError(f"Exercise with ID {exercise_id} not found")
             
-            session = await self._ensure_session(session_id)
-            
-            evaluation_prompt = f"""You are an expert educational evaluator. 
-            Evaluate the student's answer to the following question:
-            
-            Question: {exercise_data['question']}
-            
-            Correct answer: {exercise_data['correct_answer']}
+            # Les questions fermées sont corrigées localement ; une bonne réponse n'a pas besoin du LLM
+            local_grade = self.grader.grade_question(
+                QuestionGrade(question_number=1,
+                              question_type=exercise_data.get("exercise_type", ""),
+                              student_answer=student_answer),
+                {"options": exercise_data.get("options")},
+                {"correct_answer": exercise_data.get("correct_answer")}
+            )
+            if local_grade.is_correct:
+                return EvaluationResult(
+                    is_correct=True,
+                    score=1.0,
+                    feedback=local_grade.feedback,
+                    explanation=exercise_data.get("explanation", "")
+                )
             
-            Student's answer: {student_answer}
-            
-            Provide an evaluation with:
-            1. Whether the answer is correct (true/false)
-            2. A score from 0.0 to 1.0
-            3. Constructive feedback
-            4. A detailed explanation of the correct answer
-            
-            Format your response as JSON:
-            {{
-              "is_correct": true/false,
-              "score": 0.0-1.0,
-              "feedback": "Your feedback here",
-              "explanation": "Detailed explanation here"
-            }}
-            """
+            session = await self._ensure_session(session_id)
             
-            messages = [
-                SystemMessage(content=evaluation_prompt),
-                HumanMessage(content=f"Please evaluate this answer: {student_answer}")
-            ]
+            prompt = self.prompts.render(
+                "exercise.evaluate",
+                question=exercise_data['question'],
+                correct_answer=exercise_data['correct_answer'],
+                student_answer=student_answer
+            )
             
             # Generate evaluation
-            response = await self.llm.agenerate([messages])
+            response = await self.llm.agenerate([prompt.messages])
+            self.prompts.record(prompt, response)
             response_text = response.generations[0][0].text
             
             # Parse JSON response
@@ -456,6 +824,10 @@ class LLMService:
                 json_str = json_match.group(1)
                 try:
                     evaluation_data = json.loads(json_str)
+                    if local_grade.is_correct is False:
+                        # Le verdict local prime, le LLM ne fournit que le retour
+                        evaluation_data["is_correct"] = False
+                        evaluation_data["score"] = 0.0
                     return EvaluationResult(
                         is_correct=evaluation_data["is_correct"],
                         score=evaluation_data["score"],
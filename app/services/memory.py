@@ -2,9 +2,10 @@
 """
 Gestion de la mémoire des conversations
 """
+import time
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import BaseMessage
-from typing import List
+from typing import List, Optional
 
 class InMemoryHistory(BaseChatMessageHistory):
     """
@@ -12,16 +13,30 @@ class InMemoryHistory(BaseChatMessageHistory):
     Pour un environnement de production, considérer une solution persistante comme Redis.
     """
     def __init__(self, *args) -> None:
-        self.messages: List[BaseMessage] = args if args else []
-    
+        self.messages: List[BaseMessage] = list(args)
+        self.last_access: float = time.monotonic()
+        # Position absolue du premier message gardé et résumé glissant des messages plus anciens
+        self.first_seq: int = 0
+        self.summary: Optional[str] = None
+        self.summary_covered: int = 0
+
     def add_messages(self, messages: List[BaseMessage]) -> None:
         """Ajoute une série de messages à l'historique"""
         self.messages.extend(messages)
-    
+        self.touch()
+
     def clear(self) -> None:
         """Réinitialise l'historique de la conversation"""
         self.messages = []
 
+    def touch(self) -> None:
+        """Met à jour la date du dernier accès"""
+        self.last_access = time.monotonic()
+
+    def is_active(self, ttl_seconds: float) -> bool:
+        """Indique si la session a été utilisée depuis moins de ttl_seconds"""
+        return time.monotonic() - self.last_access < ttl_seconds
+
     async def aget_messages(self) -> List[BaseMessage]:
         """Récupère l'historique des messages de façon asynchrone"""
-        return self.messages.copy()
\ No newline at end of file
+        return self.messages.copy()
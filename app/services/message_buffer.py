@@ -0,0 +1,246 @@
+# services/message_buffer.py
+"""
+Tampon d'écriture des messages (write-behind) : les écritures de conversation sont mises en file
+puis envoyées groupées à MongoDB (un bulk_write par flush, une opération par écriture) toutes les
+quelques millisecondes ou dès que le lot est plein.
+
+Durabilité "sync" : l'appelant attend le flush qui contient son écriture (group commit).
+Durabilité "async" : l'écriture est acquittée dès sa mise en tampon, le flush se fait en arrière-plan.
+Chaque écriture porte un identifiant (turn_id) vérifié par sa propre opération : les reprises après
+erreur sont idempotentes sans empêcher l'écriture voisine d'une même session.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+from core.config import settings
+
+DURABILITY_MODES = ("sync", "async")
+
+
+@dataclass
+class PendingWrite:
+    session_id: str
+    messages: List[Dict[str, Any]]
+    write_id: str
+    future: Optional[asyncio.Future] = None
+    # Écriture identique (même session et même turn_id) plus tôt dans le lot
+    original: Optional["PendingWrite"] = None
+    result: Any = None
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind buffer of conversation messages flushed with MongoDBService.bulk_append_messages.
+    Flushes are serialized, so the messages of a session keep their order across batches;
+    within a batch, the k-th writes of the sessions are sent together, in arrival order.
+    """
+    def __init__(self,
+                 mongo_service,
+                 durability: str = "sync",
+                 flush_interval_ms: float = 5,
+                 batch_size: int = 200,
+                 max_pending: int = 10_000,
+                 max_retries: int = 3,
+                 retry_base_delay: float = 0.2):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown write durability: {durability}")
+        self.mongo_service = mongo_service
+        self.durability = durability
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+        self._pending: List[PendingWrite] = []
+        self._pending_messages = 0
+        self._sessions: Counter = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"writes": 0, "messages": 0, "flushes": 0, "operations": 0, "duplicates": 0,
+                       "retries": 0, "failed_messages": 0, "max_backlog": 0, "backpressure_waits": 0,
+                       "flush_seconds": 0.0}
+
+    @classmethod
+    def from_settings(cls, mongo_service) -> "MessageWriteBuffer":
+        return cls(
+            mongo_service,
+            durability=settings.message_write_durability,
+            flush_interval_ms=settings.message_flush_interval_ms,
+            batch_size=settings.message_flush_batch_size,
+            max_pending=settings.message_buffer_max_pending,
+        )
+
+    ####################### Mise en tampon #######################
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]], write_id: str) -> bool:
+        """
+        Buffer the messages of one write. In sync mode, returns once they are in MongoDB
+        (False if the write was already saved); in async mode, returns True right away.
+        """
+        if self._pending_messages >= self.max_pending:
+            # Contre-pression : MongoDB ne suit plus, on attend le flush au lieu de grossir la file
+            self._stats["backpressure_waits"] += 1
+            await self.flush()
+
+        future = asyncio.get_running_loop().create_future() if self.durability == "sync" else None
+        self._pending.append(PendingWrite(session_id, messages, write_id, future))
+        self._pending_messages += len(messages)
+        self._sessions[session_id] += 1
+        self._stats["writes"] += 1
+        self._stats["max_backlog"] = max(self._stats["max_backlog"], self._pending_messages)
+        self._schedule()
+        return await future if future is not None else True
+
+    def pending(self, session_id: str) -> bool:
+        """True while writes of the session are buffered or being flushed"""
+        return self._sessions[session_id] > 0
+
+    async def sync(self, session_id: str) -> None:
+        """Make the buffered writes of a session visible in MongoDB before reading it"""
+        if self.pending(session_id):
+            await self.flush()
+
+    ####################### Flush #######################
+
+    def _schedule(self) -> None:
+        if self._pending_messages >= self.batch_size:
+            self._spawn(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = self._spawn(self._flush_later())
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns the number of messages flushed"""
+        flushed = 0
+        async with self._flush_lock:
+            while self._pending:
+                batch, size = [], 0
+                while self._pending and (not batch or size + len(self._pending[0].messages) <= self.batch_size):
+                    write = self._pending.pop(0)
+                    batch.append(write)
+                    size += len(write.messages)
+                self._pending_messages -= size
+                try:
+                    await self._write(batch)
+                finally:
+                    for write in batch:
+                        self._sessions[write.session_id] -= 1
+                        if not self._sessions[write.session_id]:
+                            del self._sessions[write.session_id]
+                flushed += size
+        return flushed
+
+    async def _write(self, batch: List[PendingWrite]) -> None:
+        """One bulk write per round of the batch (usually one); the failed writes are retried with backoff"""
+        start = time.perf_counter()
+        writes = self._dedupe(batch)
+        for round_writes in self._rounds(writes):
+            await self._write_round(round_writes)
+        for write in batch:
+            if write.original is not None:
+                # Rejeu dans le même lot : déjà enregistré par la première écriture (ou perdu avec elle)
+                self._stats["duplicates"] += 1
+                error = write.original.result if isinstance(write.original.result, Exception) else None
+                self._resolve(write, error or False)
+        self._stats["flushes"] += 1
+        self._stats["flush_seconds"] += time.perf_counter() - start
+
+    async def _write_round(self, writes: List[PendingWrite]) -> None:
+        for attempt in range(self.max_retries + 1):
+            self._stats["operations"] += len(writes)
+            try:
+                results = await self.mongo_service.bulk_append_messages(
+                    [(write.session_id, write.messages, [write.write_id]) for write in writes]
+                )
+            except Exception as e:
+                results = [e] * len(writes)
+            failed = []
+            for write, result in zip(writes, results):
+                if isinstance(result, Exception):
+                    failed.append((write, result))
+                    continue
+                if result:
+                    self._stats["messages"] += len(write.messages)
+                else:
+                    self._stats["duplicates"] += 1
+                self._resolve(write, result)
+            writes = [write for write, _ in failed]
+            if not failed:
+                break
+            if attempt < self.max_retries:
+                self._stats["retries"] += 1
+                logging.warning(f"Buffered message write failed for {len(failed)} writes, retrying")
+                await asyncio.sleep(self.retry_base_delay * 2 ** attempt)
+        else:
+            for write, error in failed:
+                self._stats["failed_messages"] += len(write.messages)
+                logging.error(f"Buffered messages of session {write.session_id} lost: {str(error)}")
+                self._resolve(write, error)
+
+    @staticmethod
+    def _dedupe(batch: List[PendingWrite]) -> List[PendingWrite]:
+        """Writes to send: a write_id seen earlier in the batch for the same session is only pushed once"""
+        first: Dict[Tuple[str, str], PendingWrite] = {}
+        writes = []
+        for write in batch:
+            original = first.setdefault((write.session_id, write.write_id), write)
+            if original is write:
+                writes.append(write)
+            else:
+                write.original = original
+        return writes
+
+    @staticmethod
+    def _rounds(writes: List[PendingWrite]) -> List[List[PendingWrite]]:
+        # Une opération par écriture : la k-ième écriture de chaque session part dans le k-ième bulk_write,
+        # l'ordre des messages d'une session ne dépend donc pas de l'exécution non ordonnée du bulk_write
+        rounds: List[List[PendingWrite]] = []
+        positions: Counter = Counter()
+        for write in writes:
+            position = positions[write.session_id]
+            positions[write.session_id] += 1
+            if position == len(rounds):
+                rounds.append([])
+            rounds[position].append(write)
+        return rounds
+
+    @staticmethod
+    def _resolve(write: PendingWrite, result) -> None:
+        write.result = result
+        if write.future is None or write.future.done():
+            return
+        if isinstance(result, Exception):
+            write.future.set_exception(result)
+        else:
+            write.future.set_result(result)
+
+    async def close(self) -> None:
+        """Flush the remaining writes (called at shutdown)"""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        flushes = self._stats["flushes"]
+        return {
+            **self._stats,
+            "durability": self.durability,
+            "backlog": self._pending_messages,
+            "pending_sessions": len(self._sessions),
+            "avg_batch_messages": self._stats["messages"] / flushes if flushes else 0.0,
+            "avg_flush_ms": 1000 * self._stats["flush_seconds"] / flushes if flushes else 0.0,
+        }
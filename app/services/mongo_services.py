@@ -1,5 +1,11 @@
 import os
 import asyncio
+import base64
+import hashlib
+import json
+import random
+import unicodedata
+import uuid
 from asyncio.log import logger
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,7 +15,7 @@ from langchain.vectorstores import MongoDBAtlasVectorSearch
 from core.config import settings
 import threading
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from PyPDF2 import PdfReader
@@ -17,7 +23,14 @@ from io import BytesIO
 from bs4 import BeautifulSoup
 from models.conversation import Conversation, Message
 from models.teacher import Teacher
-from pymongo import UpdateOne
+from bson import ObjectId
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from services.vector_index import LocalVectorIndex, VectorIndex, create_vector_index
+from services.lexical_index import BM25Index
+from services.retrieval import HybridRetriever
+from services.indexes import IndexManager
+from services.message_buffer import MessageWriteBuffer
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -25,9 +38,13 @@ class MongoDBService:
     """
     Unified MongoDB service handling both conversation management and RAG functionality
     """
-    def __init__(self):
-        """Initialize the MongoDB service"""
-        self.client = AsyncIOMotorClient(settings.mongodb_uri)
+    def __init__(self,
+                 client: Optional[AsyncIOMotorClient] = None,
+                 embeddings: Optional[OpenAIEmbeddings] = None,
+                 vector_index: Optional[VectorIndex] = None,
+                 semantic_cache=None):
+        """Initialize the MongoDB service, reusing shared clients when provided"""
+        self.client = client if client is not None else AsyncIOMotorClient(settings.mongodb_uri)
         self.db = self.client[settings.database_name]
         
         # Collection references
@@ -35,11 +52,26 @@ class MongoDBService:
         self.teachers = self.db[settings.teachers_database]
         self.rag_collection = self.db[settings.rag_database_name]
         self.exercises = self.db[settings.exercises_database]
+        self.pooled_exercises = self.db[settings.exercise_pool_collection]
+        self.message_buckets = self.db[settings.message_buckets_collection]
+        self.intent_logs = self.db[settings.intent_logs_collection]
+        self.ingestion_jobs = self.db[settings.ingestion_jobs_collection]
         
         # RAG-specific setup
-        self.embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+        self.embeddings = embeddings if embeddings is not None else OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
         self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        # Index utilisé par similarity_search, local (NumPy) ou Atlas selon VECTOR_BACKEND
+        self.vector_index = vector_index if vector_index is not None else create_vector_index(self.rag_collection)
+        # Index BM25 des mêmes chunks, fusionné avec l'index vectoriel par le retriever hybride
+        self.lexical_index = BM25Index()
+        self.retriever = HybridRetriever.from_settings(self.embeddings, self.vector_index, self.lexical_index)
+        # Cache sémantique des réponses : les réponses RAG sont oubliées dès que le corpus change
+        self.semantic_cache = semantic_cache
         self.lock = threading.Lock()  
+        # Écritures des messages regroupées en bulk_write (services/message_buffer.py), désactivé par défaut
+        self.write_buffer = MessageWriteBuffer.from_settings(self) if settings.message_write_buffer else None
+        # Numéros de séquence réservés (en-tête écrit) pour des tours dont les buckets ne sont pas encore écrits
+        self._reserved_turns: Dict[Tuple[str, Tuple[str, ...]], Tuple[int, int]] = {}
         
         self.vector_store = MongoDBAtlasVectorSearch(
             collection=self.rag_collection,
@@ -55,18 +87,22 @@ class MongoDBService:
     #############################################
     
     async def close(self):
-        """Close the MongoDB connection"""
+        """Flush the buffered message writes and close the MongoDB connection"""
+        if self.write_buffer is not None:
+            await self.write_buffer.close()
         self.client.close()
         logging.debug("MongoDB connection closed.")
         
-    def clear(self) -> None:
+    async def clear(self) -> None:
         """
         Clears the MongoDB collection.
         """
-        with self.lock:
-            logging.debug("Clearing MongoDB collection...")
-            self.rag_collection.delete_many({})  # Deletes all documents
-            logging.debug("Collection cleared.")
+        logging.debug("Clearing MongoDB collection...")
+        await self.rag_collection.delete_many({})  # Deletes all documents
+        self.vector_index.clear()
+        self.lexical_index.clear()
+        self._corpus_changed()
+        logging.debug("Collection cleared.")
     
     #######################################
     # Conversation management operations  #
@@ -100,83 +136,542 @@ class MongoDBService:
         if metadata:
             message_dict["metadata"] = metadata
         
-        result = await self.conversations.update_one(
-            {"session_id": session_id},
-            {
-                "$push": {"messages": message_dict},
-                "$set": {"updated_at": datetime.utcnow()},
-                "$setOnInsert": {"created_at": datetime.utcnow()}
-            },
-            upsert=True
-        )
+        if self.write_buffer is not None:
+            # Identifiant d'écriture pour que les reprises du tampon restent idempotentes
+            message_dict["turn_id"] = uuid.uuid4().hex
+            return await self.write_buffer.append(session_id, [message_dict], message_dict["turn_id"])
+        return await self._append_messages(session_id, [message_dict])
+    
+    async def save_turn(self, session_id: str, messages: List[Dict[str, Any]], turn_id: str) -> bool:
+        """
+        Save the messages of one chat turn (user question + assistant answer) in a single write.
+        Idempotent on `turn_id`: replaying a turn already saved does not duplicate it.
+        Returns False when the turn was already saved.
+        """
+        message_dicts = []
+        for message in messages:
+            message_dict = Message(role=message["role"], content=message["content"]).model_dump()
+            if message.get("metadata"):
+                message_dict["metadata"] = message["metadata"]
+            message_dict["turn_id"] = turn_id
+            message_dicts.append(message_dict)
+        if self.write_buffer is not None:
+            return await self.write_buffer.append(session_id, message_dicts, turn_id)
+        return await self._append_messages(session_id, message_dicts, turn_ids=[turn_id])
+    
+    @staticmethod
+    def _append_operation(session_id: str, message_dicts: List[Dict[str, Any]],
+                          turn_ids: Optional[List[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Filter and update appending messages to an embedded conversation, skipped if a turn is already saved"""
+        query = {"session_id": session_id}
+        if turn_ids:
+            query["messages.turn_id"] = {"$nin": turn_ids}
+        now = datetime.utcnow()
+        update = {
+            "$push": {"messages": {"$each": message_dicts}},
+            "$inc": {"message_count": len(message_dicts)},
+            "$set": {"updated_at": now, **MongoDBService._header_fields(message_dicts)},
+            "$setOnInsert": {"created_at": now}
+        }
+        return query, update
+    
+    @staticmethod
+    def _header_fields(message_dicts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Denormalized fields of the conversation header used by the session listing (never reads the messages)"""
+        last = message_dicts[-1]
+        fields = {"last_message": {
+            "role": last["role"],
+            "content": last["content"][:settings.sessions_preview_chars],
+            "timestamp": last.get("timestamp")
+        }}
+        teacher_id = (last.get("metadata") or {}).get("teacher_id")
+        if teacher_id:
+            fields["teacher_id"] = teacher_id
+        return fields
+    
+    async def _append_messages(self, session_id: str, message_dicts: List[Dict[str, Any]],
+                               turn_ids: Optional[List[str]] = None) -> bool:
+        """Append already formatted messages using the configured storage mode"""
+        if settings.message_storage == "bucketed":
+            return await self._append_bucketed(session_id, message_dicts, turn_ids)
+        
+        query, update = self._append_operation(session_id, message_dicts, turn_ids)
+        try:
+            result = await self.conversations.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Tour déjà enregistré : le filtre ne correspond plus et l'upsert heurte l'index unique sur session_id
+            return False
         
         return result.modified_count > 0 or result.upserted_id is not None
     
+    async def bulk_append_messages(self, writes: List[Tuple[str, List[Dict[str, Any]], List[str]]]) -> List[Any]:
+        """
+        Append several writes, given as (session_id, messages, turn_ids), in one unordered bulk write:
+        at most one write per session, the write buffer sends the next ones in a later call.
+        Returns, per write, True if saved, False if already saved, or the exception to retry.
+        """
+        if settings.message_storage == "bucketed":
+            # Réservation des numéros de séquence : une écriture d'en-tête par session, en parallèle
+            return list(await asyncio.gather(
+                *(self._append_bucketed(session_id, messages, turn_ids) for session_id, messages, turn_ids in writes),
+                return_exceptions=True
+            ))
+        
+        operations = [UpdateOne(*self._append_operation(session_id, messages, turn_ids), upsert=True)
+                      for session_id, messages, turn_ids in writes]
+        results: List[Any] = [True] * len(operations)
+        try:
+            await self.conversations.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                # 11000 : écriture déjà enregistrée (voir _append_messages)
+                results[error["index"]] = False if error.get("code") == 11000 else BulkWriteError(error)
+        return results
+    
+    async def _append_bucketed(self, session_id: str, message_dicts: List[Dict[str, Any]],
+                               turn_ids: Optional[List[str]] = None) -> bool:
+        """
+        Bucketed storage: the conversation document only keeps a header (counters, dates)
+        and messages go into fixed-size bucket documents keyed on (session_id, bucket).
+        """
+        now = datetime.utcnow()
+        query = {"session_id": session_id}
+        update = {
+            "$inc": {"message_count": len(message_dicts)},
+            "$set": {"updated_at": now, **self._header_fields(message_dicts)},
+            "$setOnInsert": {
+                "created_at": now,
+                "storage": "bucketed",
+                "bucket_size": settings.message_bucket_size
+            }
+        }
+        if turn_ids:
+            # Les derniers identifiants de tour sont gardés dans l'en-tête pour ignorer les rejeux
+            query["recent_turns"] = {"$nin": turn_ids}
+            update["$push"] = {"recent_turns": {"$each": turn_ids, "$slice": -settings.message_recent_turns}}
+        # Réserve atomiquement les numéros de séquence des nouveaux messages
+        try:
+            header = await self.conversations.find_one_and_update(
+                query,
+                update,
+                projection={"storage": 1, "message_count": 1, "bucket_size": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            if not turn_ids:
+                return False
+            # Tour déjà dans l'en-tête : rejeu d'un tour enregistré, ou reprise après l'échec de ses buckets
+            return await self._recover_turn(session_id, message_dicts, turn_ids)
+        
+        if header.get("storage") != "bucketed":
+            # Conversation pas encore migrée (voir migrate_conversations.py) : on reste en embarqué
+            result = await self.conversations.update_one(
+                {"session_id": session_id, "storage": {"$ne": "bucketed"}},
+                {"$push": {"messages": {"$each": message_dicts}}}
+            )
+            if result.matched_count:
+                return result.modified_count > 0
+            # Migrée entre la réservation et l'écriture (compteur réinitialisé par la migration) :
+            # les messages vont dans les buckets, sans les identifiants de tour déjà poussés dans l'en-tête
+            return await self._append_bucketed(session_id, message_dicts)
+        
+        bucket_size = header.get("bucket_size", settings.message_bucket_size)
+        first_seq = header["message_count"] - len(message_dicts)
+        reservation = (session_id, tuple(turn_ids or ()))
+        if turn_ids:
+            self._reserved_turns[reservation] = (first_seq, bucket_size)
+        await self._write_buckets(session_id, message_dicts, first_seq, bucket_size, turn_ids)
+        self._reserved_turns.pop(reservation, None)
+        return True
+    
+    async def _write_buckets(self, session_id: str, message_dicts: List[Dict[str, Any]], first_seq: int,
+                             bucket_size: int, turn_ids: Optional[List[str]] = None) -> None:
+        """Push messages into their buckets; with turn ids, a bucket already holding the turn is left as is"""
+        now = datetime.utcnow()
+        buckets: Dict[int, List[Dict[str, Any]]] = {}
+        for offset, message_dict in enumerate(message_dicts):
+            seq = first_seq + offset
+            buckets.setdefault(seq // bucket_size, []).append({**message_dict, "seq": seq})
+        
+        operations = []
+        for bucket, messages in buckets.items():
+            query = {"session_id": session_id, "bucket": bucket}
+            if turn_ids:
+                query["messages.turn_id"] = {"$nin": turn_ids}
+            operations.append(UpdateOne(
+                query,
+                {
+                    "$push": {"messages": {"$each": messages, "$sort": {"seq": 1}}},
+                    "$inc": {"count": len(messages)},
+                    "$set": {"updated_at": now}
+                },
+                upsert=True
+            ))
+        try:
+            await self.message_buckets.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Deux upserts concurrents sur un nouveau bucket : l'index unique en rejette un, on le rejoue
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            try:
+                await self.message_buckets.bulk_write(
+                    [operations[err["index"]] for err in e.details["writeErrors"]], ordered=False
+                )
+            except BulkWriteError as replay:
+                # Avec un identifiant de tour, le conflit persistant signifie que le bucket contient déjà le tour
+                if not turn_ids or any(err.get("code") != 11000 for err in replay.details.get("writeErrors", [])):
+                    raise
+    
+    async def _recover_turn(self, session_id: str, message_dicts: List[Dict[str, Any]], turn_ids: List[str]) -> bool:
+        """
+        Turn ids already recorded in the header. Returns False if the messages are stored; otherwise
+        writes them (at their reserved positions when this process reserved them) and returns True.
+        """
+        reservation = (session_id, tuple(turn_ids))
+        reserved = self._reserved_turns.get(reservation)
+        if reserved is not None:
+            # L'en-tête a été écrit mais pas les buckets : on les écrit aux positions réservées
+            await self._write_buckets(session_id, message_dicts, *reserved, turn_ids)
+            self._reserved_turns.pop(reservation, None)
+            return True
+        
+        turn_query = {"session_id": session_id, "messages.turn_id": {"$in": turn_ids}}
+        if await self.message_buckets.find_one(turn_query, {"_id": 1}) is not None \
+                or await self.conversations.find_one(turn_query, {"_id": 1}) is not None:
+            return False
+        # Réservation faite par un appel dont la réponse a été perdue : nouvelles positions (trou dans les seq)
+        logger.warning(f"Turn {', '.join(turn_ids)} of session {session_id} reserved but not stored, appending it again")
+        return await self._append_bucketed(session_id, message_dicts)
+    
     async def create_conversation(self, session_id: str) -> bool:
         """Create a new conversation"""
         conversation = {
             "session_id": session_id,
-            "messages": [],
+            "message_count": 0,
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
+        if settings.message_storage == "bucketed":
+            conversation["storage"] = "bucketed"
+            conversation["bucket_size"] = settings.message_bucket_size
+        else:
+            conversation["messages"] = []
         
         result = await self.conversations.insert_one(conversation)
         return result.inserted_id is not None
     
-    async def get_conversation_history(self, session_id: str) -> List[Dict]:
-        """Get conversation history"""
-        conversation = await self.conversations.find_one({"session_id": session_id})
-        formatted_messages = []
-        if conversation:
+    async def get_conversation_history(self, session_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Get conversation history, or only its `limit` most recent messages"""
+        window = await self.get_conversation_window(session_id, limit)
+        return window["messages"]
+    
+    async def get_conversation_window(self, session_id: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Get the `limit` most recent messages with the message counter and the rolling summary"""
+        if self.write_buffer is not None:
+            await self.write_buffer.sync(session_id)
+        projection = {
+            "messages": {"$slice": -limit} if limit else 1,
+            "storage": 1,
+            "message_count": 1,
+            "bucket_size": 1,
+            "summary": 1
+        }
+        conversation = await self.conversations.find_one({"session_id": session_id}, projection)
+        if not conversation:
+            return {"messages": [], "message_count": 0, "summary": None}
+        
+        if conversation.get("storage") == "bucketed":
+            messages = await self._read_buckets(session_id, conversation, limit)
+        else:
             messages = conversation.get("messages", [])
-            
-            for msg in messages:
-                # Convert datetime to string
-                if "timestamp" in msg and isinstance(msg["timestamp"], datetime):
-                    msg["timestamp"] = msg["timestamp"].isoformat()
-                    
-                # Include all fields
-                formatted_message = {
-                    "role": msg.get("role", ""),
-                    "content": msg.get("content", "")
-                }
-                
-                # Only include metadata if it exists
-                if "metadata" in msg and msg["metadata"] is not None:
-                    formatted_message["metadata"] = msg["metadata"]
+        message_count = conversation.get("message_count")
+        if message_count is None:
+            # Conversation antérieure au compteur : `messages` n'est qu'une tranche, on compte côté serveur
+            message_count = await self._count_messages(session_id)
+        return {
+            "messages": self._format_messages(messages),
+            "message_count": message_count,
+            "summary": conversation.get("summary")
+        }
+    
+    async def _count_messages(self, session_id: str) -> int:
+        cursor = self.conversations.aggregate([
+            {"$match": {"session_id": session_id}},
+            {"$project": {"count": {"$size": {"$ifNull": ["$messages", []]}}}}
+        ])
+        async for document in cursor:
+            return document["count"]
+        return 0
+    
+    async def backfill_message_counts(self) -> int:
+        """
+        Set message_count on the conversations created before the counter existed, so that the
+        $inc of the next append starts from the real number of messages. Run at startup.
+        """
+        result = await self.conversations.update_many(
+            {"message_count": {"$exists": False}},
+            [{"$set": {"message_count": {"$size": {"$ifNull": ["$messages", []]}}}}]
+        )
+        if result.modified_count:
+            logger.info(f"message_count backfilled on {result.modified_count} conversations")
+        return result.modified_count
+    
+    async def save_conversation_summary(self, session_id: str, text: str, covered: int) -> bool:
+        """Store the rolling summary of the first `covered` messages of a conversation"""
+        result = await self.conversations.update_one(
+            {"session_id": session_id, "summary.covered": {"$not": {"$gte": covered}}},
+            {"$set": {"summary": {"text": text, "covered": covered, "updated_at": datetime.utcnow()}}}
+        )
+        return result.modified_count > 0
+    
+    async def get_message_range(self, session_id: str, start: int, end: int) -> List[Dict]:
+        """Get the messages at positions [start, end) of a conversation (messages to fold into the summary)"""
+        if end <= start:
+            return []
+        if self.write_buffer is not None:
+            await self.write_buffer.sync(session_id)
+        projection = {"messages": {"$slice": [start, end - start]}, "storage": 1, "bucket_size": 1}
+        conversation = await self.conversations.find_one({"session_id": session_id}, projection)
+        if not conversation:
+            return []
+        
+        if conversation.get("storage") != "bucketed":
+            return self._format_messages(conversation.get("messages", []))
+        bucket_size = conversation.get("bucket_size", settings.message_bucket_size)
+        cursor = self.message_buckets.find(
+            {"session_id": session_id, "bucket": {"$gte": start // bucket_size, "$lte": (end - 1) // bucket_size}},
+            {"messages": 1}
+        ).sort("bucket", 1)
+        messages = []
+        async for bucket in cursor:
+            messages.extend(msg for msg in bucket.get("messages", []) if start <= msg.get("seq", 0) < end)
+        return self._format_messages(messages)
+    
+    async def _read_buckets(self, session_id: str, header: Dict[str, Any], limit: Optional[int] = None) -> List[Dict]:
+        """Read the messages of a bucketed conversation, only touching the buckets of the tail window"""
+        bucket_size = header.get("bucket_size", settings.message_bucket_size)
+        first_seq = max(0, header.get("message_count", 0) - limit) if limit else 0
+        
+        cursor = self.message_buckets.find(
+            {"session_id": session_id, "bucket": {"$gte": first_seq // bucket_size}},
+            {"messages": 1}
+        ).sort("bucket", 1)
+        
+        messages = []
+        async for bucket in cursor:
+            messages.extend(msg for msg in bucket.get("messages", []) if msg.get("seq", 0) >= first_seq)
+        return messages
+    
+    def _format_messages(self, messages: List[Dict]) -> List[Dict]:
+        """Convert stored messages to the API history format"""
+        formatted_messages = []
+        for msg in messages:
+            # Convert datetime to string
+            if "timestamp" in msg and isinstance(msg["timestamp"], datetime):
+                msg["timestamp"] = msg["timestamp"].isoformat()
                 
-                formatted_messages.append(formatted_message)
+            # Include all fields
+            formatted_message = {
+                "role": msg.get("role", ""),
+                "content": msg.get("content", "")
+            }
             
+            # Only include metadata if it exists
+            if "metadata" in msg and msg["metadata"] is not None:
+                formatted_message["metadata"] = msg["metadata"]
+            
+            formatted_messages.append(formatted_message)
+        
         return formatted_messages
-            # messages = conversation.get("messages", [])
-            # for message in messages:
-            #     if "timestamp" in message and isinstance(message["timestamp"], datetime):
-            #         message["timestamp"] = message["timestamp"].isoformat()
-                    
-                    
-            #     if "metadata" not in message:
-            #         message["metadata"] = None
-            # return messages
-        return []
     
     async def delete_conversation(self, session_id: str) -> bool:
         """Delete a conversation"""
+        if self.write_buffer is not None:
+            # Sinon un flush ultérieur recréerait la conversation
+            await self.write_buffer.sync(session_id)
         result = await self.conversations.delete_one({"session_id": session_id})
+        await self.message_buckets.delete_many({"session_id": session_id})
         return result.deleted_count > 0
     
+    async def ensure_message_indexes(self) -> None:
+        """Create the (session_id, bucket) index used by the bucketed storage"""
+        await IndexManager(self, strict=True).ensure(only=["message_buckets"])
+    
+    async def migrate_conversation_to_buckets(self, session_id: str, max_attempts: int = 5) -> int:
+        """
+        Move the embedded `messages` array of a conversation into bucket documents.
+        Returns the number of migrated messages (0 if already migrated); raises RuntimeError
+        when messages keep arriving during `max_attempts` attempts.
+        """
+        for _ in range(max_attempts):
+            if self.write_buffer is not None:
+                await self.write_buffer.sync(session_id)
+            conversation = await self.conversations.find_one({"session_id": session_id})
+            if not conversation or conversation.get("storage") == "bucketed":
+                return 0
+            
+            messages = conversation.get("messages", [])
+            bucket_size = settings.message_bucket_size
+            buckets: Dict[int, List[Dict[str, Any]]] = {}
+            for seq, message in enumerate(messages):
+                buckets.setdefault(seq // bucket_size, []).append({**message, "seq": seq})
+            
+            # Idempotent : les buckets d'une migration interrompue sont remplacés
+            await self.message_buckets.delete_many({"session_id": session_id})
+            if buckets:
+                await self.message_buckets.insert_many([
+                    {
+                        "session_id": session_id,
+                        "bucket": bucket,
+                        "count": len(bucket_messages),
+                        "messages": bucket_messages,
+                        "updated_at": datetime.utcnow()
+                    }
+                    for bucket, bucket_messages in buckets.items()
+                ])
+            
+            # Bascule du document seulement si aucun message n'a été ajouté entretemps
+            result = await self.conversations.update_one(
+                {"session_id": session_id, "messages": {"$size": len(messages)}},
+                {
+                    "$set": {
+                        "storage": "bucketed",
+                        "bucket_size": bucket_size,
+                        "message_count": len(messages)
+                    },
+                    "$unset": {"messages": ""}
+                }
+            )
+            if result.modified_count:
+                return len(messages)
+            # Un message est arrivé pendant la migration : on recommence
+            logger.info(f"Conversation {session_id} changed during its migration, retrying")
+        raise RuntimeError(f"Conversation {session_id} kept changing during {max_attempts} migration attempts")
+    
     async def get_all_sessions(self) -> List[str]:
         """Get all session IDs sorted from newest to oldest"""
-        cursor = self.conversations.find({}, {"session_id": 1}).sort("updated_at", -1)
-        sessions = await cursor.to_list(length=None)
-        return [session["session_id"] for session in sessions]
+        return [session["session_id"] async for session in self.iter_sessions()]
+    
+    @staticmethod
+    def _session_query(teacher_id: Optional[str] = None,
+                       updated_after: Optional[datetime] = None,
+                       updated_before: Optional[datetime] = None) -> Dict[str, Any]:
+        query: Dict[str, Any] = {}
+        if teacher_id:
+            query["teacher_id"] = teacher_id
+        if updated_after or updated_before:
+            query["updated_at"] = {}
+            if updated_after:
+                query["updated_at"]["$gte"] = updated_after
+            if updated_before:
+                query["updated_at"]["$lt"] = updated_before
+        return query
+    
+    @staticmethod
+    def _session_projection(summary: bool) -> Dict[str, int]:
+        projection = {"session_id": 1, "updated_at": 1}
+        if summary:
+            projection.update({"created_at": 1, "message_count": 1, "teacher_id": 1, "last_message": 1})
+        return projection
+    
+    @staticmethod
+    def _encode_cursor(session: Dict[str, Any]) -> str:
+        """Opaque cursor holding the (updated_at, _id) key of the last session of a page"""
+        key = [session["updated_at"].isoformat(), str(session["_id"]), isinstance(session["_id"], ObjectId)]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+        try:
+            updated_at, doc_id, is_object_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(updated_at), ObjectId(doc_id) if is_object_id else doc_id
+        except Exception:
+            raise ValueError("Invalid session cursor")
+    
+    async def list_sessions(self,
+                            limit: int = 50,
+                            cursor: Optional[str] = None,
+                            teacher_id: Optional[str] = None,
+                            updated_after: Optional[datetime] = None,
+                            updated_before: Optional[datetime] = None,
+                            summary: bool = False) -> Dict[str, Any]:
+        """
+        One page of sessions, newest first, paginated on (updated_at, _id): the next page starts
+        after the key of `cursor` instead of skipping documents.
+        Returns {"sessions": [...], "next_cursor": str or None}; with `summary`, the sessions include
+        the message count, the teacher and a preview of the last message.
+        """
+        query = self._session_query(teacher_id, updated_after, updated_before)
+        if cursor:
+            updated_at, doc_id = self._decode_cursor(cursor)
+            after = {"$or": [
+                {"updated_at": {"$lt": updated_at}},
+                {"updated_at": updated_at, "_id": {"$lt": doc_id}}
+            ]}
+            query = {"$and": [query, after]} if query else after
+        
+        # Un document de plus que la page pour savoir s'il reste une page suivante
+        documents = await self.conversations.find(query, self._session_projection(summary)) \
+            .sort([("updated_at", DESCENDING), ("_id", DESCENDING)]) \
+            .limit(limit + 1) \
+            .to_list(length=limit + 1)
+        next_cursor = self._encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+        return {"sessions": [self._format_session(doc) for doc in documents[:limit]], "next_cursor": next_cursor}
+    
+    async def iter_sessions(self,
+                            teacher_id: Optional[str] = None,
+                            updated_after: Optional[datetime] = None,
+                            updated_before: Optional[datetime] = None,
+                            summary: bool = False,
+                            batch_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """Every matching session, newest first, read in batches from a single cursor (exports)"""
+        cursor = self.conversations.find(
+            self._session_query(teacher_id, updated_after, updated_before),
+            self._session_projection(summary)
+        ).sort([("updated_at", DESCENDING), ("_id", DESCENDING)]).batch_size(batch_size)
+        async for document in cursor:
+            yield self._format_session(document)
+    
+    @staticmethod
+    def _format_session(document: Dict[str, Any]) -> Dict[str, Any]:
+        """Session summary with its dates as ISO strings, like the message timestamps of the history"""
+        def convert(value):
+            if isinstance(value, datetime):
+                return value.isoformat()
+            if isinstance(value, dict):
+                return {key: convert(item) for key, item in value.items()}
+            return value
+        return {key: convert(value) for key, value in document.items() if key != "_id"}
     
     ###################################
     # RAG Vector operations           #
     ###################################
     
+    async def load_vector_index(self) -> int:
+        """Build the local vector index (no-op for Atlas) and the BM25 index from the stored chunks"""
+        await self.lexical_index.load(self.rag_collection)
+        return await self.vector_index.load(self.rag_collection)
+
+    async def delete_documents(self, query: Dict[str, Any]) -> int:
+        """Delete chunks matching `query` and drop them from the vector index"""
+        ids = [doc["_id"] async for doc in self.rag_collection.find(query, {"_id": 1})]
+        if not ids:
+            return 0
+        result = await self.rag_collection.delete_many({"_id": {"$in": ids}})
+        self.vector_index.remove(ids)
+        self.lexical_index.remove(ids)
+        self._corpus_changed()
+        return result.deleted_count
+    
+    def _corpus_changed(self) -> None:
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear_rag()
+
     async def verify_index(self) -> bool:
         """Verify that the vector search index exists"""
+        if isinstance(self.vector_index, LocalVectorIndex):
+            return True
         try:
             indexes = await self.rag_collection.list_indexes()
             index_names = [index['name'] for index in await indexes.to_list(length=None)]
@@ -185,12 +680,9 @@ class MongoDBService:
             logger.error(f"Error verifying index: {str(e)}")
             return False
     
-    def clear_rag_collection(self) -> None:
+    async def clear_rag_collection(self) -> None:
         """Clear the RAG collection"""
-        with self.lock:
-            logging.debug("Clearing RAG collection...")
-            self.rag_collection.delete_many({})
-            logging.debug("Collection cleared.")
+        await self.clear()
     
     async def process_file(self, file: UploadFile) -> List[str]:
         """Process uploaded file and return chunks of text"""
@@ -210,10 +702,7 @@ class MongoDBService:
     def _process_pdf(self, content: bytes) -> str:
         """Extract text from PDF file"""
         pdf = PdfReader(BytesIO(content))
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text()
-        return text
+        return "".join(page.extract_text() for page in pdf.pages)
     
     def _process_html(self, content: bytes) -> str:
         """Extract text from HTML file"""
@@ -228,38 +717,22 @@ class MongoDBService:
             logger.error(f"Error getting document count: {str(e)}")
             return 0
     
-    async def similarity_search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
-        """Perform similarity search using MongoDB Atlas Vector Search"""
+    async def similarity_search(self,
+                                query: str,
+                                k: Optional[int] = None,
+                                num_candidates: Optional[int] = None,
+                                filters: Optional[Dict[str, Any]] = None,
+                                mode: Optional[str] = None,
+                                rerank: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve the k most relevant chunks: vector search, or hybrid BM25 + vector search
+        with reciprocal rank fusion (RETRIEVAL_MODE), optionally re-ranked
+        """
         try:
-            # Generate query embedding
-            query_embedding = await asyncio.get_event_loop().run_in_executor(
-                None, self.embeddings.embed_query, query
+            results = await self.retriever.search(
+                query, k=k, num_candidates=num_candidates, filters=filters, mode=mode, rerank=rerank
             )
             
-            # Vector search pipeline
-            pipeline = [
-                {
-                    "$vectorSearch": {
-                        "index": "default",
-                        "path": "embedding",
-                        "queryVector": query_embedding,
-                        "numCandidates": k * 10,
-                        "limit": k
-                    }
-                },
-                {
-                    "$project": {
-                        "text": 1,
-                        "metadata": 1,
-                        "score": {"$meta": "vectorSearchScore"},
-                        "_id": 0
-                    }
-                }
-            ]
-            
-            cursor = self.rag_collection.aggregate(pipeline)
-            results = await cursor.to_list(length=k)
-            
             if not results:
                 logger.debug("No results found")
                 count = await self.rag_collection.count_documents({})
@@ -273,45 +746,86 @@ class MongoDBService:
             logger.error(f"Search failed with error: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
     
-    async def add_texts_to_vectorstore(self, texts: List[str], metadata: Optional[dict] = None):
-        """Add text chunks to vector store with verification"""
+    @staticmethod
+    def chunk_key(file_id: Optional[str], text: str) -> str:
+        """Content-addressed chunk id: same document and same normalized text, same id"""
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{file_id or ''}\0{normalized}".encode("utf-8")).hexdigest()
+    
+    async def add_texts_to_vectorstore(self, texts: List[str], metadata: Optional[dict] = None, chunk_offset: int = 0):
+        """
+        Upsert text chunks in the vector store with one unordered bulk write; returns their ids.
+        Chunks already stored (same file_id and text) are not embedded again.
+        `chunk_offset` is the position of the first text in its document, for batched ingestion.
+        """
         try:
             logger.debug(f"Adding {len(texts)} texts to vector store")
+            metadata = metadata or {}
+            now = datetime.utcnow()
+            
+            # Un texte répété dans le document n'est gardé qu'une fois (première position)
+            chunks: Dict[str, Dict[str, Any]] = {}
+            for i, text in enumerate(texts):
+                key = self.chunk_key(metadata.get("file_id"), text)
+                chunks.setdefault(key, {"text": text, "chunk_id": chunk_offset + i})
+            
+            existing = {
+                doc["_id"]: doc.get("metadata")
+                async for doc in self.rag_collection.find({"_id": {"$in": list(chunks)}}, {"metadata": 1})
+            }
+            new_ids = [key for key in chunks if key not in existing]
+            
+            # Generate embeddings for the new chunks only
+            embeddings = await self.embeddings.aembed_documents([chunks[key]["text"] for key in new_ids]) if new_ids else []
+            logger.debug(f"Generated {len(embeddings)} embeddings, {len(existing)} chunks already stored")
+            vectors = dict(zip(new_ids, embeddings))
+            
+            # Upsert documents: the stored embedding of an existing chunk is kept
+            operations = []
+            for key, chunk in chunks.items():
+                update = {"$set": {**chunk, "metadata": metadata, "timestamp": now}}
+                if key in vectors:
+                    update["$setOnInsert"] = {"embedding": vectors[key]}
+                operations.append(UpdateOne({"_id": key}, update, upsert=True))
+            # L'acquittement du write concern suffit : pas de relecture des chunks écrits
+            result = await self.rag_collection.bulk_write(operations, ordered=False)
+            written = result.upserted_count + result.matched_count
+            if result.acknowledged and written != len(operations):
+                raise RuntimeError(f"Only {written} of {len(operations)} chunks were written")
+            logger.debug(f"Stored {len(operations)} chunks ({result.upserted_count} new)")
+            payloads = [{"text": chunks[key]["text"], "metadata": metadata} for key in new_ids]
+            self.vector_index.add(new_ids, embeddings, payloads)
+            self.lexical_index.add(new_ids, [payload["text"] for payload in payloads], payloads)
+            # Chunks déjà stockés dont les métadonnées changent : les filtres des index doivent les voir
+            updated = {key: {"text": chunks[key]["text"], "metadata": metadata}
+                       for key, stored in existing.items() if stored != metadata}
+            self.vector_index.update_payloads(updated)
+            self.lexical_index.update_payloads(updated)
+            # Une ré-ingestion identique ne change pas le corpus : les réponses RAG en cache restent valides
+            if new_ids or updated:
+                self._corpus_changed()
+            
+            ids = list(chunks)
+            if settings.ingestion_verify_sample_size:
+                await self._verify_sample(ids, settings.ingestion_verify_sample_size)
+            
+            return ids
             
-            # Generate embeddings
-            embeddings = await asyncio.get_event_loop().run_in_executor(
-                None, self.embeddings.embed_documents, texts
-            )
-            logger.debug(f"Generated {len(embeddings)} embeddings")
-
-            # Prepare documents
-            documents = []
-            for i, (text, embedding) in enumerate(zip(texts, embeddings)):
-                doc = {
-                    "text": text,
-                    "embedding": embedding,
-                    "metadata": metadata or {},
-                    "chunk_id": i,
-                    "timestamp": datetime.utcnow()
-                }
-                documents.append(doc)
-
-            # Insert documents
-            result = await self.rag_collection.insert_many(documents)
-            logger.debug(f"Inserted {len(result.inserted_ids)} documents")
-
-            # Verify insertion
-            inserted_count = await self.rag_collection.count_documents(
-                {"_id": {"$in": result.inserted_ids}}
-            )
-            logger.debug(f"Verified {inserted_count} documents inserted")
-
-            return result.inserted_ids
-
         except Exception as e:
             logger.error(f"Failed to add texts: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to add texts to vector store: {str(e)}")
     
+    async def _verify_sample(self, ids: List[str], size: int) -> None:
+        """Optional check that a random sample of the written chunks can be read back"""
+        sample = random.sample(ids, min(size, len(ids)))
+        found = await self.rag_collection.count_documents({"_id": {"$in": sample}})
+        if found != len(sample):
+            raise RuntimeError(f"Sampled verification failed: {found} of {len(sample)} chunks found")
+    
+    async def delete_stale_chunks(self, file_id: str, keep_ids: List[str]) -> int:
+        """Delete the chunks of a document that are not part of its new version"""
+        return await self.delete_documents({"metadata.file_id": file_id, "_id": {"$nin": keep_ids}})
+    
     async def save_exercise(self, 
                             exercise_data: dict[str, Any],
                             ) -> str:
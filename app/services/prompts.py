@@ -0,0 +1,336 @@
+# services/prompts.py
+"""
+Registre des prompts : chaque prompt a un identifiant versionné, des instructions système
+statiques (SystemMessage construit une seule fois, tokens comptés une seule fois) et un
+gabarit pour la partie variable, toujours placée en dernier.
+
+Les messages commencent donc par un préfixe identique d'une requête à l'autre (persona du
+professeur puis instructions), que le fournisseur peut mettre en cache. Les tokens mis en
+cache annoncés par l'API (ou, à défaut, l'estimation du préfixe cacheable) sont comptés par prompt.
+"""
+import logging
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from core.config import settings
+from services.context_window import TokenCounter
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """Static system instructions followed by a str.format template of the variable part"""
+    prompt_id: str
+    version: int
+    system: str
+    user: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.prompt_id}@{self.version}"
+
+    @cached_property
+    def system_message(self) -> SystemMessage:
+        return SystemMessage(content=self.system)
+
+
+@dataclass
+class RenderedPrompt:
+    key: str
+    messages: List[BaseMessage]
+    # Tokens des messages statiques en tête (persona + instructions)
+    prefix_tokens: int
+    prompt_tokens: int
+
+
+@dataclass
+class PromptStats:
+    requests: int = 0
+    prompt_tokens: int = 0
+    prefix_tokens: int = 0
+    cached_tokens: int = 0
+    reported_requests: int = 0
+
+
+EXERCISE_PROMPT = PromptTemplate(
+    prompt_id="exercise.generate",
+    version=2,
+    system="""You are an expert educational exercise creator.
+The subject, topic, exercise type, difficulty and number of questions are given in the user message.
+
+Follow these guidelines:
+1. Questions should be clear, precise, and appropriate for the requested difficulty level
+2. For multiple-choice questions, include 4 options with exactly one correct answer
+3. For math questions, use proper LaTeX formatting
+4. Include detailed explanations for the solution
+5. Return your response as structured data suitable for parsing
+6. If you speak as a teacher, make sure that the subject of the teacher matches the subject of the exercise.
+
+Format your response in the following structure:
+{
+  "exercise": {
+    "instructions": "Brief instructions for the exercise",
+    "questions": [
+      {
+        "question": "Question text",
+        "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
+        "type": "the requested exercise type"
+      }
+      // Additional questions...
+    ]
+  },
+  "solutions": {
+    "answers": [
+      {
+        "correct_answer": "The correct answer or index",
+        "correct_option": 2  // For multiple-choice questions
+      }
+      // Additional answers...
+    ],
+    "explanations": [
+      "Detailed explanation for question 1",
+      // Additional explanations...
+    ]
+  }
+}""",
+    user="""Subject: {subject}
+Topic: {topic}
+Exercise type: {exercise_type}
+Difficulty: {difficulty}
+Number of questions: {number_of_questions}
+
+Please create {number_of_questions} {difficulty} level exercises about {topic} in {subject} using {exercise_type} format.""",
+)
+
+EVALUATION_PROMPT = PromptTemplate(
+    prompt_id="exercise.evaluate",
+    version=2,
+    system="""You are an expert educational evaluator.
+Evaluate the student's answer to the question given in the user message.
+
+Provide an evaluation with:
+1. Whether the answer is correct (true/false)
+2. A score from 0.0 to 1.0
+3. Constructive feedback
+4. A detailed explanation of the correct answer
+
+Format your response as JSON:
+{
+  "is_correct": true/false,
+  "score": 0.0-1.0,
+  "feedback": "Your feedback here",
+  "explanation": "Detailed explanation here"
+}""",
+    user="""Question: {question}
+
+Correct answer: {correct_answer}
+
+Student's answer: {student_answer}
+
+Please evaluate this answer.""",
+)
+
+INTENT_PROMPT = PromptTemplate(
+    prompt_id="smart.intent",
+    version=2,
+    system="""Vous êtes un classificateur d'intentions et un assistant d'extraction de paramètres pour un chatbot éducatif.
+
+TÂCHE : Déterminez l'intention de l'utilisateur et extrayez les paramètres pertinents.
+
+Retournez UNIQUEMENT un JSON valide avec l'une des structures suivantes selon l'intention de l'utilisateur :
+
+1. Pour une conversation générale ou des demandes de cours :
+{
+"intent": "chat"
+}
+
+2. Pour les demandes de génération d'exercices :
+{
+"intent": "generate_exercise",
+"parameters": {
+    "subject": "la matière concernée",
+    "topic": "sujet spécifique dans la matière",
+    "exercise_type": "type d'exercice (multiple_choice, fill_in_blank, short_answer, code_challenge, true_false, math_problem)",
+    "difficulty": "facile/moyen/difficile/expert",
+    "number_of_questions": entier entre 1-10
+}
+}
+
+3. Pour l'évaluation des réponses :
+{
+"intent": "evaluate_answers",
+"parameters": {
+    "exercise_id": "ID de l'exercice (si fourni)",
+    "user_answers": [liste des réponses fournies]
+}
+}
+
+4. Pour demander un indice :
+{
+"intent": "get_hint",
+"parameters": {
+    "exercise_id": "ID de l'exercice",
+    "question_number": entier (si une question spécifique est mentionnée, ou null)
+}
+}
+
+5. Pour demander les solutions :
+{
+"intent": "get_solution",
+"parameters": {
+    "exercise_id": "ID de l'exercice",
+    "question_number": entier (si une question spécifique est mentionnée, ou null)
+}
+}
+
+Les formats d'ID d'exercice ressemblent à : 65f123abc456def789abcdef
+
+ATTENTION : Classifiez comme evaluate_answers uniquement si l'utilisateur soumet clairement des réponses pour évaluation.
+
+EXEMPLES :
+- "Donne-moi des problèmes de mathématiques" → generate_exercise
+- "Voici mes réponses : 1. X=5, 2. Y=10..." → evaluate_answers
+- "Je suis bloqué sur la question 3, peux-tu m'aider ?" → get_hint
+- "Montre-moi la réponse à la question 2" → get_solution
+- "Quelle est la capitale de la France ?" → chat""",
+    user="Analyse ce message:{message}{history}",
+)
+
+HINT_PROMPT = PromptTemplate(
+    prompt_id="smart.hint",
+    version=2,
+    system="""Vous êtes un assistant éducatif bienveillant.
+
+TÂCHE : Générez un indice utile pour une question d'exercice sans révéler la réponse complète.
+
+Règles :
+- Fournissez des conseils qui aident l'élève à réfléchir au problème
+- Ne révélez pas la solution entière
+- Soyez encourageant et bienveillant
+- Concentrez-vous uniquement sur la ou les questions demandées
+- Les informations sur la solution ne servent qu'à construire l'indice, ne les donnez pas""",
+    user="""Exercise question:
+{question}
+
+Information sur la solution (utilise cela que pour créer ton indice, PAS pour donner la solution):
+{solutions}
+
+S'il te plait partage un indice utile pour la question {question_label}.""",
+)
+
+PROMPTS: List[PromptTemplate] = [EXERCISE_PROMPT, EVALUATION_PROMPT, INTENT_PROMPT, HINT_PROMPT]
+
+
+class PromptRegistry:
+    """
+    Versioned prompt templates rendered as [teacher persona, static instructions, variable user message],
+    with per-prompt accounting of the prompt tokens served from the provider cache.
+    """
+    def __init__(self,
+                 counter: Optional[TokenCounter] = None,
+                 templates: Optional[List[PromptTemplate]] = None,
+                 cache_min_tokens: int = 1024):
+        self.counter = counter or TokenCounter()
+        self.cache_min_tokens = cache_min_tokens
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._system_tokens: Dict[str, int] = {}
+        self._stats: Dict[str, PromptStats] = {}
+        for template in templates if templates is not None else PROMPTS:
+            self.register(template)
+
+    @classmethod
+    def from_settings(cls, counter: Optional[TokenCounter] = None) -> "PromptRegistry":
+        return cls(counter=counter, cache_min_tokens=settings.prompt_cache_min_tokens)
+
+    def register(self, template: PromptTemplate) -> None:
+        """Register a template; the latest version of an id replaces the previous one"""
+        current = self._templates.get(template.prompt_id)
+        if current is not None and current.version > template.version:
+            return
+        self._templates[template.prompt_id] = template
+        self._system_tokens[template.prompt_id] = self.counter.count_message(template.system_message)
+
+    def get(self, prompt_id: str) -> PromptTemplate:
+        template = self._templates.get(prompt_id)
+        if template is None:
+            raise KeyError(f"Unknown prompt: {prompt_id}")
+        return template
+
+    def render(self, prompt_id: str, teacher=None, **values: Any) -> RenderedPrompt:
+        """
+        Messages of a prompt; `teacher` (TeacherProfile) puts the teacher persona first,
+        so that persona and instructions form the stable prefix of the request.
+        """
+        template = self.get(prompt_id)
+        messages: List[BaseMessage] = []
+        prefix_tokens = 0
+        if teacher is not None:
+            messages.append(teacher.system_message)
+            prefix_tokens += teacher.prompt_tokens
+        messages.append(template.system_message)
+        prefix_tokens += self._system_tokens[prompt_id]
+        user_message = HumanMessage(content=template.user.format(**values))
+        messages.append(user_message)
+        return RenderedPrompt(
+            key=template.key,
+            messages=messages,
+            prefix_tokens=prefix_tokens,
+            prompt_tokens=prefix_tokens + self.counter.count_message(user_message),
+        )
+
+    ####################### Comptabilité des tokens #######################
+
+    def record(self, prompt: RenderedPrompt, response=None) -> Dict[str, Any]:
+        """
+        Account the prompt tokens of one request. `response` is the LLMResult (or AIMessage)
+        when the provider reports its usage; otherwise the cacheable prefix is an estimate.
+        """
+        usage = self._usage(response)
+        stats = self._stats.setdefault(prompt.key, PromptStats())
+        stats.requests += 1
+        if usage is not None:
+            prompt_tokens = usage.get("input_tokens", prompt.prompt_tokens)
+            cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+            stats.reported_requests += 1
+        else:
+            prompt_tokens = prompt.prompt_tokens
+            # Le fournisseur ne met en cache que les préfixes assez longs
+            cached_tokens = prompt.prefix_tokens if prompt.prefix_tokens >= self.cache_min_tokens else 0
+        stats.prompt_tokens += prompt_tokens
+        stats.prefix_tokens += prompt.prefix_tokens
+        stats.cached_tokens += cached_tokens
+        accounting = {
+            "prompt": prompt.key,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": max(0, prompt_tokens - cached_tokens),
+            "reported": usage is not None,
+        }
+        logging.debug(f"Prompt tokens: {accounting}")
+        return accounting
+
+    @staticmethod
+    def _usage(response) -> Optional[Dict[str, Any]]:
+        try:
+            message = response.generations[0][0].message if hasattr(response, "generations") else response
+            return getattr(message, "usage_metadata", None)
+        except (AttributeError, IndexError):
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        prompts = {}
+        for key, stats in self._stats.items():
+            prompts[key] = {
+                "requests": stats.requests,
+                "reported_requests": stats.reported_requests,
+                "avg_prompt_tokens": stats.prompt_tokens / stats.requests if stats.requests else 0.0,
+                "prefix_tokens": stats.prefix_tokens,
+                "cached_tokens": stats.cached_tokens,
+                "uncached_tokens": max(0, stats.prompt_tokens - stats.cached_tokens),
+                "cached_ratio": stats.cached_tokens / stats.prompt_tokens if stats.prompt_tokens else 0.0,
+            }
+        return {
+            "templates": {prompt_id: template.key for prompt_id, template in self._templates.items()},
+            "cache_min_tokens": self.cache_min_tokens,
+            "prompts": prompts,
+        }
@@ -0,0 +1,181 @@
+# services/retrieval.py
+"""
+Recherche hybride pour la RAG : les résultats de l'index vectoriel et de l'index BM25 sont
+fusionnés par Reciprocal Rank Fusion, puis éventuellement réordonnés par un cross-encoder local.
+
+Le re-ranker nécessite sentence-transformers (RERANKER_MODEL, désactivé si vide).
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from core.config import settings
+from services.lexical_index import BM25Index
+from services.vector_index import VectorIndex
+
+MODES = ("vector", "hybrid")
+
+
+class CrossEncoderReranker:
+    """Local cross-encoder scoring (query, chunk) pairs, loaded on first use"""
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        return [float(score) for score in self._load().predict([(query, text) for text in texts])]
+
+    async def rerank(self, query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not chunks:
+            return chunks
+        scores = await asyncio.get_event_loop().run_in_executor(
+            None, self._score, query, [chunk["text"] for chunk in chunks]
+        )
+        for chunk, score in zip(chunks, scores):
+            chunk["rerank_score"] = score
+        return sorted(chunks, key=lambda chunk: chunk["rerank_score"], reverse=True)
+
+
+class HybridRetriever:
+    """
+    Vector and BM25 candidates fused with RRF (score = sum of 1 / (rrf_k + rank)).
+    k, candidate count, mode, metadata filters and re-ranking can be set per request.
+    """
+    def __init__(self,
+                 embeddings,
+                 vector_index: VectorIndex,
+                 lexical_index: BM25Index,
+                 mode: str = "vector",
+                 k: int = 4,
+                 num_candidates: int = 40,
+                 rrf_k: int = 60,
+                 reranker: Optional[CrossEncoderReranker] = None,
+                 rerank_candidates: int = 20,
+                 executor_threshold: int = 50_000):
+        self.embeddings = embeddings
+        self.vector_index = vector_index
+        self.lexical_index = lexical_index
+        self.mode = mode
+        self.k = k
+        self.num_candidates = num_candidates
+        self.rrf_k = rrf_k
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.executor_threshold = executor_threshold
+        self._stats = {mode: {"searches": 0, "seconds": 0.0} for mode in MODES}
+        self._stats["reranks"] = 0
+
+    @classmethod
+    def from_settings(cls, embeddings, vector_index: VectorIndex, lexical_index: BM25Index) -> "HybridRetriever":
+        return cls(
+            embeddings=embeddings,
+            vector_index=vector_index,
+            lexical_index=lexical_index,
+            mode=settings.retrieval_mode,
+            k=settings.retrieval_k,
+            num_candidates=settings.retrieval_num_candidates,
+            rrf_k=settings.retrieval_rrf_k,
+            reranker=CrossEncoderReranker(settings.reranker_model) if settings.reranker_model else None,
+            rerank_candidates=settings.reranker_candidates,
+        )
+
+    async def search(self,
+                     query: str,
+                     k: Optional[int] = None,
+                     num_candidates: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None,
+                     mode: Optional[str] = None,
+                     rerank: Optional[bool] = None,
+                     vector: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Return the k best chunks as {"id", "text", "metadata", "score", ...}. `score` is the cosine
+        similarity in vector mode and the RRF value in hybrid mode (vector_score and lexical_score
+        keep the scores of each index); rerank_score is added when re-ranked.
+        `vector` is the query embedding when the caller already has it.
+        """
+        start = time.perf_counter()
+        k = k or self.k
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        rerank = self.reranker is not None if rerank is None else rerank and self.reranker is not None
+        # Le re-ranker travaille sur une liste de candidats plus large que k
+        limit = max(k, self.rerank_candidates) if rerank else k
+        candidates = max(num_candidates or self.num_candidates, limit)
+
+        if mode == "vector":
+            if vector is None:
+                vector = await self.embeddings.aembed_query(query)
+            results = [self._output(chunk, score=chunk["score"], vector_score=chunk["score"])
+                       for chunk in await self.vector_index.search(vector, limit, candidates, filters)]
+        else:
+            vector_results, lexical_results = await asyncio.gather(
+                self._vector_candidates(query, vector, candidates, filters),
+                self._lexical_candidates(query, candidates, filters),
+            )
+            results = self._fuse(vector_results, lexical_results)[:limit]
+
+        if rerank:
+            self._stats["reranks"] += 1
+            results = await self.reranker.rerank(query, results)
+        results = results[:k]
+        self._stats[mode]["searches"] += 1
+        self._stats[mode]["seconds"] += time.perf_counter() - start
+        return results
+
+    async def _vector_candidates(self, query, vector, candidates, filters) -> List[Dict[str, Any]]:
+        if vector is None:
+            vector = await self.embeddings.aembed_query(query)
+        # Pour Atlas, numCandidates garde le rapport habituel de 10 candidats par résultat
+        return await self.vector_index.search(vector, candidates, candidates * 10, filters)
+
+    async def _lexical_candidates(self, query, candidates, filters) -> List[Dict[str, Any]]:
+        if len(self.lexical_index) > self.executor_threshold:
+            hits = await asyncio.get_event_loop().run_in_executor(
+                None, self.lexical_index.search, query, candidates, filters
+            )
+        else:
+            hits = self.lexical_index.search(query, candidates, filters)
+        results = []
+        for doc_id, score in hits:
+            payload = self.lexical_index.payload(doc_id)
+            if payload is not None:  # chunk supprimé pendant la recherche
+                results.append({"id": doc_id, **payload, "score": score})
+        return results
+
+    def _fuse(self, vector_results: List[Dict[str, Any]], lexical_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Reciprocal rank fusion of the two candidate lists"""
+        fused: Dict[str, Dict[str, Any]] = {}
+        for key, results in (("vector_score", vector_results), ("lexical_score", lexical_results)):
+            for rank, chunk in enumerate(results):
+                entry = fused.setdefault(str(chunk["id"]), self._output(chunk, score=0.0))
+                entry["score"] += 1 / (self.rrf_k + rank + 1)
+                entry[key] = chunk["score"]
+        return sorted(fused.values(), key=lambda chunk: chunk["score"], reverse=True)
+
+    @staticmethod
+    def _output(chunk: Dict[str, Any], score: float, vector_score: Optional[float] = None) -> Dict[str, Any]:
+        return {
+            "id": str(chunk["id"]),
+            "text": chunk["text"],
+            "metadata": chunk.get("metadata", {}),
+            "score": score,
+            "vector_score": vector_score,
+            "lexical_score": None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"mode": self.mode, "reranker": self.reranker.model_name if self.reranker else None,
+                 "reranks": self._stats["reranks"]}
+        for mode in MODES:
+            searches = self._stats[mode]["searches"]
+            stats[mode] = {
+                "searches": searches,
+                "avg_ms": 1000 * self._stats[mode]["seconds"] / searches if searches else 0.0,
+            }
+        return stats
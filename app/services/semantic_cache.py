@@ -0,0 +1,171 @@
+# services/semantic_cache.py
+"""
+Cache sémantique des réponses : une question proche (au sens des embeddings) d'une question
+déjà posée au même professeur reçoit la réponse déjà générée, sans appel au LLM.
+"""
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from core.config import settings
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class _Namespace:
+    """Normalized float32 question vectors of one (teacher, mode) pair"""
+    def __init__(self):
+        self.entries: List[CachedAnswer] = []
+        self.vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.vstack(self.vectors)
+        return self._matrix
+
+    def add(self, entry: CachedAnswer, vector: np.ndarray) -> None:
+        self.entries.append(entry)
+        self.vectors.append(vector)
+        self._matrix = None
+
+    def drop_first(self, count: int) -> None:
+        # Les entrées sont rangées par date d'insertion : les plus anciennes sont en tête
+        del self.entries[:count]
+        del self.vectors[:count]
+        self._matrix = None
+
+
+class SemanticCache:
+    """
+    Per-namespace in-process vector index of previous questions, with a cosine
+    similarity threshold, TTL eviction and a bound on entries per namespace.
+    """
+    def __init__(self,
+                 embeddings=None,
+                 threshold: float = 0.92,
+                 ttl_seconds: float = 86400,
+                 max_entries: int = 5000):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "expirations": 0,
+                       "lookup_seconds": 0.0, "llm_calls": 0, "llm_seconds": 0.0}
+
+    @classmethod
+    def from_settings(cls, embeddings=None) -> "SemanticCache":
+        return cls(
+            embeddings=embeddings,
+            threshold=settings.semantic_cache_threshold,
+            ttl_seconds=settings.semantic_cache_ttl_seconds,
+            max_entries=settings.semantic_cache_max_entries,
+        )
+
+    @staticmethod
+    def namespace(teacher_id: Optional[str], use_rag: bool = False) -> str:
+        return f"{teacher_id or 'default'}:{'rag' if use_rag else 'chat'}"
+
+    async def embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.aembed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    ####################### Lecture / écriture #######################
+
+    async def lookup(self, namespace: str, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Return (cached answer or None, question vector). The vector is returned so that
+        a miss can be stored after generation without embedding the question twice.
+        """
+        start = time.perf_counter()
+        self._stats["lookups"] += 1
+        try:
+            vector = await self.embed(question)
+        except Exception as e:
+            logging.error(f"Semantic cache embedding failed: {str(e)}")
+            self._stats["misses"] += 1
+            return None, None
+
+        answer = self.search(namespace, vector)
+        self._stats["lookup_seconds"] += time.perf_counter() - start
+        self._stats["hits" if answer is not None else "misses"] += 1
+        return answer, vector
+
+    def search(self, namespace: str, vector: np.ndarray) -> Optional[str]:
+        """Best cached answer whose question similarity reaches the threshold"""
+        space = self._namespaces.get(namespace)
+        if space is None:
+            return None
+        self._expire(space)
+        if not space.entries:
+            return None
+        scores = space.matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return space.entries[best].answer
+
+    def store(self, namespace: str, question: str, vector: Optional[np.ndarray], answer: str) -> None:
+        if vector is None or not answer:
+            return
+        space = self._namespaces.setdefault(namespace, _Namespace())
+        space.add(CachedAnswer(question=question, answer=answer), vector)
+        if len(space.entries) > self.max_entries:
+            space.drop_first(len(space.entries) - self.max_entries)
+        self._stats["stores"] += 1
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Forget cached answers (e.g. after a teacher prompt or the course corpus changed)"""
+        if namespace is None:
+            self._namespaces.clear()
+        else:
+            self._namespaces.pop(namespace, None)
+
+    def clear_rag(self) -> None:
+        """Forget the answers built on the course corpus (documents were added, updated or deleted)"""
+        for namespace in [name for name in self._namespaces if name.endswith(":rag")]:
+            del self._namespaces[namespace]
+
+    def _expire(self, space: _Namespace) -> None:
+        limit = time.monotonic() - self.ttl_seconds
+        expired = 0
+        while expired < len(space.entries) and space.entries[expired].created_at < limit:
+            expired += 1
+        if expired:
+            space.drop_first(expired)
+            self._stats["expirations"] += expired
+
+    ####################### Métriques #######################
+
+    def record_llm_call(self, seconds: float) -> None:
+        """Measured duration of an uncached generation, used to estimate the latency saved"""
+        self._stats["llm_calls"] += 1
+        self._stats["llm_seconds"] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["lookups"]
+        llm_calls = self._stats["llm_calls"]
+        avg_llm_seconds = self._stats["llm_seconds"] / llm_calls if llm_calls else 0.0
+        return {
+            "threshold": self.threshold,
+            "namespaces": len(self._namespaces),
+            "entries": sum(len(space.entries) for space in self._namespaces.values()),
+            "lookups": lookups,
+            "hits": self._stats["hits"],
+            "misses": self._stats["misses"],
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            "stores": self._stats["stores"],
+            "expirations": self._stats["expirations"],
+            "avg_lookup_ms": 1000 * self._stats["lookup_seconds"] / lookups if lookups else 0.0,
+            "avg_llm_seconds": avg_llm_seconds,
+            "latency_saved_seconds": self._stats["hits"] * avg_llm_seconds,
+        }
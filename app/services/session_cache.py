@@ -0,0 +1,193 @@
+# services/session_cache.py
+"""
+Cache borné (LRU + TTL) des historiques de session gardés en mémoire
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from core.config import settings
+from services.memory import InMemoryHistory
+
+
+class SessionCache:
+    """
+    LRU cache of InMemoryHistory objects bounded by number of sessions,
+    total number of cached messages and idle time (TTL).
+    """
+    def __init__(self,
+                 max_entries: int = 2000,
+                 max_total_messages: int = 100_000,
+                 ttl_seconds: float = 3600,
+                 sweep_interval: float = 60,
+                 max_messages_per_session: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_messages_per_session = max_messages_per_session
+        self.max_total_messages = max_total_messages
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+
+        self._entries: "OrderedDict[str, InMemoryHistory]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_messages = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # Compteurs exposés par stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_settings(cls) -> "SessionCache":
+        """Build a cache using the limits declared in core/config.py"""
+        return cls(
+            max_entries=settings.session_cache_max_entries,
+            max_total_messages=settings.session_cache_max_messages,
+            ttl_seconds=settings.session_cache_ttl_seconds,
+            sweep_interval=settings.session_cache_sweep_interval,
+            max_messages_per_session=settings.history_window,
+        )
+
+    ####################### Accès #######################
+
+    def get(self, session_id: str) -> Optional[InMemoryHistory]:
+        """Return the cached history (refreshing its LRU position) or None"""
+        history = self._entries.get(session_id)
+        if history is None:
+            self.misses += 1
+            return None
+        if not history.is_active(self.ttl_seconds):
+            self._remove(session_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        history.touch()
+        self._entries.move_to_end(session_id)
+        return history
+
+    def set(self, session_id: str, history: InMemoryHistory) -> InMemoryHistory:
+        """Insert or replace the history of a session"""
+        if session_id in self._entries:
+            self._remove(session_id)
+        self._trim(history)
+        history.touch()
+        self._entries[session_id] = history
+        self._sizes[session_id] = len(history.messages)
+        self._total_messages += self._sizes[session_id]
+        self._enforce_limits(keep=session_id)
+        return history
+
+    def add_messages(self, session_id: str, messages: List[Any]) -> InMemoryHistory:
+        """Append messages to a session, creating it if needed"""
+        history = self._entries.get(session_id)
+        if history is None:
+            return self.set(session_id, InMemoryHistory(*messages))
+        history.add_messages(messages)
+        self._trim(history)
+        self._entries.move_to_end(session_id)
+        self._refresh_size(session_id)
+        self._enforce_limits(keep=session_id)
+        return history
+
+    def pop(self, session_id: str) -> Optional[InMemoryHistory]:
+        """Remove a session from the cache"""
+        if session_id not in self._entries:
+            return None
+        return self._remove(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        history = self._entries.get(session_id)
+        return history is not None and history.is_active(self.ttl_seconds)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    ####################### Éviction #######################
+
+    def sweep(self) -> int:
+        """Drop expired sessions and re-apply the size limits. Returns the number of expired sessions."""
+        expired = [sid for sid, history in self._entries.items()
+                   if not history.is_active(self.ttl_seconds)]
+        for session_id in expired:
+            self._remove(session_id)
+        self.expirations += len(expired)
+
+        # Les historiques peuvent être modifiés hors du cache : on recalcule les tailles
+        for session_id in self._entries:
+            self._refresh_size(session_id)
+        self._enforce_limits()
+        return len(expired)
+
+    def start(self) -> None:
+        """Start the background sweeping task on the running event loop"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """Stop the background sweeping task"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                expired = self.sweep()
+                if expired:
+                    logging.debug(f"Session cache sweep: {expired} expired sessions removed")
+            except Exception as e:
+                logging.error(f"Session cache sweep failed: {str(e)}")
+
+    def _enforce_limits(self, keep: Optional[str] = None) -> None:
+        """Evict least recently used sessions until both limits are satisfied"""
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._total_messages > self.max_total_messages):
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                # La session courante est seule à dépasser la limite : on la garde
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(oldest)
+                continue
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _trim(self, history: InMemoryHistory) -> None:
+        """Keep only the most recent messages of a session (the rest stays in MongoDB)"""
+        if self.max_messages_per_session and len(history.messages) > self.max_messages_per_session:
+            removed = len(history.messages) - self.max_messages_per_session
+            del history.messages[:removed]
+            history.first_seq += removed
+
+    def _refresh_size(self, session_id: str) -> None:
+        size = len(self._entries[session_id].messages)
+        self._total_messages += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+
+    def _remove(self, session_id: str) -> InMemoryHistory:
+        history = self._entries.pop(session_id)
+        self._total_messages -= self._sizes.pop(session_id, 0)
+        return history
+
+    def stats(self) -> Dict[str, Any]:
+        """Return occupancy and hit/miss/eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "messages": self._total_messages,
+            "max_entries": self.max_entries,
+            "max_total_messages": self.max_total_messages,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
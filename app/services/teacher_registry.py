@@ -0,0 +1,199 @@
+# services/teacher_registry.py
+"""
+Registre en mémoire des professeurs : chargé au démarrage avec le SystemMessage de chaque
+professeur déjà construit et sa longueur en tokens déjà comptée, pour que les requêtes ne
+lisent plus la collection des professeurs.
+
+Les modifications sont suivies par un change stream (replica set) ou, à défaut, par une
+relecture périodique comparant la version (empreinte du contenu) de chaque professeur.
+Les identifiants inconnus sont mémorisés un temps limité (cache négatif).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from langchain_core.messages import SystemMessage
+from core.config import settings
+from services.context_window import TokenCounter
+
+
+def teacher_version(document: Dict[str, Any]) -> str:
+    """Fingerprint of the teacher fields, stable across reloads"""
+    fields = {key: value for key, value in document.items() if key != "_id"}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class TeacherProfile:
+    teacher_id: str
+    data: Dict[str, Any]
+    version: str
+    system_message: SystemMessage
+    prompt_tokens: int
+
+    @property
+    def prompt_instructions(self) -> str:
+        return self.data.get("prompt_instructions") or ""
+
+    @property
+    def subject(self) -> Optional[str]:
+        return self.data.get("subject")
+
+
+class TeacherRegistry:
+    """
+    Teacher profiles kept in memory. get() only reads MongoDB for an id that is neither
+    registered nor in the negative cache; the registry is refreshed in the background.
+    """
+    def __init__(self,
+                 collection,
+                 counter: Optional[TokenCounter] = None,
+                 semantic_cache=None,
+                 refresh_interval: float = 30,
+                 negative_ttl_seconds: float = 60,
+                 watch: bool = True):
+        self.collection = collection
+        self.counter = counter or TokenCounter()
+        self.semantic_cache = semantic_cache
+        self.refresh_interval = refresh_interval
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.watch = watch
+        self.mode = "lazy"
+
+        self._profiles: Dict[str, TeacherProfile] = {}
+        self._unknown: Dict[str, float] = {}
+        self._refresher: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "negative_hits": 0, "db_reads": 0, "reloads": 0, "changes": 0}
+
+    @classmethod
+    def from_settings(cls, collection, counter: Optional[TokenCounter] = None, semantic_cache=None) -> "TeacherRegistry":
+        return cls(
+            collection,
+            counter=counter,
+            semantic_cache=semantic_cache,
+            refresh_interval=settings.teacher_registry_refresh_seconds,
+            negative_ttl_seconds=settings.teacher_registry_negative_ttl_seconds,
+            watch=settings.teacher_registry_watch,
+        )
+
+    ####################### Lecture #######################
+
+    async def get(self, teacher_id: str) -> Optional[TeacherProfile]:
+        """Profile of a teacher, or None if the id is unknown"""
+        profile = self._profiles.get(teacher_id)
+        if profile is not None:
+            self._stats["hits"] += 1
+            return profile
+        unknown_since = self._unknown.get(teacher_id)
+        if unknown_since is not None and time.monotonic() - unknown_since < self.negative_ttl_seconds:
+            self._stats["negative_hits"] += 1
+            return None
+
+        # Professeur ajouté depuis le dernier rechargement (ou registre pas encore chargé)
+        self._stats["db_reads"] += 1
+        document = await self.collection.find_one({"teacher_id": teacher_id})
+        if document is None:
+            self._unknown[teacher_id] = time.monotonic()
+            return None
+        return self._register(document)
+
+    def _register(self, document: Dict[str, Any]) -> TeacherProfile:
+        data = {key: value for key, value in document.items() if key != "_id"}
+        system_message = SystemMessage(content=data.get("prompt_instructions") or "")
+        profile = TeacherProfile(
+            teacher_id=data["teacher_id"],
+            data=data,
+            version=teacher_version(data),
+            system_message=system_message,
+            prompt_tokens=self.counter.count_message(system_message),
+        )
+        self._profiles[profile.teacher_id] = profile
+        self._unknown.pop(profile.teacher_id, None)
+        return profile
+
+    ####################### Rechargement #######################
+
+    async def load(self) -> int:
+        """
+        Reload every teacher; only the changed ones are rebuilt. The cached answers of a
+        teacher whose prompt changed (or who was removed) are dropped from the semantic cache.
+        Returns the number of changed teachers.
+        """
+        self._stats["reloads"] += 1
+        documents = {doc["teacher_id"]: doc async for doc in self.collection.find({}) if "teacher_id" in doc}
+        removed = [teacher_id for teacher_id in self._profiles if teacher_id not in documents]
+        for teacher_id in removed:
+            del self._profiles[teacher_id]
+            self._invalidate_answers(teacher_id)
+        changed = []
+        for teacher_id, document in documents.items():
+            current = self._profiles.get(teacher_id)
+            if current is not None and current.version == teacher_version(document):
+                continue
+            profile = self._register(document)
+            if current is not None:
+                changed.append(teacher_id)
+                if profile.prompt_instructions != current.prompt_instructions:
+                    self._invalidate_answers(teacher_id)
+        changed += removed
+        self._stats["changes"] += len(changed)
+        if changed:
+            logging.info(f"Teacher registry reloaded, changed: {', '.join(changed)}")
+        return len(changed)
+
+    def _invalidate_answers(self, teacher_id: str) -> None:
+        if self.semantic_cache is None:
+            return
+        for use_rag in (False, True):
+            self.semantic_cache.clear(self.semantic_cache.namespace(teacher_id, use_rag))
+
+    async def start(self) -> None:
+        """Load the teachers and follow their changes in the background"""
+        await self.load()
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._follow_changes())
+
+    async def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def _follow_changes(self) -> None:
+        if self.watch:
+            try:
+                self.mode = "change_stream"
+                async with self.collection.watch() as stream:
+                    async for _ in stream:
+                        # La collection ne contient que quelques documents : on relit tout
+                        await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Change streams indisponibles (serveur autonome, mongomock) : relecture périodique
+                logging.info(f"Teacher change stream unavailable, polling instead: {str(e)}")
+        if self.refresh_interval <= 0:
+            self.mode = "static"
+            return
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logging.error(f"Teacher registry reload failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "mode": self.mode,
+            "teachers": len(self._profiles),
+            "unknown_ids": len(self._unknown),
+            "prompt_tokens": {teacher_id: profile.prompt_tokens for teacher_id, profile in self._profiles.items()},
+        }
@@ -0,0 +1,349 @@
+# services/vector_index.py
+"""
+Index vectoriel utilisé par la RAG.
+
+- AtlasVectorIndex : recherche $vectorSearch (index Atlas "default"), backend par défaut
+- LocalVectorIndex : matrice NumPy float32 en mémoire (ou memory-mappée), cosinus exact
+  par produit matriciel, avec un index IVF optionnel pour les gros corpus. Chargée au
+  démarrage de chaque processus, elle ne suit que les écritures de ce processus : à réserver
+  à un déploiement mono-processus, hors ligne ou à la CI.
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from core.config import settings
+from services.lexical_index import matches
+
+
+class VectorIndex:
+    """Interface of the RAG vector index backends"""
+    name = "base"
+
+    async def search(self, vector: Sequence[float], k: int = 4,
+                     num_candidates: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Return the k closest chunks as {"id", "text", "metadata", "score"}.
+        `filters` maps metadata fields to the required values.
+        """
+        raise NotImplementedError
+
+    def add(self, ids: Sequence[Any], vectors: Sequence[Sequence[float]],
+            payloads: Sequence[Dict[str, Any]]) -> None:
+        """Register inserted chunks (no-op for backends indexing the collection themselves)"""
+
+    def update_payloads(self, payloads: Dict[Any, Dict[str, Any]]) -> None:
+        """Replace the text and metadata of chunks already indexed (their vectors are unchanged)"""
+
+    def remove(self, ids: Sequence[Any]) -> None:
+        """Forget deleted chunks"""
+
+    def clear(self) -> None:
+        """Forget every chunk"""
+
+    async def load(self, collection) -> int:
+        """Build the index from the stored chunks, returns the number of chunks"""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class AtlasVectorIndex(VectorIndex):
+    """MongoDB Atlas $vectorSearch on the chunks collection"""
+    name = "atlas"
+
+    def __init__(self, collection, index_name: str = "default"):
+        self.collection = collection
+        self.index_name = index_name
+
+    async def search(self, vector, k=4, num_candidates=None, filters=None):
+        vector_search = {
+            "index": self.index_name,
+            "path": "embedding",
+            "queryVector": list(vector),
+            "numCandidates": num_candidates or k * 10,
+            "limit": k
+        }
+        if filters:
+            # Les champs filtrés doivent être déclarés comme "filter" dans l'index Atlas
+            vector_search["filter"] = {f"metadata.{field}": {"$eq": value} for field, value in filters.items()}
+        pipeline = [
+            {"$vectorSearch": vector_search},
+            {
+                "$project": {
+                    "id": "$_id",
+                    "text": 1,
+                    "metadata": 1,
+                    "score": {"$meta": "vectorSearchScore"},
+                    "_id": 0
+                }
+            }
+        ]
+        cursor = self.collection.aggregate(pipeline)
+        return await cursor.to_list(length=k)
+
+
+class LocalVectorIndex(VectorIndex):
+    """
+    In-process cosine index. Vectors are normalized once at insertion and stored in a
+    float32 matrix; deletions are tombstones reclaimed by compaction. With `ivf_lists`
+    set, rows are bucketed by k-means centroids and only the `nprobe` closest lists are scanned.
+    """
+    name = "local"
+
+    def __init__(self,
+                 mmap_path: Optional[str] = None,
+                 ivf_lists: int = 0,
+                 ivf_nprobe: int = 8,
+                 ivf_min_size: int = 20_000,
+                 executor_threshold: int = 50_000):
+        self.mmap_path = mmap_path
+        self.ivf_lists = ivf_lists
+        self.ivf_nprobe = ivf_nprobe
+        self.ivf_min_size = ivf_min_size
+        self.executor_threshold = executor_threshold
+
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._ids: List[Any] = []
+        self._payloads: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[Any, int] = {}
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+        self._stats = {"searches": 0, "ivf_searches": 0, "compactions": 0}
+
+    @classmethod
+    def from_settings(cls) -> "LocalVectorIndex":
+        return cls(
+            mmap_path=settings.vector_index_mmap_path or None,
+            ivf_lists=settings.vector_index_ivf_lists,
+            ivf_nprobe=settings.vector_index_ivf_nprobe,
+            ivf_min_size=settings.vector_index_ivf_min_size,
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    ####################### Stockage #######################
+
+    def _allocate(self, capacity: int, dim: int) -> np.ndarray:
+        if self.mmap_path:
+            path = f"{self.mmap_path}.{capacity}"
+            return np.memmap(path, dtype=np.float32, mode="w+", shape=(capacity, dim))
+        return np.empty((capacity, dim), dtype=np.float32)
+
+    def _reserve(self, count: int, dim: int) -> None:
+        if self._matrix is not None and self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match the index ({self._matrix.shape[1]})")
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if self._size + count <= capacity:
+            return
+        new_capacity = max(1024, capacity * 2, self._size + count)
+        matrix = self._allocate(new_capacity, dim)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            self._release(self._matrix)
+        self._matrix = matrix
+        self._alive = np.concatenate([self._alive, np.zeros(new_capacity - len(self._alive), dtype=bool)])
+        self._lists = np.concatenate([self._lists, np.full(new_capacity - len(self._lists), -1, dtype=np.int32)])
+
+    @staticmethod
+    def _release(matrix: np.ndarray) -> None:
+        if isinstance(matrix, np.memmap):
+            path = matrix.filename
+            del matrix
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def add(self, ids, vectors, payloads) -> None:
+        if not len(ids):
+            return
+        block = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        block = block / np.where(norms == 0, 1, norms)
+        with self._lock:
+            # Un identifiant déjà indexé est remplacé
+            self.remove([i for i in ids if i in self._rows])
+            self._reserve(len(ids), block.shape[1])
+            start = self._size
+            self._matrix[start:start + len(ids)] = block
+            self._alive[start:start + len(ids)] = True
+            for offset, (doc_id, payload) in enumerate(zip(ids, payloads)):
+                self._ids.append(doc_id)
+                self._payloads.append(payload)
+                self._rows[doc_id] = start + offset
+            self._size += len(ids)
+
+            if self._centroids is not None:
+                self._lists[start:self._size] = np.argmax(block @ self._centroids.T, axis=1)
+            if self.ivf_lists and len(self) >= self.ivf_min_size and len(self) >= 2 * self._trained_size:
+                self._train_ivf()
+
+    def update_payloads(self, payloads) -> None:
+        with self._lock:
+            for doc_id, payload in payloads.items():
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    self._payloads[row] = payload
+
+    def remove(self, ids) -> None:
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._payloads[row] = None
+            # Compaction quand la moitié des lignes sont supprimées
+            if self._size and len(self._rows) < self._size // 2:
+                self._compact()
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._release(self._matrix)
+            self._matrix = None
+            self._alive = np.zeros(0, dtype=bool)
+            self._lists = np.zeros(0, dtype=np.int32)
+            self._size = 0
+            self._ids, self._payloads, self._rows = [], [], {}
+            self._centroids, self._trained_size = None, 0
+
+    def _compact(self) -> None:
+        rows = np.flatnonzero(self._alive[:self._size])
+        ids = [self._ids[row] for row in rows]
+        payloads = [self._payloads[row] for row in rows]
+        vectors = np.array(self._matrix[rows])
+        lists = self._lists[rows]
+        centroids = self._centroids
+        self.clear()
+        self._reserve(len(rows), vectors.shape[1])
+        self._matrix[:len(rows)] = vectors
+        self._alive[:len(rows)] = True
+        self._lists[:len(rows)] = lists
+        self._ids, self._payloads = ids, payloads
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._size = len(rows)
+        self._centroids, self._trained_size = centroids, len(rows) if centroids is not None else 0
+        self._stats["compactions"] += 1
+
+    async def load(self, collection, batch_size: int = 1000) -> int:
+        """Read every stored chunk with its embedding"""
+        self.clear()
+        cursor = collection.find({"embedding": {"$exists": True}},
+                                 {"text": 1, "metadata": 1, "embedding": 1}).batch_size(batch_size)
+        ids, vectors, payloads = [], [], []
+        async for doc in cursor:
+            ids.append(doc["_id"])
+            vectors.append(doc["embedding"])
+            payloads.append({"text": doc.get("text", ""), "metadata": doc.get("metadata", {})})
+            if len(ids) >= batch_size:
+                self.add(ids, vectors, payloads)
+                ids, vectors, payloads = [], [], []
+        self.add(ids, vectors, payloads)
+        logging.debug(f"Local vector index loaded with {len(self)} chunks")
+        return len(self)
+
+    ####################### IVF #######################
+
+    def _train_ivf(self, iterations: int = 10, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        rows = np.flatnonzero(self._alive[:self._size])
+        nlist = min(self.ivf_lists, len(rows))
+        sample_rows = rng.choice(rows, size=min(len(rows), nlist * 40), replace=False)
+        sample = np.array(self._matrix[sample_rows])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1)
+        self._centroids = centroids
+        for start in range(0, self._size, 10_000):
+            end = min(start + 10_000, self._size)
+            self._lists[start:end] = np.argmax(self._matrix[start:end] @ centroids.T, axis=1)
+        self._trained_size = len(rows)
+
+    ####################### Recherche #######################
+
+    async def search(self, vector, k=4, num_candidates=None, filters=None):
+        if len(self) > self.executor_threshold:
+            # Gros corpus : le calcul ne doit pas bloquer la boucle d'évènements
+            results = await asyncio.get_event_loop().run_in_executor(
+                None, self.search_many, [vector], k, num_candidates, filters
+            )
+            return results[0]
+        return self.search_many([vector], k, num_candidates, filters)[0]
+
+    def search_many(self, vectors, k: int = 4, num_candidates: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Batched cosine top-k: one matrix product for all the query vectors"""
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._stats["searches"] += len(queries)
+            if not len(self):
+                return [[] for _ in queries]
+            allowed = self._alive[:self._size]
+            if filters:
+                allowed = allowed & np.array([
+                    payload is not None and matches(payload.get("metadata", {}), filters)
+                    for payload in self._payloads[:self._size]
+                ], dtype=bool)
+            if self._centroids is not None and len(self) >= self.ivf_min_size:
+                self._stats["ivf_searches"] += len(queries)
+                return [self._search_ivf(query, k, allowed) for query in queries]
+
+            scores = queries @ self._matrix[:self._size].T
+            scores[:, ~allowed] = -np.inf
+            return [self._top_k(np.arange(self._size), row, k) for row in scores]
+
+    def _search_ivf(self, query: np.ndarray, k: int, allowed: np.ndarray) -> List[Dict[str, Any]]:
+        probes = np.argsort(-(self._centroids @ query))[:self.ivf_nprobe]
+        rows = np.flatnonzero(np.isin(self._lists[:self._size], probes) & allowed)
+        if not len(rows):
+            return []
+        return self._top_k(rows, self._matrix[rows] @ query, k)
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        results = []
+        for i in best:
+            if not np.isfinite(scores[i]):
+                continue
+            payload = self._payloads[rows[i]]
+            results.append({"id": self._ids[rows[i]], **payload, "score": float(scores[i])})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "chunks": len(self),
+            "rows": self._size,
+            "dimension": None if self._matrix is None else int(self._matrix.shape[1]),
+            "memory_mapped": bool(self.mmap_path),
+            "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+            **self._stats,
+        }
+
+
+def create_vector_index(collection) -> VectorIndex:
+    """Build the backend selected by VECTOR_BACKEND"""
+    if settings.vector_backend == "atlas":
+        return AtlasVectorIndex(collection, index_name=settings.vector_index_name)
+    return LocalVectorIndex.from_settings()
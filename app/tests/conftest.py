@@ -0,0 +1,16 @@
+import pytest_asyncio
+from mongomock_motor import AsyncMongoMockClient
+from services.indexes import IndexManager
+from services.mongo_services import MongoDBService
+
+
+@pytest_asyncio.fixture
+async def mongo_service():
+    service = MongoDBService(client=AsyncMongoMockClient(), embeddings=object())
+    await IndexManager(service).ensure()
+    return service
+
+
+def turn(question, answer):
+    """The two messages of a chat turn"""
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
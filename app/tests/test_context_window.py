@@ -0,0 +1,50 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from services.context_window import ContextWindowBuilder, TokenCounter
+
+
+class ApproxCounter(TokenCounter):
+    """Compteur sans tiktoken : 4 caractères ≈ 1 token"""
+    def __init__(self):
+        self._encoding = None
+
+
+def _history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i} " + "x" * 36))
+        messages.append(AIMessage(content=f"réponse {i} " + "y" * 36))
+    return messages
+
+
+def test_whole_history_kept_when_within_budget():
+    builder = ContextWindowBuilder(counter=ApproxCounter(), max_tokens=10_000)
+    window = builder.build([SystemMessage(content="system")], _history(3), HumanMessage(content="suite"))
+
+    assert len(window.messages) == 1 + 6 + 1
+    assert window.dropped_messages == 0
+    assert window.tokens_saved == 0
+
+
+def test_oldest_turns_dropped_to_fit_budget():
+    builder = ContextWindowBuilder(counter=ApproxCounter(), max_tokens=80)
+    history = _history(5)
+    window = builder.build([SystemMessage(content="system")], history, HumanMessage(content="suite"))
+
+    assert window.prompt_tokens <= 80
+    assert window.dropped_messages > 0
+    assert window.tokens_saved > 0
+    # Le système reste en tête, la question courante en dernier, et la fenêtre commence par l'élève
+    assert isinstance(window.messages[0], SystemMessage)
+    assert window.messages[-1].content == "suite"
+    assert isinstance(window.messages[1], HumanMessage)
+    assert window.messages[1:-1] == history[window.dropped_messages:]
+    assert builder.stats()["truncated_requests"] == 1
+
+
+def test_summary_is_inserted_after_system_prompt():
+    builder = ContextWindowBuilder(counter=ApproxCounter(), max_tokens=10_000)
+    window = builder.build([SystemMessage(content="system")], [], HumanMessage(content="suite"),
+                           summary="L'élève révise les fractions.")
+
+    assert window.summary_used
+    assert "fractions" in window.messages[1].content
@@ -0,0 +1,52 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from mongomock_motor import AsyncMongoMockClient
+from services.embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeddings de test qui comptent les textes envoyés à l'« API »"""
+    model = "test-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 0.5, 0.25] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.mark.asyncio
+async def test_repeated_texts_skip_the_api():
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base)
+
+    first = await cache.aembed_documents(["chapitre 1", "chapitre 2", "chapitre 1"])
+    second = await cache.aembed_documents(["chapitre 2", "chapitre 3"])
+    query = await cache.aembed_query("chapitre 1")
+
+    assert base.calls == [["chapitre 1", "chapitre 2"], ["chapitre 3"]]
+    assert first[0] == first[2] == query == [10.0, 0.5, 0.25]
+    assert second[0] == first[1]
+
+
+@pytest.mark.asyncio
+async def test_persistent_store_is_shared_between_instances():
+    collection = AsyncMongoMockClient()["test"]["embedding_cache"]
+    await CachedEmbeddings(CountingEmbeddings(), collection=collection).aembed_documents(["cours"])
+
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base, collection=collection)
+    assert await cache.aembed_query("cours") == [5.0, 0.5, 0.25]
+    assert base.calls == []
+    assert cache.stats()["store_hits"] == 1
+
+
+def test_memory_level_is_bounded():
+    cache = CachedEmbeddings(CountingEmbeddings(), max_entries=2)
+    cache.embed_documents(["a", "b", "c"])
+
+    assert cache.stats()["entries"] == 2
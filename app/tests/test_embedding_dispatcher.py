@@ -0,0 +1,61 @@
+import asyncio
+import time
+import pytest
+from langchain_core.embeddings import Embeddings
+from services.embedding_dispatcher import EmbeddingDispatcher, TokenBucket
+
+
+class RateLimitError(Exception):
+    """Même nom que l'erreur 429 du client OpenAI"""
+
+
+class BatchRecordingEmbeddings(Embeddings):
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    def embed_documents(self, texts):
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError("429")
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_coalesced_into_batches():
+    base = BatchRecordingEmbeddings()
+    dispatcher = EmbeddingDispatcher(base, batch_size=4, batch_wait_ms=20)
+
+    results = await asyncio.gather(
+        dispatcher.aembed_query("a"),
+        dispatcher.aembed_documents(["bb", "ccc"]),
+        dispatcher.aembed_documents(["dddd", "eeeee", "f"]),
+    )
+
+    assert results == [[1.0], [[2.0], [3.0]], [[4.0], [5.0], [1.0]]]
+    assert [len(batch) for batch in base.batches] == [4, 2]
+    assert dispatcher.stats()["avg_batch_size"] == 3
+    dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_errors_are_retried():
+    base = BatchRecordingEmbeddings(failures=2)
+    dispatcher = EmbeddingDispatcher(base, batch_wait_ms=0, retry_base_delay=0.001)
+
+    assert await dispatcher.aembed_documents(["x", "yy"]) == [[1.0], [2.0]]
+    assert dispatcher.stats()["retries"] == 2
+    dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(tokens_per_minute=6000)  # 100 tokens par seconde
+    assert await bucket.acquire(6000) == 0
+    start = time.monotonic()
+    await bucket.acquire(10)
+    assert time.monotonic() - start >= 0.09
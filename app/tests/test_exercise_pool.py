@@ -0,0 +1,94 @@
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from mongomock_motor import AsyncMongoMockClient
+from models.exercise import ExerciseContent, ExerciseResponse, ExerciseType, Solution
+from services.exercise_pool import ExercisePool, exercise_cache_key
+from services.llm_serv import LLMService
+from services.mongo_services import MongoDBService
+from services.session_cache import SessionCache
+
+PARAMETERS = {"subject": "Mathématiques", "topic": "fractions", "exercise_type": "multiple_choice",
+              "difficulty": "medium", "number_of_questions": 2, "teacher_id": None}
+
+
+def _exercise(tag):
+    return ExerciseResponse(
+        exercise=ExerciseContent(
+            instructions=f"Variante {tag}",
+            questions=[
+                {"question": "1/2 + 1/4 ?", "options": ["1/4", "3/4", "2/6", "1"], "type": "multiple_choice"},
+                {"question": "2/4 = ?", "options": ["1/2", "1/4", "2", "4"], "type": "multiple_choice"},
+            ],
+        ),
+        solutions=Solution(answers=[{"correct_answer": "3/4"}, {"correct_answer": "1/2"}],
+                           explanations=["Même dénominateur", "On simplifie par 2"]),
+    )
+
+
+def _pool(**kwargs):
+    collection = AsyncMongoMockClient()["test"]["exercises"]
+    return ExercisePool(collection=collection, refresh_rate=0, **kwargs)
+
+
+def test_cache_key_is_normalized():
+    assert exercise_cache_key("Mathématiques", " Fractions ", "multiple_choice", "medium", 2) == \
+        exercise_cache_key("mathematiques", "fractions", "multiple_choice", "MEDIUM", 2)
+    assert exercise_cache_key("maths", "fractions", "multiple_choice", "medium", 2, "t1") != \
+        exercise_cache_key("maths", "fractions", "multiple_choice", "medium", 2, "t2")
+
+
+@pytest.mark.asyncio
+async def test_pool_serves_only_with_enough_variants():
+    pool = _pool(min_variants=2)
+    key = exercise_cache_key(**PARAMETERS)
+
+    assert await pool.get(key) is None
+    await pool.add(key, PARAMETERS, _exercise("a"))
+    assert await pool.get(key) is None
+    await pool.add(key, PARAMETERS, _exercise("b"))
+
+    served = await pool.get(key)
+    assert served.exercise.instructions in ("Variante a", "Variante b")
+    assert pool.stats()["memory_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shuffled_variant_keeps_solutions_aligned():
+    pool = _pool(min_variants=1)
+    key = exercise_cache_key(**PARAMETERS)
+    await pool.add(key, PARAMETERS, _exercise("a"))
+
+    for _ in range(5):
+        served = await pool.get(key)
+        for question, answer in zip(served.exercise.questions, served.solutions.answers):
+            expected = "3/4" if question["question"] == "1/2 + 1/4 ?" else "1/2"
+            assert answer["correct_answer"] == expected
+            assert expected in question["options"]
+
+
+@pytest.mark.asyncio
+async def test_invalid_exercises_are_not_pooled():
+    pool = _pool(min_variants=1)
+    key = exercise_cache_key(**PARAMETERS)
+    incomplete = _exercise("a")
+    incomplete.solutions.answers.pop()
+
+    assert await pool.add(key, PARAMETERS, incomplete) is None
+    assert pool.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_generated_variants_do_not_go_to_the_exercises_collection():
+    mongo_service = MongoDBService(client=AsyncMongoMockClient(), embeddings=object())
+    generated = _exercise("a")
+    llm = FakeListChatModel(responses=[json.dumps({"exercise": generated.exercise.model_dump(),
+                                                   "solutions": generated.solutions.model_dump()})])
+    llm_service = LLMService(mongo_services=mongo_service, llm=llm, conversation_store=SessionCache())
+
+    await llm_service.generate_exercise(subject="Mathématiques", topic="fractions",
+                                        exercise_type=ExerciseType("multiple_choice"),
+                                        difficulty="medium", number_of_questions=2)
+
+    assert await mongo_service.pooled_exercises.count_documents({"cache_key": {"$exists": True}}) == 1
+    assert await mongo_service.exercises.count_documents({}) == 0
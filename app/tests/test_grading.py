@@ -0,0 +1,66 @@
+from services.grading import AnswerGrader, normalize_answer
+
+EXERCISE = {
+    "exercise_type": "multiple_choice",
+    "exercise": {
+        "instructions": "Réponds aux questions",
+        "questions": [
+            {"question": "Capitale de la France ?", "options": ["A) Lyon", "B) Paris", "C) Nice", "D) Lille"],
+             "type": "multiple_choice"},
+            {"question": "La Terre est plate.", "type": "true_false"},
+            {"question": "Le ___ est la capitale de l'Italie.", "type": "fill_in_blank"},
+            {"question": "Explique la photosynthèse.", "type": "short_answer"},
+        ],
+    },
+    "solutions": {
+        "answers": [
+            {"correct_answer": "Paris", "correct_option": 1},
+            {"correct_answer": "Faux"},
+            {"correct_answer": "Rome"},
+            {"correct_answer": "Conversion de la lumière en énergie chimique"},
+        ],
+        "explanations": ["", "", "", ""],
+    },
+}
+
+
+def test_normalize_answer_ignores_case_accents_and_spaces():
+    assert normalize_answer("  Élève   Modèle. ") == "eleve modele"
+
+
+def test_objective_questions_graded_locally():
+    grader = AnswerGrader()
+    grades = grader.grade(EXERCISE, [
+        {"question_number": 1, "answer": "b"},
+        {"question_number": 2, "answer": "faux"},
+        {"question_number": 3, "answer": " rome "},
+        {"question_number": 4, "answer": "Les plantes fabriquent du sucre"},
+    ])
+
+    assert [grade.is_correct for grade in grades] == [True, True, True, None]
+    assert not grades[0].needs_llm
+    assert grades[3].needs_llm
+    assert grader.stats()["graded_locally"] == 3
+
+
+def test_wrong_answers_keep_local_verdict():
+    grader = AnswerGrader()
+    grades = grader.grade(EXERCISE, ["Lyon", "Vrai", "Milan"])
+
+    assert grades[0].is_correct is False
+    assert grades[0].expected == "B) Paris"
+    assert grades[1].is_correct is False
+    # Texte à trous différent : le LLM décide (synonyme, faute de frappe)
+    assert grades[2].is_correct is None
+    # Question sans réponse
+    assert grades[3].is_correct is False
+
+
+def test_summary_score():
+    grader = AnswerGrader()
+    grades = grader.grade(EXERCISE, ["Paris", "Faux", "Rome", ""])
+    result = grader.summarize(grades)
+
+    assert result["score"] == 0.75
+    assert result["is_correct"] is False
+    assert len(result["question_feedback"]) == 4
@@ -0,0 +1,45 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from services.indexes import IndexManager, IndexSpec
+from services.mongo_services import MongoDBService
+
+
+@pytest.fixture
+def mongo_service():
+    return MongoDBService(client=AsyncMongoMockClient(), embeddings=object())
+
+
+@pytest.mark.asyncio
+async def test_declared_indexes_are_created_once(mongo_service):
+    manager = IndexManager(mongo_service)
+    report = await manager.ensure()
+    assert "conversations.session_id_1" in report["created"]
+    assert "teachers.teacher_id_1" in report["created"]
+    assert report["missing"] == []
+
+    info = await mongo_service.conversations.index_information()
+    assert info["session_id_1"]["unique"] is True
+    assert (await manager.ensure())["created"] == []
+
+
+@pytest.mark.asyncio
+async def test_undeclared_and_failed_indexes_are_reported(mongo_service):
+    await mongo_service.teachers.create_index("name")
+    await mongo_service.teachers.insert_many([{"teacher_id": "t"}, {"teacher_id": "t"}])
+    specs = [IndexSpec("teachers", (("teacher_id", 1),), unique=True)]
+
+    report = await IndexManager(mongo_service, indexes=specs).ensure()
+    assert report["missing"] == ["teachers.teacher_id_1"]
+    assert report["undeclared"] == ["teachers.name_1"]
+
+    with pytest.raises(RuntimeError):
+        await IndexManager(mongo_service, indexes=specs, strict=True).ensure()
+
+
+@pytest.mark.asyncio
+async def test_missing_required_index_fails_even_when_not_strict(mongo_service):
+    # Doublons hérités : sans l'index unique, un tour rejoué créerait une seconde conversation
+    await mongo_service.conversations.insert_many([{"session_id": "s1"}, {"session_id": "s1"}])
+
+    with pytest.raises(RuntimeError, match="conversations.session_id_1"):
+        await IndexManager(mongo_service, strict=False).ensure()
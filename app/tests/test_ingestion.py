@@ -0,0 +1,230 @@
+import io
+from datetime import datetime, timedelta
+import pytest
+from fastapi import UploadFile
+from langchain_core.embeddings import Embeddings
+from mongomock_motor import AsyncMongoMockClient
+from reportlab.pdfgen import canvas
+from core.config import settings
+from services.ingestion import IngestionPipeline
+from services.ingestion_jobs import IngestionJobQueue
+from services.mongo_services import MongoDBService
+from services.vector_index import LocalVectorIndex
+
+
+class LengthEmbeddings(Embeddings):
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def _pdf(pages=6, lines=40):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for page in range(pages):
+        for line in range(lines):
+            pdf.drawString(40, 800 - 18 * line, f"Page {page} ligne {line} du cours de mathematiques.")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    embeddings = LengthEmbeddings()
+    service = MongoDBService(client=AsyncMongoMockClient(), embeddings=embeddings, vector_index=LocalVectorIndex())
+    pipeline = IngestionPipeline(service, workers=1, pages_per_batch=2, embed_batch_size=5, spool_dir=str(tmp_path))
+    yield pipeline
+    pipeline.close()
+
+
+@pytest.mark.asyncio
+async def test_pdf_is_ingested_by_batches_with_global_chunk_ids(pipeline, tmp_path):
+    content = _pdf()
+    upload = UploadFile(file=io.BytesIO(content), filename="cours.pdf")
+
+    count = await pipeline.ingest_upload(upload, {"filename": "cours.pdf"})
+
+    # Même découpage que l'extraction du document entier en une fois
+    expected = pipeline.mongo_service.text_splitter.split_text(pipeline.mongo_service._process_pdf(content))
+    assert count == len(expected)
+    assert max(pipeline.mongo_service.embeddings.batches) <= 5
+    docs = await pipeline.mongo_service.rag_collection.find({}, {"chunk_id": 1}).to_list(None)
+    assert sorted(d["chunk_id"] for d in docs) == list(range(count))
+    assert len(pipeline.mongo_service.vector_index) == count
+    assert pipeline.stats()["pages"] == 6
+    # Le fichier temporaire est supprimé
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_unsupported_format_is_rejected(pipeline):
+    upload = UploadFile(file=io.BytesIO(b"texte"), filename="notes.txt")
+    with pytest.raises(Exception):
+        await pipeline.ingest_upload(upload, {})
+
+
+@pytest.mark.asyncio
+async def test_job_queue_ingests_files_in_background_and_reports_progress(pipeline):
+    jobs = IngestionJobQueue(pipeline, pipeline.mongo_service.ingestion_jobs, workers=2)
+    await jobs.start()
+    files = [UploadFile(file=io.BytesIO(_pdf(pages=2)), filename="a.pdf"),
+             UploadFile(file=io.BytesIO(b"texte"), filename="notes.txt")]
+    metadata = [{"filename": f.filename, "file_id": f.filename} for f in files]
+
+    job = await jobs.submit(files, metadata)
+    assert job["status"] == "queued"
+    await jobs._queue.join()
+    await jobs.stop()
+
+    progress = await jobs.get(job["_id"])
+    assert progress["status"] == "partial"
+    assert [f["status"] for f in progress["files"]] == ["completed", "failed"]
+    assert progress["files"][0]["chunks"] == progress["chunks"] > 0
+    assert await pipeline.mongo_service.rag_collection.count_documents({"metadata.job_id": job["_id"]}) == progress["chunks"]
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_is_resumed_on_start(pipeline, tmp_path):
+    path = tmp_path / "b.pdf"
+    path.write_bytes(_pdf(pages=1))
+    collection = pipeline.mongo_service.ingestion_jobs
+    metadata = {"filename": "b.pdf", "file_id": "b", "job_id": "job1"}
+    # Chunk inséré avant l'interruption : il ne doit pas être dupliqué
+    await pipeline.mongo_service.rag_collection.insert_one({"text": "partiel", "metadata": metadata})
+    await collection.insert_one({
+        "_id": "job1", "status": "running", "created_at": datetime.utcnow(), "finished_at": None,
+        "files": [{"filename": "b.pdf", "metadata": metadata, "status": "running", "chunks": 1, "error": None,
+                   "path": str(path), "started_at": datetime.utcnow(), "finished_at": None}]
+    })
+
+    jobs = IngestionJobQueue(pipeline, collection, workers=1)
+    await jobs.start()
+    await jobs._queue.join()
+    await jobs.stop()
+
+    progress = await jobs.get("job1")
+    assert progress["status"] == "completed"
+    assert jobs.stats()["files_resumed"] == 1
+    texts = [d["text"] async for d in pipeline.mongo_service.rag_collection.find({"metadata.job_id": "job1"})]
+    assert "partiel" not in texts and len(texts) == progress["chunks"]
+    assert not path.exists()
+
+
+def _running_job(job_id, path, owner, heartbeat):
+    metadata = {"filename": "c.pdf", "file_id": job_id, "job_id": job_id}
+    return {
+        "_id": job_id, "status": "running", "created_at": datetime.utcnow(), "finished_at": None,
+        "files": [{"filename": "c.pdf", "metadata": metadata, "status": "running", "chunks": 0, "error": None,
+                   "path": str(path), "started_at": heartbeat, "finished_at": None,
+                   "owner": owner, "heartbeat": heartbeat}]
+    }
+
+
+@pytest.mark.asyncio
+async def test_file_of_a_live_worker_is_not_resumed_by_another_process(pipeline, tmp_path):
+    path = tmp_path / "c.pdf"
+    path.write_bytes(_pdf(pages=1))
+    collection = pipeline.mongo_service.ingestion_jobs
+    await collection.insert_many([
+        _running_job("live", path, "other-process", datetime.utcnow()),
+        _running_job("dead", path, "crashed-process", datetime.utcnow() - timedelta(minutes=10)),
+    ])
+
+    jobs = IngestionJobQueue(pipeline, collection, workers=1, stale_seconds=60)
+    await jobs._resume()
+
+    assert list(jobs._queue._queue) == [("dead", 0)]
+    live = await collection.find_one({"_id": "live"})
+    assert live["files"][0]["status"] == "running" and live["files"][0]["owner"] == "other-process"
+
+
+@pytest.mark.asyncio
+async def test_file_is_claimed_once(pipeline, tmp_path):
+    path = tmp_path / "d.pdf"
+    path.write_bytes(_pdf(pages=1))
+    collection = pipeline.mongo_service.ingestion_jobs
+    first = IngestionJobQueue(pipeline, collection, workers=1)
+    second = IngestionJobQueue(pipeline, collection, workers=1)
+    await collection.insert_one({
+        "_id": "job2", "status": "queued", "created_at": datetime.utcnow(), "finished_at": None,
+        "files": [{"filename": "d.pdf", "metadata": {"file_id": "d", "job_id": "job2"}, "status": "queued",
+                   "chunks": 0, "error": None, "path": str(path), "started_at": None, "finished_at": None}]
+    })
+
+    await first._process("job2", 0)
+    # Fichier terminé : un second processus (ou un rejeu) ne le ré-ingère pas
+    await second._process("job2", 0)
+
+    assert first.stats()["files_completed"] == 1
+    assert second.stats()["files_skipped"] == 1 and second.stats()["files_completed"] == 0
+    assert (await first.get("job2"))["status"] == "completed"
+
+
+def _html(path, paragraphs):
+    path.write_text("<html><body>" + "".join(f"<p>{p}</p>" for p in paragraphs) + "</body></html>")
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_reingest_only_embeds_changed_chunks_and_deletes_stale_ones(pipeline, tmp_path):
+    service = pipeline.mongo_service
+    embedded = lambda: sum(service.embeddings.batches)
+    paragraphs = [f"Section {i}. " + f"Contenu de la section {i}. " * 35 for i in range(4)]
+    metadata = {"filename": "cours.html", "file_id": "cours"}
+
+    first = await pipeline.ingest_path(_html(tmp_path / "v1.html", paragraphs), "cours.html", metadata)
+    assert await service.rag_collection.count_documents({}) == first == embedded()
+
+    # Ré-upload identique : aucun embedding, aucun doublon
+    await pipeline.ingest_path(_html(tmp_path / "v1bis.html", paragraphs), "cours.html", metadata)
+    assert embedded() == first
+    assert await service.rag_collection.count_documents({}) == first
+
+    # Nouvelle version : dernière section remplacée
+    paragraphs[-1] = "Section 3 réécrite. " + "Nouveau contenu. " * 60
+    before = embedded()
+    second = await pipeline.ingest_path(_html(tmp_path / "v2.html", paragraphs), "cours.html", metadata)
+    texts = [d["text"] async for d in service.rag_collection.find({"metadata.file_id": "cours"})]
+    assert 0 < embedded() - before < second
+    assert len(texts) == second == len(service.vector_index)
+    assert not any("Contenu de la section 3" in text for text in texts)
+    assert pipeline.stats()["stale_chunks"] > 0
+
+
+@pytest.mark.asyncio
+async def test_chunks_are_not_read_back_unless_sampled_verification_is_enabled(pipeline, monkeypatch):
+    service = pipeline.mongo_service
+    counts = []
+    count_documents = service.rag_collection.count_documents
+
+    async def counting(query, *args, **kwargs):
+        counts.append(len(query["_id"]["$in"]))
+        return await count_documents(query, *args, **kwargs)
+
+    monkeypatch.setattr(service.rag_collection, "count_documents", counting)
+    await service.add_texts_to_vectorstore(["un", "deux", "trois"], {"file_id": "f"})
+    assert counts == []
+
+    monkeypatch.setattr(settings, "ingestion_verify_sample_size", 2)
+    await service.add_texts_to_vectorstore(["quatre", "cinq", "six"], {"file_id": "f"})
+    assert counts == [2]
+
+
+@pytest.mark.asyncio
+async def test_metadata_change_of_stored_chunks_reaches_the_indexes(pipeline):
+    service = pipeline.mongo_service
+    await service.add_texts_to_vectorstore(["fractions et décimaux"], {"file_id": "f", "subject": "maths"})
+    await service.add_texts_to_vectorstore(["fractions et décimaux"], {"file_id": "f", "subject": "physique"})
+
+    assert sum(service.embeddings.batches) == 1
+    results = await service.vector_index.search([21.0, 1.0], k=1, filters={"subject": "physique"})
+    assert [r["metadata"]["subject"] for r in results] == ["physique"]
+    assert service.lexical_index.search("fractions", filters={"subject": "physique"})
+    assert service.lexical_index.search("fractions", filters={"subject": "maths"}) == []
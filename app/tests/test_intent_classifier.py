@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from mongomock_motor import AsyncMongoMockClient
+from api.endpoints.smart import analyze_intent
+from services.intent_classifier import IntentClassifier
+from services.llm_serv import LLMService
+from services.mongo_services import MongoDBService
+from services.session_cache import SessionCache
+
+EXERCISE_ID = "65f123abc456def789abcdef"
+
+
+def test_plain_chat_is_resolved_locally():
+    classifier = IntentClassifier(model_path=None)
+    result = classifier.classify("Quelle est la capitale de la France ?")
+
+    assert result["intent"] == "chat"
+    assert classifier.stats()["hits"]["rules"] == 1
+
+
+def test_hint_and_solution_with_exercise_id():
+    classifier = IntentClassifier(model_path=None)
+    hint = classifier.classify(f"Je voudrais un indice pour la question 3 de l'exercice {EXERCISE_ID}")
+    solution = classifier.classify(f"Montre-moi la solution de {EXERCISE_ID}")
+
+    assert hint["intent"] == "get_hint"
+    assert hint["parameters"] == {"exercise_id": EXERCISE_ID, "question_number": 3}
+    assert solution["intent"] == "get_solution"
+    assert solution["parameters"]["exercise_id"] == EXERCISE_ID
+
+
+def test_numbered_answers_are_extracted():
+    classifier = IntentClassifier(model_path=None)
+    result = classifier.classify(f"Voici mes réponses pour {EXERCISE_ID} : 1. x=5, 2. y=10, 3) Vrai")
+
+    assert result["intent"] == "evaluate_answers"
+    assert result["parameters"]["exercise_id"] == EXERCISE_ID
+    assert [a["answer"] for a in result["parameters"]["user_answers"]] == ["x=5", "y=10", "Vrai"]
+
+
+def test_exercise_request_parameters():
+    classifier = IntentClassifier(model_path=None)
+    result = classifier.classify("Donne-moi un QCM de 5 questions sur les fractions, niveau facile")
+
+    assert result["intent"] == "generate_exercise"
+    assert result["parameters"]["exercise_type"] == "multiple_choice"
+    assert result["parameters"]["number_of_questions"] == 5
+    assert result["parameters"]["difficulty"] == "easy"
+    assert result["parameters"]["topic"] == "fractions"
+
+
+def test_uncertain_messages_fall_back_to_llm():
+    classifier = IntentClassifier(model_path=None)
+
+    # Indice sans identifiant : le LLM le retrouvera dans l'historique
+    assert classifier.classify("Je suis bloqué sur la question 3, peux-tu m'aider ?") is None
+    # Demande d'exercice sans sujet précis
+    assert classifier.classify("Donne-moi des exercices") is None
+
+
+def test_messages_without_keywords_are_not_classified_as_chat():
+    classifier = IntentClassifier(model_path=None)
+
+    # Formulations absentes des listes de mots-clés (exercice, réponses) : décidées par le LLM
+    assert classifier.classify("Entraîne-moi sur les dérivées") is None
+    assert classifier.classify("J'ai fini, voilà ce que j'ai trouvé : 42 et 17") is None
+
+
+@pytest.mark.asyncio
+async def test_llm_decision_is_logged_off_the_request_path(monkeypatch):
+    mongo_service = MongoDBService(client=AsyncMongoMockClient(), embeddings=object())
+    llm_service = LLMService(mongo_services=mongo_service, llm=FakeListChatModel(responses=['{"intent": "chat"}']),
+                             conversation_store=SessionCache())
+    released = asyncio.Event()
+    insert_one = mongo_service.intent_logs.insert_one
+
+    async def slow_insert(document):
+        await released.wait()
+        return await insert_one(document)
+
+    monkeypatch.setattr(mongo_service.intent_logs, "insert_one", slow_insert)
+    result = await analyze_intent("Raconte-moi une histoire", None, llm_service, mongo_service=mongo_service)
+
+    assert result["intent"] == "chat"
+    assert await mongo_service.intent_logs.count_documents({}) == 0
+    released.set()
+    await llm_service.flush_background_tasks()
+    assert await mongo_service.intent_logs.count_documents({"source": "llm"}) == 1
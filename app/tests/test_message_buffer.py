@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from core.config import settings
+from services.message_buffer import MessageWriteBuffer
+from conftest import turn
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage", ["embedded", "bucketed"])
+async def test_concurrent_turns_are_group_committed(mongo_service, monkeypatch, storage):
+    monkeypatch.setattr(settings, "message_storage", storage)
+    mongo_service.write_buffer = MessageWriteBuffer(mongo_service, durability="sync", flush_interval_ms=20)
+    results = await asyncio.gather(*(
+        mongo_service.save_turn(f"s{i % 3}", turn(f"Question {i}", f"Réponse {i}"), f"t{i}") for i in range(9)
+    ))
+
+    assert all(results)
+    stats = mongo_service.write_buffer.stats()
+    assert stats["flushes"] == 1 and stats["operations"] == 9 and stats["messages"] == 18
+    history = await mongo_service.get_conversation_history("s1")
+    assert [m["content"] for m in history] == ["Question 1", "Réponse 1", "Question 4", "Réponse 4",
+                                              "Question 7", "Réponse 7"]
+
+
+@pytest.mark.asyncio
+async def test_async_writes_are_visible_to_reads_and_replays_skipped(mongo_service):
+    mongo_service.write_buffer = MessageWriteBuffer(mongo_service, durability="async", flush_interval_ms=1000)
+    assert await mongo_service.save_turn("s1", turn("Bonjour", "Salut"), "t1") is True
+    assert mongo_service.write_buffer.stats()["backlog"] == 2
+
+    # La lecture force le flush des écritures de la session
+    assert len(await mongo_service.get_conversation_history("s1")) == 2
+    await mongo_service.save_turn("s1", turn("Bonjour", "Salut"), "t1")
+    await mongo_service.write_buffer.close()
+    assert len(await mongo_service.get_conversation_history("s1")) == 2
+    assert mongo_service.write_buffer.stats()["duplicates"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried(mongo_service, monkeypatch):
+    mongo_service.write_buffer = MessageWriteBuffer(mongo_service, flush_interval_ms=1, retry_base_delay=0)
+    bulk_append = mongo_service.bulk_append_messages
+    calls = []
+
+    async def flaky(writes):
+        calls.append(writes)
+        if len(calls) == 1:
+            raise ConnectionError("network")
+        return await bulk_append(writes)
+
+    monkeypatch.setattr(mongo_service, "bulk_append_messages", flaky)
+    assert await mongo_service.save_message("s1", "user", "Bonjour") is True
+    assert len(calls) == 2 and mongo_service.write_buffer.stats()["retries"] == 1
+    assert len(await mongo_service.get_conversation_history("s1")) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage", ["embedded", "bucketed"])
+async def test_replay_in_a_batch_does_not_drop_its_neighbours(mongo_service, monkeypatch, storage):
+    monkeypatch.setattr(settings, "message_storage", storage)
+    mongo_service.write_buffer = MessageWriteBuffer(mongo_service, durability="sync", flush_interval_ms=20)
+    assert await mongo_service.save_turn("s1", turn("Bonjour", "Salut"), "t1") is True
+
+    # Rejeu de t1, nouveau tour t2 et t2 envoyé deux fois, dans le même flush
+    results = await asyncio.gather(
+        mongo_service.save_turn("s1", turn("Bonjour", "Salut"), "t1"),
+        mongo_service.save_turn("s1", turn("Ça va ?", "Oui"), "t2"),
+        mongo_service.save_turn("s1", turn("Ça va ?", "Oui"), "t2"),
+    )
+
+    assert results == [False, True, False]
+    history = await mongo_service.get_conversation_history("s1")
+    assert [m["content"] for m in history] == ["Bonjour", "Salut", "Ça va ?", "Oui"]
+    assert mongo_service.write_buffer.stats()["duplicates"] == 2
@@ -0,0 +1,81 @@
+import json
+from string import Formatter
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from mongomock_motor import AsyncMongoMockClient
+from models.exercise import ExerciseType
+from models.teacher import initial_teachers
+from services.context_window import TokenCounter
+from services.llm_serv import LLMService
+from services.mongo_services import MongoDBService
+from services.prompts import PROMPTS, PromptRegistry, PromptTemplate
+from services.teacher_registry import TeacherRegistry
+
+
+def test_static_prefix_comes_first_and_is_shared():
+    registry = PromptRegistry(counter=TokenCounter())
+    first = registry.render("smart.intent", message="Bonjour", history="")
+    second = registry.render("smart.intent", message="Donne-moi un exercice", history="")
+
+    assert first.key == "smart.intent@2"
+    assert isinstance(first.messages[0], SystemMessage) and isinstance(first.messages[-1], HumanMessage)
+    # Le même objet SystemMessage est réutilisé, seule la partie variable change
+    assert first.messages[0] is second.messages[0]
+    assert first.prefix_tokens == second.prefix_tokens
+    # Aucune valeur variable dans les instructions statiques
+    for template in PROMPTS:
+        fields = {name for _, name, _, _ in Formatter().parse(template.user) if name}
+        assert fields and not any(f"{{{name}}}" in template.system for name in fields)
+
+
+def test_latest_version_wins():
+    registry = PromptRegistry(counter=TokenCounter())
+    registry.register(PromptTemplate("smart.intent", 3, "Classe le message.", "{message}{history}"))
+    registry.register(PromptTemplate("smart.intent", 1, "Ancien prompt.", "{message}{history}"))
+    assert registry.get("smart.intent").key == "smart.intent@3"
+
+
+def test_accounting_uses_reported_usage_or_estimates_the_prefix():
+    registry = PromptRegistry(counter=TokenCounter(), cache_min_tokens=100)
+    prompt = registry.render("smart.intent", message="Bonjour", history="")
+    message = AIMessage(content="{}", usage_metadata={
+        "input_tokens": 1500, "output_tokens": 5, "total_tokens": 1505,
+        "input_token_details": {"cache_read": 1280}
+    })
+    reported = registry.record(prompt, LLMResult(generations=[[ChatGeneration(message=message)]]))
+    estimated = registry.record(prompt)
+
+    assert reported == {"prompt": "smart.intent@2", "prompt_tokens": 1500, "cached_tokens": 1280,
+                        "uncached_tokens": 220, "reported": True}
+    assert estimated["cached_tokens"] == prompt.prefix_tokens and not estimated["reported"]
+    stats = registry.stats()["prompts"]["smart.intent@2"]
+    assert stats["requests"] == 2 and stats["reported_requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_exercise_prompt_starts_with_the_teacher_persona():
+    mongo_service = MongoDBService(client=AsyncMongoMockClient(), embeddings=object())
+    await mongo_service.seed_teachers(initial_teachers)
+    exercise = {"exercise": {"instructions": "Réponds", "questions": [{"question": "1+1 ?", "type": "short_answer"}]},
+                "solutions": {"answers": [{"correct_answer": "2"}], "explanations": ["1+1=2"]}}
+    llm = FakeListChatModel(responses=[json.dumps(exercise)])
+    llm_service = LLMService(mongo_services=mongo_service, llm=llm,
+                             teacher_registry=TeacherRegistry(mongo_service.teachers, counter=TokenCounter()))
+    sent = []
+    agenerate = llm.agenerate
+
+    async def capture(messages, *args, **kwargs):
+        sent.extend(messages[0])
+        return await agenerate(messages, *args, **kwargs)
+
+    object.__setattr__(llm, "agenerate", capture)
+    await llm_service.generate_exercise("Mathématiques", "additions", ExerciseType.SHORT_ANSWER, "easy", 1,
+                                        teacher_id="maths_teacher", use_pool=False)
+
+    teacher = await llm_service.teacher_registry.get("maths_teacher")
+    assert sent[0] is teacher.system_message
+    assert sent[1] is llm_service.prompts.get("exercise.generate").system_message
+    assert "additions" in sent[2].content
+    assert llm_service.prompts.stats()["prompts"]["exercise.generate@2"]["requests"] == 1
@@ -0,0 +1,64 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from services.lexical_index import BM25Index, tokenize
+from services.retrieval import HybridRetriever
+from services.vector_index import LocalVectorIndex
+
+CHUNKS = [
+    ("c1", "La Révolution française commence en 1789 avec la prise de la Bastille.", "histoire.pdf"),
+    ("c2", "Le théorème de Pythagore relie les côtés d'un triangle rectangle.", "maths.pdf"),
+    ("c3", "Les révolutions politiques du XIXe siècle en Europe.", "histoire.pdf"),
+    ("c4", "Le subjonctif exprime le doute, la volonté ou le sentiment.", "francais.pdf"),
+]
+
+
+class TopicEmbeddings(Embeddings):
+    """Vecteurs par thème : la recherche vectorielle ignore les dates et les noms propres"""
+    TOPICS = (("revolution", "bastille", "histoire"), ("triangle", "pythagore", "theoreme"), ("subjonctif", "doute"))
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        tokens = set(tokenize(text))
+        return [float(any(t.startswith(word) for t in tokens for word in topic)) + 0.01 for topic in self.TOPICS]
+
+
+def _retriever(**kwargs):
+    ids = [c[0] for c in CHUNKS]
+    texts = [c[1] for c in CHUNKS]
+    payloads = [{"text": c[1], "metadata": {"filename": c[2]}} for c in CHUNKS]
+    embeddings = TopicEmbeddings()
+    vector_index, lexical_index = LocalVectorIndex(), BM25Index()
+    vector_index.add(ids, embeddings.embed_documents(texts), payloads)
+    lexical_index.add(ids, texts, payloads)
+    return HybridRetriever(embeddings, vector_index, lexical_index, **kwargs)
+
+
+def test_bm25_matches_exact_terms_without_accents():
+    index = BM25Index()
+    index.add([c[0] for c in CHUNKS], [c[1] for c in CHUNKS], [{"text": c[1], "metadata": {}} for c in CHUNKS])
+    assert index.search("revolution 1789")[0][0] == "c1"
+    assert index.search("théorème")[0][0] == "c2"
+    index.remove(["c1"])
+    assert [doc_id for doc_id, _ in index.search("1789")] == []
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_ranks_exact_date_first():
+    retriever = _retriever()
+    # Vecteurs identiques pour c1 et c3 : seule la date les départage
+    vector = await retriever.search("Révolution en 1789", mode="vector", k=2)
+    hybrid = await retriever.search("Révolution en 1789", mode="hybrid", k=2)
+
+    assert {chunk["id"] for chunk in vector} == {"c1", "c3"}
+    assert hybrid[0]["id"] == "c1"
+    assert hybrid[0]["lexical_score"] > 0 and hybrid[0]["vector_score"] is not None
+    assert retriever.stats()["hybrid"]["searches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_metadata_filters_apply_to_both_indexes():
+    retriever = _retriever()
+    results = await retriever.search("révolution triangle", k=4, filters={"filename": "maths.pdf"})
+    assert [chunk["id"] for chunk in results] == ["c2"]
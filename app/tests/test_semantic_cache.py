@@ -0,0 +1,92 @@
+import time
+import pytest
+from langchain_core.embeddings import Embeddings
+from mongomock_motor import AsyncMongoMockClient
+from services.mongo_services import MongoDBService
+from services.semantic_cache import SemanticCache
+from services.vector_index import LocalVectorIndex
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeddings de test : un axe par mot-clé connu"""
+    KEYWORDS = ["pythagore", "thales", "fraction"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        text = text.lower()
+        return [1.0 if word in text else 0.01 for word in self.KEYWORDS]
+
+
+@pytest.mark.asyncio
+async def test_similar_question_hits_same_namespace_only():
+    cache = SemanticCache(embeddings=KeywordEmbeddings(), threshold=0.9)
+    namespace = cache.namespace("math_teacher")
+
+    answer, vector = await cache.lookup(namespace, "C'est quoi le théorème de Pythagore ?")
+    assert answer is None
+    cache.store(namespace, "C'est quoi le théorème de Pythagore ?", vector, "a² + b² = c²")
+
+    answer, _ = await cache.lookup(namespace, "c'est quoi pythagore")
+    assert answer == "a² + b² = c²"
+    answer, _ = await cache.lookup(namespace, "Et le théorème de Thales ?")
+    assert answer is None
+    answer, _ = await cache.lookup(cache.namespace("history_teacher"), "c'est quoi pythagore")
+    assert answer is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["lookups"] == 4
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_and_are_bounded():
+    cache = SemanticCache(embeddings=KeywordEmbeddings(), ttl_seconds=60, max_entries=1)
+    namespace = cache.namespace(None)
+    _, pythagore = await cache.lookup(namespace, "pythagore")
+    _, fraction = await cache.lookup(namespace, "fraction")
+    cache.store(namespace, "pythagore", pythagore, "réponse 1")
+    cache.store(namespace, "fraction", fraction, "réponse 2")
+
+    assert cache.search(namespace, pythagore) is None
+    assert cache.search(namespace, fraction) == "réponse 2"
+
+    cache._namespaces[namespace].entries[0].created_at = time.monotonic() - 120
+    assert cache.search(namespace, fraction) is None
+    assert cache.stats()["expirations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rag_answers_are_dropped_when_the_corpus_changes():
+    embeddings = KeywordEmbeddings()
+    cache = SemanticCache(embeddings=embeddings)
+    mongo_service = MongoDBService(client=AsyncMongoMockClient(), embeddings=embeddings,
+                                   vector_index=LocalVectorIndex(), semantic_cache=cache)
+    _, vector = await cache.lookup(cache.namespace(None, use_rag=True), "pythagore")
+
+    for change in (
+        lambda: mongo_service.add_texts_to_vectorstore(["Le théorème de Pythagore"], {"file_id": "f1"}),
+        lambda: mongo_service.delete_documents({"metadata.file_id": "f1"}),
+        mongo_service.clear,
+    ):
+        cache.store(cache.namespace(None, use_rag=True), "pythagore", vector, "réponse du cours")
+        cache.store(cache.namespace(None), "pythagore", vector, "réponse libre")
+        await change()
+        assert cache.search(cache.namespace(None, use_rag=True), vector) is None
+        assert cache.search(cache.namespace(None), vector) == "réponse libre"
+
+
+@pytest.mark.asyncio
+async def test_rag_answers_survive_an_identical_reingestion():
+    embeddings = KeywordEmbeddings()
+    cache = SemanticCache(embeddings=embeddings)
+    mongo_service = MongoDBService(client=AsyncMongoMockClient(), embeddings=embeddings,
+                                   vector_index=LocalVectorIndex(), semantic_cache=cache)
+    await mongo_service.add_texts_to_vectorstore(["Le théorème de Pythagore"], {"file_id": "f1"})
+    _, vector = await cache.lookup(cache.namespace(None, use_rag=True), "pythagore")
+    cache.store(cache.namespace(None, use_rag=True), "pythagore", vector, "réponse du cours")
+
+    await mongo_service.add_texts_to_vectorstore(["Le théorème de Pythagore"], {"file_id": "f1"})
+    assert cache.search(cache.namespace(None, use_rag=True), vector) == "réponse du cours"
+    await mongo_service.add_texts_to_vectorstore(["Le théorème de Pythagore"], {"file_id": "f1", "subject": "maths"})
+    assert cache.search(cache.namespace(None, use_rag=True), vector) is None
@@ -0,0 +1,67 @@
+import time
+from services.session_cache import SessionCache
+from services.memory import InMemoryHistory
+
+
+def _msg(i):
+    return {"role": "user", "content": f"message {i}"}
+
+
+def test_lru_eviction_on_max_entries():
+    cache = SessionCache(max_entries=2, max_total_messages=100, ttl_seconds=60)
+    cache.set("a", InMemoryHistory(_msg(1)))
+    cache.set("b", InMemoryHistory(_msg(2)))
+    assert cache.get("a") is not None  # "a" devient la plus récente
+    cache.set("c", InMemoryHistory(_msg(3)))
+
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_max_total_messages_keeps_current_session():
+    cache = SessionCache(max_entries=10, max_total_messages=3, ttl_seconds=60)
+    cache.add_messages("a", [_msg(1), _msg(2)])
+    cache.add_messages("b", [_msg(3), _msg(4)])
+
+    assert "a" not in cache
+    assert cache.stats()["messages"] == 2
+
+    # Une seule session trop grande n'est pas évincée
+    cache.add_messages("b", [_msg(5), _msg(6)])
+    assert "b" in cache
+
+
+def test_ttl_expiration_and_counters():
+    cache = SessionCache(max_entries=10, max_total_messages=100, ttl_seconds=60)
+    cache.add_messages("a", [_msg(1)])
+    cache.add_messages("b", [_msg(2)])
+    cache._entries["a"].last_access = time.monotonic() - 120
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["expirations"] == 1
+
+
+def test_sweep_removes_inactive_sessions():
+    cache = SessionCache(max_entries=10, max_total_messages=100, ttl_seconds=60)
+    cache.add_messages("a", [_msg(1)])
+    cache.add_messages("b", [_msg(2)])
+    cache._entries["b"].last_access = time.monotonic() - 120
+
+    assert cache.sweep() == 1
+    assert len(cache) == 1
+    assert cache.stats()["messages"] == 1
+
+
+def test_per_session_window_is_trimmed():
+    cache = SessionCache(max_entries=10, max_total_messages=100, ttl_seconds=60,
+                         max_messages_per_session=3)
+    cache.add_messages("a", [_msg(i) for i in range(5)])
+    cache.add_messages("a", [_msg(5)])
+
+    assert [m["content"] for m in cache.get("a").messages] == ["message 3", "message 4", "message 5"]
+    assert cache.stats()["messages"] == 3
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+import pytest_asyncio
+from api.streaming import json_array
+
+
+@pytest_asyncio.fixture
+async def mongo_service(mongo_service):
+    start = datetime(2026, 1, 1)
+    # Deux sessions par date : la pagination doit départager les égalités sur updated_at
+    await mongo_service.conversations.insert_many([
+        {"session_id": f"s{i}", "updated_at": start + timedelta(hours=i // 2), "message_count": 0,
+         **({"teacher_id": "maths_teacher"} if i % 3 == 0 else {})}
+        for i in range(7)
+    ])
+    return mongo_service
+
+
+@pytest.mark.asyncio
+async def test_pages_follow_the_cursor_without_gaps(mongo_service):
+    sessions, cursor, pages = [], None, 0
+    while True:
+        page = await mongo_service.list_sessions(limit=3, cursor=cursor)
+        sessions += [session["session_id"] for session in page["sessions"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert sorted(sessions) == [f"s{i}" for i in range(7)] and len(set(sessions)) == 7
+    assert sessions[0] == "s6" and set(sessions[1:3]) == {"s4", "s5"}
+    assert sessions == await mongo_service.get_all_sessions()
+
+
+@pytest.mark.asyncio
+async def test_filters_and_invalid_cursor(mongo_service):
+    page = await mongo_service.list_sessions(teacher_id="maths_teacher")
+    assert {session["session_id"] for session in page["sessions"]} == {"s0", "s3", "s6"}
+    page = await mongo_service.list_sessions(updated_after=datetime(2026, 1, 1, 2))
+    assert {session["session_id"] for session in page["sessions"]} == {"s4", "s5", "s6"}
+    with pytest.raises(ValueError):
+        await mongo_service.list_sessions(cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_summary_comes_from_the_header(mongo_service):
+    await mongo_service.save_turn("s7", [
+        {"role": "user", "content": "Bonjour", "metadata": {"teacher_id": "french_teacher"}},
+        {"role": "assistant", "content": "Salut " * 100, "metadata": {"teacher_id": "french_teacher"}},
+    ], "t1")
+
+    session = (await mongo_service.list_sessions(limit=1, summary=True))["sessions"][0]
+    assert session["session_id"] == "s7" and session["message_count"] == 2
+    assert session["teacher_id"] == "french_teacher"
+    assert session["last_message"]["role"] == "assistant" and len(session["last_message"]["content"]) == 120
+    assert "messages" not in session
+
+    export = "".join([chunk async for chunk in json_array(mongo_service.iter_sessions(teacher_id="french_teacher"))])
+    assert [session["session_id"] for session in json.loads(export)] == ["s7"]
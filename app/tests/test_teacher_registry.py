@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from models.teacher import initial_teachers
+from services.context_window import TokenCounter
+from services.semantic_cache import SemanticCache
+from services.teacher_registry import TeacherRegistry
+
+
+class CountingCollection:
+    """Teachers collection counting the reads done by the registry"""
+    def __init__(self, collection):
+        self.collection = collection
+        self.reads = 0
+
+    def find(self, *args, **kwargs):
+        self.reads += 1
+        return self.collection.find(*args, **kwargs)
+
+    async def find_one(self, *args, **kwargs):
+        self.reads += 1
+        return await self.collection.find_one(*args, **kwargs)
+
+
+@pytest.fixture
+def teachers():
+    return AsyncMongoMockClient()["chatbot"]["teachers"]
+
+
+@pytest.mark.asyncio
+async def test_steady_state_does_no_database_read(teachers):
+    await teachers.insert_many([teacher.model_dump() for teacher in initial_teachers])
+    collection = CountingCollection(teachers)
+    registry = TeacherRegistry(collection, counter=TokenCounter())
+    await registry.load()
+    reads = collection.reads
+
+    for _ in range(3):
+        teacher = await registry.get("maths_teacher")
+        assert await registry.get("unknown_teacher") is None
+
+    assert teacher.system_message.content == initial_teachers[0].prompt_instructions
+    assert teacher.prompt_tokens == registry.counter.count_message(teacher.system_message)
+    # Une seule lecture pour l'identifiant inconnu, ensuite servi par le cache négatif
+    assert collection.reads == reads + 1
+    assert registry.stats()["negative_hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_reload_rebuilds_changed_teachers_and_drops_their_answers(teachers):
+    await teachers.insert_many([teacher.model_dump() for teacher in initial_teachers])
+    cache = SemanticCache()
+    for namespace in ("maths_teacher:chat", "french_teacher:chat"):
+        cache.store(namespace, "Question", np.ones(3, dtype=np.float32), "Réponse")
+    registry = TeacherRegistry(teachers, counter=TokenCounter(), semantic_cache=cache)
+    await registry.load()
+    assert await registry.get("new_teacher") is None
+    before = await registry.get("french_teacher")
+
+    await teachers.update_one({"teacher_id": "maths_teacher"}, {"$set": {"prompt_instructions": "Sois bref."}})
+    await teachers.insert_one({"teacher_id": "new_teacher", "name": "N", "subject": "S", "description": "D"})
+    assert await registry.load() == 1
+
+    assert (await registry.get("maths_teacher")).system_message.content == "Sois bref."
+    assert await registry.get("new_teacher") is not None
+    assert await registry.get("french_teacher") is before
+    assert cache.search("maths_teacher:chat", np.ones(3, dtype=np.float32)) is None
+    assert cache.search("french_teacher:chat", np.ones(3, dtype=np.float32)) == "Réponse"
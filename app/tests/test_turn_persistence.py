@@ -0,0 +1,176 @@
+import pytest
+from pymongo.errors import AutoReconnect
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from core.config import settings
+from models.teacher import initial_teachers
+from services.llm_serv import LLMService
+from services.message_buffer import MessageWriteBuffer
+from services.session_cache import SessionCache
+from conftest import turn
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage", ["embedded", "bucketed"])
+async def test_replayed_turn_is_saved_once(mongo_service, monkeypatch, storage):
+    monkeypatch.setattr(settings, "message_storage", storage)
+    assert await mongo_service.save_turn("s1", turn("Bonjour", "Salut"), "t1") is True
+    assert await mongo_service.save_turn("s1", turn("Bonjour", "Salut"), "t1") is False
+    assert await mongo_service.save_turn("s1", turn("Ça va ?", "Oui"), "t2") is True
+
+    history = await mongo_service.get_conversation_history("s1")
+    assert [m["content"] for m in history] == ["Bonjour", "Salut", "Ça va ?", "Oui"]
+    window = await mongo_service.get_conversation_window("s1")
+    assert window["message_count"] == 4
+
+
+@pytest.mark.asyncio
+async def test_chat_turn_costs_one_write(mongo_service, monkeypatch):
+    writes = []
+    update_one = mongo_service.conversations.update_one
+
+    async def counting(*args, **kwargs):
+        writes.append(args[0])
+        return await update_one(*args, **kwargs)
+
+    monkeypatch.setattr(mongo_service.conversations, "update_one", counting)
+    llm_service = LLMService(mongo_services=mongo_service, llm=FakeListChatModel(responses=["Réponse"]),
+                             conversation_store=SessionCache())
+    await mongo_service.seed_teachers(initial_teachers)
+    await mongo_service.create_conversation("s2")
+
+    await llm_service.generate_response("Question", session_id="s2", teacher_id="maths_teacher")
+
+    assert len(writes) == 1
+    history = await mongo_service.get_conversation_history("s2")
+    assert [m["role"] for m in history] == ["user", "assistant"]
+    assert history[0]["metadata"] == {"teacher_id": "maths_teacher"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("storage", ["embedded", "bucketed"])
+async def test_messages_trimmed_from_cache_are_summarized(mongo_service, monkeypatch, storage):
+    monkeypatch.setattr(settings, "message_storage", storage)
+    monkeypatch.setattr(settings, "context_summary_enabled", True)
+    llm_service = LLMService(mongo_services=mongo_service, llm=FakeListChatModel(responses=["Réponse courte"]),
+                             conversation_store=SessionCache.from_settings())
+    await mongo_service.seed_teachers(initial_teachers)
+    await mongo_service.create_conversation("s3")
+
+    # Messages courts : la fenêtre de contexte n'en écarte aucun, seul le cache les retire
+    for i in range(settings.history_window // 2 + 2):
+        await llm_service.generate_response(f"Question {i}", session_id="s3", teacher_id="maths_teacher")
+        await llm_service.flush_background_tasks()
+
+    window = await mongo_service.get_conversation_window("s3", limit=settings.history_window)
+    assert window["message_count"] == settings.history_window + 4
+    assert window["summary"]["text"] == "Réponse courte"
+    assert window["summary"]["covered"] == 2
+
+
+@pytest.mark.asyncio
+async def test_history_read_seeds_the_cache_with_positions_and_summary(mongo_service):
+    await mongo_service.create_conversation("s4")
+    for i in range(15):
+        await mongo_service.save_turn("s4", turn(f"Question {i}", f"Réponse {i}"), f"t{i}")
+    await mongo_service.save_conversation_summary("s4", "Résumé", 6)
+    llm_service = LLMService(mongo_services=mongo_service, llm=FakeListChatModel(responses=["Réponse"]),
+                             conversation_store=SessionCache.from_settings())
+
+    history = await llm_service.get_conversation_history("s4")
+
+    assert len(history) == 30
+    cached = llm_service.conversation_store.get("s4")
+    assert len(cached.messages) == settings.history_window
+    assert cached.first_seq == 30 - settings.history_window
+    assert (cached.summary, cached.summary_covered) == ("Résumé", 6)
+
+
+@pytest.mark.asyncio
+async def test_legacy_conversation_counter_is_backfilled(mongo_service):
+    legacy = [{"role": "user", "content": f"Message {i}"} for i in range(25)]
+    await mongo_service.conversations.insert_one({"session_id": "legacy", "messages": legacy})
+
+    window = await mongo_service.get_conversation_window("legacy", limit=settings.history_window)
+    assert len(window["messages"]) == settings.history_window
+    assert window["message_count"] == 25
+
+    assert await mongo_service.backfill_message_counts() == 1
+    await mongo_service.save_turn("legacy", turn("Bonjour", "Salut"), "t1")
+    window = await mongo_service.get_conversation_window("legacy", limit=settings.history_window)
+    assert window["message_count"] == 27
+
+
+def _fail_first_bucket_write(mongo_service, monkeypatch):
+    bulk_write = mongo_service.message_buckets.bulk_write
+    calls = []
+
+    async def flaky(operations, **kwargs):
+        calls.append(operations)
+        if len(calls) == 1:
+            raise AutoReconnect("connection lost")
+        return await bulk_write(operations, **kwargs)
+
+    monkeypatch.setattr(mongo_service.message_buckets, "bulk_write", flaky)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("buffered", [False, True])
+async def test_turn_is_saved_when_retried_after_a_bucket_write_failure(mongo_service, monkeypatch, buffered):
+    monkeypatch.setattr(settings, "message_storage", "bucketed")
+    if buffered:
+        mongo_service.write_buffer = MessageWriteBuffer(mongo_service, flush_interval_ms=1, retry_base_delay=0)
+    _fail_first_bucket_write(mongo_service, monkeypatch)
+
+    if buffered:
+        assert await mongo_service.save_turn("s5", turn("Bonjour", "Salut"), "t1") is True
+    else:
+        with pytest.raises(AutoReconnect):
+            await mongo_service.save_turn("s5", turn("Bonjour", "Salut"), "t1")
+        # Rejeu comme le fait _persist_turn : l'en-tête contient déjà t1, les buckets non
+        assert await mongo_service.save_turn("s5", turn("Bonjour", "Salut"), "t1") is True
+    assert await mongo_service.save_turn("s5", turn("Bonjour", "Salut"), "t1") is False
+
+    window = await mongo_service.get_conversation_window("s5")
+    assert [m["content"] for m in window["messages"]] == ["Bonjour", "Salut"]
+    assert window["message_count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_turn_goes_to_buckets_when_migrated_during_the_append(mongo_service, monkeypatch):
+    monkeypatch.setattr(settings, "message_storage", "bucketed")
+    await mongo_service.conversations.insert_one(
+        {"session_id": "s6", "messages": turn("Bonjour", "Salut"), "message_count": 2}
+    )
+    find_one_and_update = mongo_service.conversations.find_one_and_update
+    calls = []
+
+    async def migrated_after_reservation(*args, **kwargs):
+        calls.append(args)
+        header = await find_one_and_update(*args, **kwargs)
+        if len(calls) == 1:
+            await mongo_service.migrate_conversation_to_buckets("s6")
+        return header
+
+    monkeypatch.setattr(mongo_service.conversations, "find_one_and_update", migrated_after_reservation)
+    assert await mongo_service.save_turn("s6", turn("Ça va ?", "Oui"), "t1") is True
+
+    conversation = await mongo_service.conversations.find_one({"session_id": "s6"})
+    assert "messages" not in conversation and conversation["message_count"] == 4
+    history = await mongo_service.get_conversation_history("s6")
+    assert [m["content"] for m in history] == ["Bonjour", "Salut", "Ça va ?", "Oui"]
+
+
+@pytest.mark.asyncio
+async def test_migration_gives_up_when_messages_keep_arriving(mongo_service, monkeypatch):
+    await mongo_service.conversations.insert_one({"session_id": "s7", "messages": turn("Bonjour", "Salut")})
+    update_one = mongo_service.conversations.update_one
+
+    async def message_arrives_first(query, update, **kwargs):
+        await update_one({"session_id": "s7"}, {"$push": {"messages": {"role": "user", "content": "Encore"}}})
+        return await update_one(query, update, **kwargs)
+
+    monkeypatch.setattr(mongo_service.conversations, "update_one", message_arrives_first)
+    with pytest.raises(RuntimeError):
+        await mongo_service.migrate_conversation_to_buckets("s7", max_attempts=3)
+    conversation = await mongo_service.conversations.find_one({"session_id": "s7"})
+    assert "storage" not in conversation and len(conversation["messages"]) == 5
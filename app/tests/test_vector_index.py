@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from services.vector_index import LocalVectorIndex
+
+
+def _corpus(n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    payloads = [{"text": f"chunk {i}", "metadata": {"i": i}} for i in range(n)]
+    return list(range(n)), vectors, payloads
+
+
+def _brute_force(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:k])
+
+
+@pytest.mark.asyncio
+async def test_exact_top_k_matches_brute_force():
+    ids, vectors, payloads = _corpus()
+    index = LocalVectorIndex()
+    index.add(ids, vectors, payloads)
+
+    results = await index.search(vectors[7], k=5)
+    assert [r["metadata"]["i"] for r in results] == _brute_force(vectors, vectors[7], 5)
+    assert results[0]["text"] == "chunk 7"
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_removed_chunks_are_not_returned_and_compacted():
+    ids, vectors, payloads = _corpus(n=10)
+    index = LocalVectorIndex()
+    index.add(ids, vectors, payloads)
+    index.remove(range(6))
+
+    results = index.search_many([vectors[0], vectors[9]], k=10)
+    assert all(r["metadata"]["i"] >= 6 for batch in results for r in batch)
+    assert len(index) == 4
+    assert index.stats()["compactions"] == 1
+
+
+def test_ivf_search_finds_the_query_vector(tmp_path):
+    ids, vectors, payloads = _corpus(n=2000)
+    index = LocalVectorIndex(mmap_path=str(tmp_path / "vectors"), ivf_lists=16, ivf_nprobe=4, ivf_min_size=500)
+    index.add(ids, vectors, payloads)
+
+    assert index.stats()["ivf_lists"] == 16
+    assert index.search_many([vectors[123]], k=1)[0][0]["text"] == "chunk 123"
+    assert index.stats()["ivf_searches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_load_from_collection():
+    collection = AsyncMongoMockClient()["test"]["courses"]
+    ids, vectors, payloads = _corpus(n=5)
+    await collection.insert_many([
+        {"text": p["text"], "metadata": p["metadata"], "embedding": v.tolist()}
+        for p, v in zip(payloads, vectors)
+    ])
+
+    index = LocalVectorIndex()
+    assert await index.load(collection, batch_size=2) == 5
+    assert (await index.search(vectors[3], k=1))[0]["text"] == "chunk 3"
@@ -0,0 +1,56 @@
+"""
+Entraînement du modèle local de classification des intentions /smart
+(TF-IDF + régression logistique, nécessite scikit-learn).
+
+Les exemples viennent de la collection des intentions journalisées par analyze_intent.
+
+Usage :
+    cd app
+    python train_intent_model.py --min-examples 200
+    python train_intent_model.py --output intent_model.pkl
+
+Le modèle est chargé au démarrage depuis INTENT_MODEL_PATH.
+"""
+import argparse
+import asyncio
+from collections import Counter
+from dotenv import load_dotenv
+from core.config import settings
+from services.intent_classifier import IntentClassifier
+from services.mongo_services import MongoDBService
+
+
+async def train(output: str, min_examples: int = 100, limit: int = 0):
+    mongo_service = MongoDBService()
+    try:
+        cursor = mongo_service.intent_logs.find({}, {"message": 1, "intent": 1}).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        messages, intents = [], []
+        async for log in cursor:
+            if log.get("message") and log.get("intent"):
+                messages.append(log["message"])
+                intents.append(log["intent"])
+
+        counts = Counter(intents)
+        print(f"{len(messages)} exemples : {dict(counts)}")
+        if len(messages) < min_examples or len(counts) < 2:
+            print("Pas assez d'exemples pour entraîner le modèle")
+            return
+
+        classifier = IntentClassifier()
+        classifier.train(messages, intents, path=output)
+        print(f"✓ Modèle enregistré dans {output}")
+    finally:
+        await mongo_service.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Entraîne le classifieur d'intentions local")
+    parser.add_argument("--output", default=settings.intent_model_path, help="Fichier du modèle")
+    parser.add_argument("--min-examples", type=int, default=100, help="Nombre minimum d'exemples")
+    parser.add_argument("--limit", type=int, default=0, help="Nombre maximum d'exemples (les plus récents)")
+    args = parser.parse_args()
+    asyncio.run(train(output=args.output, min_examples=args.min_examples, limit=args.limit))